@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# 比较原 ORM 逐对象读取、_get_k_line_data 游标读取与 KLineRingBuffer 读取1分钟K线的耗时和内存：
+# python benchmarks/bench_k_line_read.py --contracts 10 --days 20
+# 使用临时 sqlite 数据库，只用于比较不同读取方式，不代表 MySQL 的绝对耗时
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy
+import pandas
+from sqlalchemy import and_
+from sqlalchemy import asc
+from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy.orm import scoped_session
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core')
+)
+
+import entries  # noqa: E402
+from buffers import KLineRingBuffer  # noqa: E402
+from entries import FutureKline1m  # noqa: E402
+
+
+# sqlite 不原生支持 DECIMAL
+warnings.filterwarnings('ignore', category=exc.SAWarning)
+
+# 一个交易日的1分钟K线数量
+_BARS_PER_DAY = 345
+
+
+def generate_k_line_data(contract_codes, days, seed=0):
+    # 多个合约若干交易日的1分钟K线，价格按最小变动价位随机游走
+    random = numpy.random.default_rng(seed)
+    trading_dates = pandas.bdate_range('2026-09-01', periods=days)
+    rows = []
+    for contract_code in contract_codes:
+        closes = 3500.0 + numpy.cumsum(
+            random.integers(-3, 4, days * _BARS_PER_DAY)
+        )
+        for day, trading_date in enumerate(trading_dates):
+            actual_times = pandas.date_range(
+                trading_date + pandas.Timedelta(hours=9, minutes=1),
+                periods=_BARS_PER_DAY,
+                freq='min'
+            )
+            for i, actual_time in enumerate(actual_times):
+                close = float(closes[day * _BARS_PER_DAY + i])
+                rows.append({
+                    'contract_code': contract_code,
+                    'actual_time': actual_time.to_pydatetime(),
+                    'trading_date': trading_date.date(),
+                    'open': close,
+                    'close': close,
+                    'high': close + 1.0,
+                    'low': close - 1.0,
+                    'volume': 100.0,
+                    'open_interest': 100000.0,
+                })
+    return rows
+
+
+def old_get_k_line_data(contract_code, start_date, end_date):
+    # 原实现：构建ORM对象，逐对象复制到各字段列表后构建 DataFrame
+    k_line_data = None
+
+    session = scoped_session(entries._session_factory)
+    try:
+        objs = session.query(FutureKline1m).filter(
+            and_(
+                FutureKline1m.contract_code == contract_code,
+                FutureKline1m.trading_date >= start_date,
+                FutureKline1m.trading_date <= end_date
+            )
+        ).order_by(
+            asc(FutureKline1m.contract_code),
+            asc(FutureKline1m.actual_time)
+        ).all()
+        if objs:
+            k_line_data = pandas.DataFrame(
+                data={
+                    column: [getattr(obj, column) for obj in objs]
+                    for column in entries._K_LINE_COLUMNS
+                },
+                index=range(len(objs))
+            )
+    finally:
+        session.close()
+
+    return k_line_data
+
+
+def measure(function, repeat):
+    # 返回多次运行的最短耗时和 tracemalloc 记录的内存峰值
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='k line read benchmark')
+    parser.add_argument('--contracts', type=int, default=10)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    contract_codes = ['C{:03d}2601'.format(i) for i in range(args.contracts)]
+    start_date = datetime.date(2026, 9, 1)
+    end_date = datetime.date(2026, 12, 31)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            'sqlite:///{}'.format(os.path.join(directory, 'k_line.db'))
+        )
+        entries._engine = engine
+        entries._session_factory.configure(bind=engine)
+        FutureKline1m.__table__.create(engine)
+        rows = generate_k_line_data(contract_codes, args.days)
+        with engine.begin() as connection:
+            connection.execute(FutureKline1m.__table__.insert(), rows)
+        print('{} contracts, {} 1m bars, best of {} runs.'.format(
+            args.contracts, len(rows), args.repeat
+        ))
+
+        # 与原实现读取的数据相同
+        expected = pandas.concat([
+            old_get_k_line_data(contract_code, start_date, end_date)
+            for contract_code in contract_codes
+        ], ignore_index=True)
+        actual = entries._get_k_line_data(
+            FutureKline1m, contract_codes, start_date, end_date
+        )
+        pandas.testing.assert_frame_equal(
+            actual.astype({'trading_date': 'datetime64[ns]'}),
+            expected.astype({
+                column: numpy.float64 for column in entries._K_LINE_COLUMNS[3:]
+            }).astype({
+                'actual_time': 'datetime64[ns]',
+                'trading_date': 'datetime64[ns]',
+            }),
+            check_dtype=False
+        )
+        print('_get_k_line_data output is identical to the old implementation.')
+
+        buffers = {}
+        for contract_code, k_line_data in entries._load_k_line_data_by_contract(
+                FutureKline1m, contract_codes, start_date, end_date, False,
+                entries._K_LINE_COLUMNS).items():
+            buffers[contract_code] = KLineRingBuffer(len(k_line_data))
+            buffers[contract_code].append(k_line_data)
+
+        cases = [
+            ('old, ORM per contract', lambda: [
+                old_get_k_line_data(contract_code, start_date, end_date)
+                for contract_code in contract_codes
+            ]),
+            ('new, cursor, all columns', lambda: entries._get_k_line_data(
+                FutureKline1m, contract_codes, start_date, end_date
+            )),
+            ('new, cursor, close only', lambda: entries._get_k_line_data(
+                FutureKline1m, contract_codes, start_date, end_date,
+                columns=['close']
+            )),
+            ('new, ring buffer, close only', lambda: [
+                buffer.to_dataframe(start_date, ['close'])
+                for buffer in buffers.values()
+            ]),
+        ]
+        for name, function in cases:
+            seconds, peak = measure(function, args.repeat)
+            print('  {:<30} {:>9.1f} ms {:>12,.0f} rows/s {:>9.1f} MiB peak'.format(
+                name, seconds * 1000, len(rows) / seconds, peak / 1024 / 1024
+            ))
+
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# 比较原逐合约 rolling 和条件判断与 MaStrategy 面板计算一个周期的耗时：
+# python benchmarks/bench_panel_signals.py --contracts 45 500
+
+import argparse
+import os
+import sys
+import time
+import numpy
+import pandas
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core')
+)
+
+from strategies import MaStrategy  # noqa: E402
+
+
+# 各K线类型一个周期读取的K线数量，与 K_LINE_DATA_SOURCES 的读取区间相当
+_K_LINE_SIZES = {
+    'k1d': 62,
+    'k15m': 460,
+    'k5m': 483,
+    'k3m': 345,
+    'k1m': 138,
+}
+
+# 原实现各K线类型计算的均线窗口，其余均线方向为 'X'
+_OLD_WINDOWS = {
+    'k1d': [5, 20, 60],
+    'k15m': [5, 20, 60, 120, 250],
+    'k5m': [5, 20, 60, 120, 250],
+    'k3m': [5, 20, 60, 120, 250],
+    'k1m': [5, 20, 60, 120, 250],
+}
+
+
+def generate_k_line_data(contract_count, seed=0):
+    # {K线类型: {合约代码: 收盘价数据}}，价格按最小变动价位随机游走
+    random = numpy.random.default_rng(seed)
+    contract_codes = ['C{:03d}2601'.format(i) for i in range(contract_count)]
+    return contract_codes, {
+        k_line_type: {
+            contract_code: pandas.DataFrame({
+                'close': 3500.0 + numpy.cumsum(random.integers(-5, 6, size))
+            })
+            for contract_code in contract_codes
+        }
+        for k_line_type, size in _K_LINE_SIZES.items()
+    }
+
+
+def old_strategy_for(contract_code, k_line_type, k_line_data):
+    # 原实现：对一个合约 rolling 计算各均线，取最后两个值逐条判断
+    k_line_data = k_line_data.copy()
+    windows = _OLD_WINDOWS[k_line_type]
+    for window in windows:
+        k_line_data['MA{}'.format(window)] = k_line_data['close'].rolling(
+            window
+        ).mean().round(decimals=5)
+    index_latest = k_line_data.index[-1]
+    index_before_last = k_line_data.index[-2]
+    latest = {
+        window: k_line_data['MA{}'.format(window)][index_latest]
+        for window in windows
+    }
+    before_last = {
+        window: k_line_data['MA{}'.format(window)][index_before_last]
+        for window in windows
+    }
+
+    transaction = 'UNKNOWN'
+    if latest[5] > latest[20] and latest[60] > before_last[60]:
+        transaction = 'BUY'
+    if (latest[5] > latest[20] and latest[5] > before_last[5]
+            and latest[20] > before_last[20]):
+        transaction = 'BUY'
+    if latest[5] < latest[20] and latest[60] < before_last[60]:
+        transaction = 'SELL'
+    if (latest[5] < latest[20] and latest[5] < before_last[5]
+            and latest[20] < before_last[20]):
+        transaction = 'SELL'
+
+    signal = {
+        'contract_code': contract_code,
+        'k_line_type': k_line_type,
+        'transaction': transaction,
+    }
+    for column, window in [('short_term_ma', 5), ('long_term_ma', 20),
+                           ('ma60', 60), ('ma120', 120), ('ma250', 250)]:
+        if window not in windows:
+            signal[column] = 'X'
+            continue
+        signal[column] = 'N'
+        if transaction == 'BUY' and latest[window] > before_last[window]:
+            signal[column] = 'Y'
+        if transaction == 'SELL' and latest[window] < before_last[window]:
+            signal[column] = 'Y'
+    return signal
+
+
+def old_cycle(contract_codes, k_line_data):
+    return [
+        old_strategy_for(contract_code, k_line_type, k_line_data[k_line_type][contract_code])
+        for k_line_type in _K_LINE_SIZES
+        for contract_code in contract_codes
+    ]
+
+
+def new_cycle(strategy, contract_codes):
+    signals = []
+    for k_line_type in _K_LINE_SIZES:
+        signals.extend(strategy.strategy_for(k_line_type, contract_codes))
+    return signals
+
+
+def best_of(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ma strategy panel benchmark')
+    parser.add_argument('--contracts', type=int, nargs='+', default=[45, 500])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('one cycle of all five k line types, K line I/O excluded, best of {} runs.'.format(
+        args.repeat
+    ))
+    for contract_count in args.contracts:
+        contract_codes, k_line_data = generate_k_line_data(contract_count)
+        strategy = MaStrategy('2026-10-16', contract_codes)
+        strategy.load_k_line_data = (
+            lambda k_line_type, codes: k_line_data[k_line_type]
+        )
+
+        # 与原实现的策略信号相同
+        assert new_cycle(strategy, contract_codes) == old_cycle(
+            contract_codes, k_line_data
+        )
+
+        old_seconds = best_of(
+            lambda: old_cycle(contract_codes, k_line_data), args.repeat
+        )
+        new_seconds = best_of(
+            lambda: new_cycle(strategy, contract_codes), args.repeat
+        )
+        print('  {:>4} contracts: scalar {:>8.1f} ms -> panel {:>7.1f} ms ({:.1f}x), signals identical.'.format(
+            contract_count,
+            old_seconds * 1000,
+            new_seconds * 1000,
+            old_seconds / new_seconds
+        ))
+
+
+if __name__ == '__main__':
+    main()
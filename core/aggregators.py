@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+import pandas
+from sessions import get_bar_end_time
+from sessions import get_contract_symbol
+
+
+class KLineAggregator(object):
+
+    '''
+        增量K线合成：逐根接收1分钟K线，更新各合约当前未完成的 minutes 分钟K线。
+        与 resample_k_line_data 相同，trading_sessions 为 {合约品种: 交易时段类型}，
+        有交易时段的合约按交易分钟数划分K线，其余合约按右边界标记、右边界闭合分组。
+        同一分钟的K线重复写入时覆盖此前的值，每根1分钟K线的合成耗时与当日已有K线数量无关。
+    '''
+
+    def __init__(self, minutes, trading_sessions=None):
+        self._minutes = minutes
+        self._trading_sessions = trading_sessions or {}
+        # {合约代码: 当前分组}
+        self._open = {}
+        # 上次 drain 后更新过的K线 {(合约代码, K线时间): K线}
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, contract_code):
+        with self._lock:
+            return contract_code in self._open
+
+    def update(self, dataframe):
+        # 返回本次写入后完成的K线，没有时返回 None
+        completed = []
+        with self._lock:
+            for row in dataframe.itertuples(index=False):
+                completed.extend(self._update(row))
+        if completed:
+            return pandas.DataFrame(completed)
+        return None
+
+    def drain(self):
+        # 返回上次 drain 后更新过的K线（包括未完成的K线），没有时返回 None
+        with self._lock:
+            bars = list(self._pending.values())
+            self._pending.clear()
+        if bars:
+            return pandas.DataFrame(bars)
+        return None
+
+    def _update(self, row):
+        actual_time = pandas.Timestamp(row.actual_time)
+        label = get_bar_end_time(
+            actual_time,
+            self._trading_sessions.get(get_contract_symbol(row.contract_code)),
+            self._minutes
+        )
+        group = self._open.get(row.contract_code)
+
+        completed = []
+        if group is not None and label < group['actual_time']:
+            # 已经结束的分组不再更新
+            return completed
+        if group is None or label > group['actual_time']:
+            if group is not None and not group['completed']:
+                completed.append(self._bar(row.contract_code, group))
+            group = {
+                'actual_time': label,
+                'trading_date': row.trading_date,
+                'minutes': {},
+                'completed': False
+            }
+            self._open[row.contract_code] = group
+
+        group['minutes'][actual_time] = (
+            row.open, row.close, row.high, row.low, row.volume,
+            row.open_interest
+        )
+        bar = self._bar(row.contract_code, group)
+        self._pending[(row.contract_code, label)] = bar
+        if actual_time == label and not group['completed']:
+            # 分组的最后一分钟已经到达
+            group['completed'] = True
+            completed.append(bar)
+
+        return completed
+
+    def _bar(self, contract_code, group):
+        minutes = group['minutes']
+        first = minutes[min(minutes)]
+        last = minutes[max(minutes)]
+        return {
+            'contract_code': contract_code,
+            'actual_time': group['actual_time'],
+            'trading_date': group['trading_date'],
+            'open': first[0],
+            'close': last[1],
+            'high': max(values[2] for values in minutes.values()),
+            'low': min(values[3] for values in minutes.values()),
+            'volume': sum(values[4] for values in minutes.values()),
+            'open_interest': last[5]
+        }
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import itertools
+import math
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+import os
+import re
+import sys
+import time
+import logging
+import numpy
+import pandas
+from entries import BasisTradingDateViewManager
+from entries import FutureContractSymbolManager
+from entries import FutureMainContractManager
+from indicators import get_moving_average_series
+from sessions import get_contract_symbol
+from strategies import MaStrategy
+from strategies import TransactionType
+
+
+logger = logging.getLogger('strategies')
+
+
+def _parse_number(value):
+    # 最小变动价位、交易单位保存为带单位的字符串，例如 '1元/吨'、'10吨/手'，取开头的数值
+    match = re.match(r'\s*([0-9]+(?:\.[0-9]+)?)', value or '')
+    if match is None:
+        return math.nan
+    return float(match.group(1))
+
+
+class MaBacktest(object):
+
+    '''
+        均线策略回测：读取日期区间内已保存的K线，对每根K线按实时计算的规则得到策略信号。
+        持仓跟随交易方向（多 +1 手、空 -1 手、不明时空仓），按K线收盘价成交，
+        只在日期区间与合约主力期间的交集内持仓，最后一根K线平仓。
+        均线、信号、持仓和盈亏都对所有合约拼接后的数组计算，不逐根K线循环。
+    '''
+
+    # 可以回测的K线类型。k3m、k1m 的实时计算读取5分钟K线（见 MaStrategy.K_LINE_DATA_SOURCES），
+    # 回测结果实际是5分钟K线的结果，数据来源改为对应频率之前不回测
+    K_LINE_TYPES = ['k1d', 'k15m', 'k5m']
+
+    # 统计数据字段
+    STATISTICS_COLUMNS = [
+        'contract_code',
+        'k_line_type',
+        'bars',
+        'long_bars',
+        'short_bars',
+        'trades',
+        'wins',
+        'win_rate',
+        'pnl_ticks',
+        'pnl',
+        'max_drawdown',
+    ]
+
+    def __init__(
+            self, start_date, end_date, k_line_ma_types=None,
+            slippage_ticks=0):
+        self.start_date = start_date
+        self.end_date = end_date
+        # 每次开仓、平仓的滑点（最小变动价位数）
+        self.slippage_ticks = slippage_ticks
+        # {合约代码: (主力开始日期, 主力结束日期)}
+        self.main_contracts = FutureMainContractManager.get_main_contracts_by_date_range(
+            start_date, end_date
+        )
+        self.strategy = MaStrategy(
+            end_date, list(self.main_contracts.keys()), k_line_ma_types
+        )
+        # {合约品种: (最小变动价位, 交易单位)}
+        self.contract_specifications = {
+            contract_symbol: (_parse_number(tick_size),
+                              _parse_number(trading_units))
+            for contract_symbol, (tick_size, trading_units) in (
+                FutureContractSymbolManager.get_contract_specifications().items())
+        }
+
+    def run(self, k_line_types=None):
+        # 返回 (信号数据, 统计数据)，信号数据为区间内每根K线的策略信号、持仓和盈亏
+        signals_list = []
+        statistics_list = []
+        for k_line_type in k_line_types or MaBacktest.K_LINE_TYPES:
+            manager, days = MaStrategy.K_LINE_DATA_SOURCES[k_line_type]
+            if k_line_type not in MaBacktest.K_LINE_TYPES:
+                logger.warning(
+                    '[MaBacktest] {} k line data is read from {}, skipped.'.format(
+                        k_line_type, manager.__name__
+                    )
+                )
+                continue
+            # 向前多读取的K线用于计算区间开始时的均线
+            start_date = BasisTradingDateViewManager.get_previous_trading_date(
+                self.start_date, days
+            )
+            k_line_data = manager.get_k_line_data_by_trading_date(
+                list(self.main_contracts.keys()),
+                start_date,
+                self.end_date,
+                columns=['actual_time', 'trading_date', 'close'],
+                as_dict=True,
+                cache=False
+            )
+
+            calendar = BasisTradingDateViewManager.get_trading_dates(
+                start_date, self.end_date
+            )
+
+            start = time.perf_counter()
+            signals, statistics = self.backtest(
+                k_line_type, k_line_data, calendar
+            )
+            if signals is None:
+                continue
+            logger.info(
+                '[MaBacktest] {}: {} contracts, {} bars, {:.3f}s.'.format(
+                    k_line_type,
+                    len(statistics.index),
+                    len(signals.index),
+                    time.perf_counter() - start
+                )
+            )
+            signals_list.append(signals)
+            statistics_list.append(statistics)
+
+        if not signals_list:
+            return None, None
+        return (
+            pandas.concat(signals_list, ignore_index=True),
+            pandas.concat(statistics_list, ignore_index=True)
+        )
+
+    def backtest(self, k_line_type, k_line_data, calendar):
+        # k_line_data 为 {合约代码: K线数据}，需包括 actual_time、trading_date、close 字段，
+        # calendar 为K线数据日期范围内升序排列的交易日期
+        bars = self.prepare(k_line_type, k_line_data, calendar)
+        if bars is None:
+            return None, None
+
+        # 与实时计算相同保留5位小数
+        ma_types = self.strategy.k_line_ma_types[k_line_type]
+        ma_series = get_moving_average_series(
+            bars['closes'], bars['firsts'],
+            [ma_type.value for ma_type in ma_types]
+        )
+        moving_averages = {
+            ma_type: (
+                numpy.round(ma_series[ma_type.value][0], 5),
+                numpy.round(ma_series[ma_type.value][1], 5)
+            )
+            for ma_type in ma_types
+        }
+        signals = MaStrategy.evaluate_signals(k_line_type, moving_averages)
+
+        directions = numpy.select(
+            [signals['transaction'] == TransactionType.BUY.value,
+             signals['transaction'] == TransactionType.SELL.value],
+            [1, -1],
+            0
+        )
+        positions, amounts, statistics = _simulate(
+            bars, directions, self.slippage_ticks
+        )
+        statistics = pandas.DataFrame(dict(
+            statistics,
+            contract_code=bars['contract_codes'],
+            k_line_type=k_line_type
+        ), columns=MaBacktest.STATISTICS_COLUMNS)
+
+        active = bars['active']
+        signals.update({
+            'position': positions,
+            'pnl': amounts,
+        })
+        signals = pandas.DataFrame({
+            'contract_code': numpy.array(
+                bars['contract_codes'], dtype=object
+            )[bars['contract_ids'][active]],
+            'k_line_type': k_line_type,
+            'actual_time': bars['actual_times'][active],
+            'trading_date': bars['trading_dates'][active],
+            'close': bars['closes'][active],
+            **{
+                column: values[active] if isinstance(
+                    values, numpy.ndarray) else values
+                for column, values in signals.items()
+            }
+        })
+
+        return signals, statistics
+
+    def prepare(self, k_line_type, k_line_data, calendar):
+        '''
+            把各合约的K线按合约、时间顺序拼接为数组，返回 {名称: 数组}，没有K线数据时返回 None。
+            firsts 为每根K线计算均线时可以使用的第一根K线的位置，active 为是否在持仓区间内，
+            tick_sizes、trading_units 按合约排列，其余数组按K线排列。
+        '''
+        contract_codes = [
+            contract_code for contract_code in self.main_contracts
+            if k_line_data.get(contract_code) is not None
+        ]
+        if not contract_codes:
+            return None
+
+        frames = [k_line_data[contract_code] for contract_code in contract_codes]
+        lengths = numpy.array([len(frame.index) for frame in frames])
+        group_starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        contract_ids = numpy.repeat(numpy.arange(len(contract_codes)), lengths)
+        closes = numpy.concatenate([
+            frame['close'].to_numpy(dtype=numpy.float64) for frame in frames
+        ])
+        actual_times = numpy.concatenate([
+            pandas.to_datetime(frame['actual_time'], cache=False).values
+            for frame in frames
+        ])
+        trading_dates = numpy.concatenate([
+            pandas.to_datetime(frame['trading_date'], cache=False).values
+            for frame in frames
+        ])
+        starts = numpy.zeros(len(closes), dtype=bool)
+        starts[group_starts] = True
+
+        # 与实时计算相同，每个交易日的均线只使用向前 days 个交易日以来的K线
+        calendar = numpy.array(calendar, dtype='datetime64[D]')
+        date_indexes = numpy.searchsorted(
+            calendar, trading_dates.astype('datetime64[D]')
+        )
+        lookback_dates = calendar[numpy.maximum(
+            date_indexes - MaStrategy.K_LINE_DATA_SOURCES[k_line_type][1], 0
+        )]
+        # 按 (合约, 交易日期) 查找每根K线可以使用的第一根K线
+        keys = contract_ids * 1000000 + trading_dates.astype(
+            'datetime64[D]').astype(numpy.int64)
+        firsts = numpy.searchsorted(
+            keys,
+            contract_ids * 1000000 + lookback_dates.astype(numpy.int64),
+            side='left'
+        )
+
+        # 持仓区间：日期区间与主力期间的交集
+        period_starts = numpy.array([
+            max(self.start_date, str(self.main_contracts[contract_code][0]))
+            for contract_code in contract_codes
+        ], dtype='datetime64[ns]')
+        period_ends = numpy.array([
+            min(self.end_date, str(self.main_contracts[contract_code][1]))
+            for contract_code in contract_codes
+        ], dtype='datetime64[ns]')
+        active = (
+            (trading_dates >= period_starts[contract_ids])
+            & (trading_dates <= period_ends[contract_ids])
+        )
+
+        tick_sizes, trading_units = numpy.array([
+            self.contract_specifications.get(
+                get_contract_symbol(contract_code), (math.nan, math.nan)
+            )
+            for contract_code in contract_codes
+        ], dtype=numpy.float64).reshape(-1, 2).T
+
+        return {
+            'contract_codes': contract_codes,
+            'contract_ids': contract_ids,
+            'starts': starts,
+            'closes': closes,
+            'actual_times': actual_times,
+            'trading_dates': trading_dates,
+            'firsts': firsts,
+            'active': active,
+            'tick_sizes': tick_sizes,
+            'trading_units': trading_units,
+        }
+
+
+def _simulate(bars, directions, slippage_ticks=0):
+    '''
+        按交易方向（1 多、-1 空、0 不明）计算持仓和盈亏，bars 为 MaBacktest.prepare 返回的数组。
+        返回 (每根K线的持仓, 每根K线的盈亏金额, {统计字段: 按合约排列的数组})。
+    '''
+    contract_ids = bars['contract_ids']
+    starts = bars['starts']
+    closes = bars['closes']
+    active = bars['active']
+    tick_sizes = bars['tick_sizes']
+    trading_units = bars['trading_units']
+    contract_count = len(tick_sizes)
+
+    positions = numpy.where(active, directions, 0)
+    # 每个合约持仓区间的最后一根K线平仓
+    active_positions = numpy.flatnonzero(active)
+    positions[active_positions[numpy.append(
+        contract_ids[active_positions][1:]
+        != contract_ids[active_positions][:-1],
+        True
+    )]] = 0
+    previous_positions = numpy.roll(positions, 1)
+    previous_positions[starts] = 0
+
+    # 每根K线的盈亏（价格点数，1手）：上一根K线收盘时的持仓乘以收盘价变化，再扣除换手的滑点
+    price_changes = closes - numpy.roll(closes, 1)
+    price_changes[starts] = 0.0
+    gross = previous_positions * price_changes
+    net = gross
+    if slippage_ticks:
+        net = gross - numpy.abs(positions - previous_positions) * (
+            slippage_ticks * tick_sizes[contract_ids]
+        )
+    amounts = net * trading_units[contract_ids]
+
+    # 每次开仓为一笔交易，交易盈亏为持仓期间的盈亏减去开仓、平仓两次滑点
+    entries = (positions != 0) & (positions != previous_positions)
+    trade_ids = numpy.cumsum(entries) - 1
+    held = previous_positions != 0
+    trade_contract_ids = contract_ids[entries]
+    trade_pnl = numpy.bincount(
+        numpy.roll(trade_ids, 1)[held],
+        weights=gross[held],
+        minlength=len(trade_contract_ids)
+    )
+    if slippage_ticks:
+        trade_pnl = trade_pnl - 2 * slippage_ticks * tick_sizes[
+            trade_contract_ids
+        ]
+
+    trades = numpy.bincount(trade_contract_ids, minlength=contract_count)
+    wins = numpy.bincount(
+        trade_contract_ids[trade_pnl > 0], minlength=contract_count
+    )
+    equity = pandas.Series(amounts).groupby(contract_ids).cumsum()
+    drawdowns = numpy.maximum(
+        equity.groupby(contract_ids).cummax().to_numpy(), 0.0
+    ) - equity.to_numpy()
+    statistics = {
+        'bars': numpy.bincount(
+            contract_ids, weights=active, minlength=contract_count
+        ).astype(numpy.int64),
+        'long_bars': numpy.bincount(
+            contract_ids, weights=positions > 0, minlength=contract_count
+        ).astype(numpy.int64),
+        'short_bars': numpy.bincount(
+            contract_ids, weights=positions < 0, minlength=contract_count
+        ).astype(numpy.int64),
+        'trades': trades,
+        'wins': wins,
+        'win_rate': numpy.divide(
+            wins, trades,
+            out=numpy.full(contract_count, math.nan),
+            where=trades > 0
+        ),
+        'pnl_ticks': numpy.bincount(
+            contract_ids, weights=net, minlength=contract_count
+        ) / tick_sizes,
+        'pnl': numpy.bincount(
+            contract_ids, weights=amounts, minlength=contract_count
+        ),
+        'max_drawdown': pandas.Series(drawdowns).groupby(
+            contract_ids
+        ).max().reindex(range(contract_count)).to_numpy(),
+    }
+
+    return positions, amounts, statistics
+
+
+# 参数扫描子进程中附加的共享内存和K线数组
+_sweep_shared_memories = None
+_sweep_bars = None
+
+
+def _share_arrays(arrays):
+    # 把数组复制到共享内存，返回 (共享内存列表, {名称: (共享内存名称, 形状, 类型)})
+    shared_memories = []
+    descriptors = {}
+    for name, array in arrays.items():
+        shared_memory = multiprocessing.shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1)
+        )
+        numpy.ndarray(
+            array.shape, dtype=array.dtype, buffer=shared_memory.buf
+        )[...] = array
+        shared_memories.append(shared_memory)
+        descriptors[name] = (shared_memory.name, array.shape, array.dtype.str)
+    return shared_memories, descriptors
+
+
+def _attach_shared_memory(name):
+    '''
+        只附加不登记到资源跟踪进程，共享内存由创建它的父进程释放。
+        子进程登记后，子进程使用自己的资源跟踪进程时会在退出时报告泄漏并再次删除；
+        与父进程共用资源跟踪进程时，在子进程中 unregister 又会删除父进程的登记。
+    '''
+    if sys.version_info >= (3, 13):
+        return multiprocessing.shared_memory.SharedMemory(
+            name=name, track=False
+        )
+    register = multiprocessing.resource_tracker.register
+    multiprocessing.resource_tracker.register = lambda name, rtype: None
+    try:
+        return multiprocessing.shared_memory.SharedMemory(name=name)
+    finally:
+        multiprocessing.resource_tracker.register = register
+
+
+def _attach_sweep_bars(descriptors):
+    # 子进程初始化：按描述附加共享内存，K线数组不复制
+    global _sweep_shared_memories, _sweep_bars
+    _sweep_shared_memories = []
+    _sweep_bars = {}
+    for name, (shared_memory_name, shape, dtype) in descriptors.items():
+        shared_memory = _attach_shared_memory(shared_memory_name)
+        _sweep_shared_memories.append(shared_memory)
+        _sweep_bars[name] = numpy.ndarray(
+            shape, dtype=numpy.dtype(dtype), buffer=shared_memory.buf
+        )
+
+
+def _sweep_moving_average(window):
+    # 由共享内存中的均线最新值得到 (最新值, 前一值)，前一值为同一合约上一根K线的最新值
+    latest = _sweep_bars['ma{}'.format(window)]
+    before_last = numpy.empty_like(latest)
+    before_last[0] = math.nan
+    before_last[1:] = latest[:-1]
+    before_last[
+        numpy.arange(len(latest)) - window < _sweep_bars['firsts']
+    ] = math.nan
+    return latest, before_last
+
+
+def _sweep_combination(combination):
+    # 在子进程中回测一组 (短期均线, 长期均线, 趋势均线) 参数，返回所有合约的合计
+    short_term, long_term, trend, slippage_ticks = combination
+    start = time.perf_counter()
+    buy, sell = MaStrategy.evaluate_transactions(
+        _sweep_moving_average(short_term),
+        _sweep_moving_average(long_term),
+        _sweep_moving_average(trend)
+    )
+    positions, amounts, statistics = _simulate(
+        _sweep_bars, numpy.where(sell, -1, numpy.where(buy, 1, 0)),
+        slippage_ticks
+    )
+    trades = int(statistics['trades'].sum())
+    wins = int(statistics['wins'].sum())
+    return {
+        'short_term_ma': short_term,
+        'long_term_ma': long_term,
+        'trend_ma': trend,
+        'trades': trades,
+        'wins': wins,
+        'win_rate': wins / trades if trades > 0 else math.nan,
+        'pnl': numpy.nansum(statistics['pnl']),
+        'max_drawdown': numpy.nanmax(statistics['max_drawdown']),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+class MaParameterSweep(object):
+
+    '''
+        均线策略参数扫描：对 (短期均线, 长期均线, 趋势均线) 的所有组合回测一种K线类型，
+        趋势均线即默认规则中的MA60。K线只读取一次，各窗口的均线计算一次，
+        都放入共享内存，由进程池按组合并行回测，子进程不复制K线数据。
+        结果按盈亏从高到低排名。
+    '''
+
+    # 结果字段
+    RESULT_COLUMNS = [
+        'rank',
+        'short_term_ma',
+        'long_term_ma',
+        'trend_ma',
+        'trades',
+        'wins',
+        'win_rate',
+        'pnl',
+        'max_drawdown',
+    ]
+
+    def __init__(
+            self, start_date, end_date, k_line_type, short_term_windows,
+            long_term_windows, trend_windows, slippage_ticks=0,
+            processes=None, top=10):
+        if k_line_type not in MaBacktest.K_LINE_TYPES:
+            raise ValueError(
+                '{} k line data is read from {}, k line type must be one of {}.'.format(
+                    k_line_type,
+                    MaStrategy.K_LINE_DATA_SOURCES[k_line_type][0].__name__,
+                    MaBacktest.K_LINE_TYPES
+                )
+            )
+        self.backtest = MaBacktest(
+            start_date, end_date, slippage_ticks=slippage_ticks
+        )
+        self.k_line_type = k_line_type
+        # 短期均线不短于长期均线的组合不回测
+        self.combinations = [
+            (short_term, long_term, trend, slippage_ticks)
+            for short_term, long_term, trend in itertools.product(
+                sorted(set(short_term_windows)),
+                sorted(set(long_term_windows)),
+                sorted(set(trend_windows))
+            )
+            if short_term < long_term
+        ]
+        self.processes = processes or os.cpu_count()
+        # 日志中输出的排名数量
+        self.top = top
+
+    def run(self):
+        # 返回排名后的结果，没有K线数据或没有参数组合时返回 None
+        if not self.combinations:
+            return None
+        manager, days = MaStrategy.K_LINE_DATA_SOURCES[self.k_line_type]
+        start_date = BasisTradingDateViewManager.get_previous_trading_date(
+            self.backtest.start_date, days
+        )
+        k_line_data = manager.get_k_line_data_by_trading_date(
+            list(self.backtest.main_contracts.keys()),
+            start_date,
+            self.backtest.end_date,
+            columns=['actual_time', 'trading_date', 'close'],
+            as_dict=True,
+            cache=False
+        )
+        calendar = BasisTradingDateViewManager.get_trading_dates(
+            start_date, self.backtest.end_date
+        )
+        bars = self.backtest.prepare(self.k_line_type, k_line_data, calendar)
+        if bars is None:
+            return None
+
+        start = time.perf_counter()
+        arrays = {
+            name: bars[name]
+            for name in ['contract_ids', 'starts', 'closes', 'firsts',
+                         'active', 'tick_sizes', 'trading_units']
+        }
+        # 与实时计算相同保留5位小数，前一值由子进程从最新值得到
+        windows = sorted(set(
+            window
+            for combination in self.combinations
+            for window in combination[0:3]
+        ))
+        for window, (latest, before_last) in get_moving_average_series(
+                bars['closes'], bars['firsts'], windows).items():
+            arrays['ma{}'.format(window)] = numpy.round(latest, 5)
+
+        shared_memories, descriptors = _share_arrays(arrays)
+        del arrays
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    initializer=_attach_sweep_bars,
+                    initargs=(descriptors,)) as executor:
+                results = list(
+                    executor.map(_sweep_combination, self.combinations)
+                )
+        finally:
+            for shared_memory in shared_memories:
+                shared_memory.close()
+                shared_memory.unlink()
+
+        logger.info(
+            '[MaParameterSweep] {}: {} bars, {} combinations, {} processes, {:.3f}s (combinations {:.3f}s).'.format(
+                self.k_line_type,
+                len(bars['closes']),
+                len(results),
+                self.processes,
+                time.perf_counter() - start,
+                sum(result['seconds'] for result in results)
+            )
+        )
+
+        results = pandas.DataFrame(results).sort_values(
+            ['pnl', 'win_rate'], ascending=False, ignore_index=True
+        )
+        results['rank'] = numpy.arange(1, len(results.index) + 1)
+        for result in results.head(self.top).itertuples(index=False):
+            logger.info(
+                '[MaParameterSweep] {} #{}: MA{}/MA{}/MA{}, {} trades, win rate {:.2%}, pnl {:.2f}, max drawdown {:.2f}.'.format(
+                    self.k_line_type,
+                    result.rank,
+                    result.short_term_ma,
+                    result.long_term_ma,
+                    result.trend_ma,
+                    result.trades,
+                    result.win_rate if result.trades > 0 else 0,
+                    result.pnl,
+                    result.max_drawdown
+                )
+            )
+        return results[MaParameterSweep.RESULT_COLUMNS]
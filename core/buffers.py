@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import numpy
+import pandas
+
+
+class KLineRingBuffer(object):
+
+    '''
+        K线环形缓冲区：以定长 numpy 数组保存一个合约一种频率最近 capacity 根K线。
+        写入K线的时间与最后一根K线相同时覆盖最后一根，早于最后一根的K线忽略。
+    '''
+
+    COLUMNS = ['open', 'close', 'high', 'low', 'volume', 'open_interest']
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._actual_time = numpy.zeros(capacity, dtype='datetime64[ns]')
+        self._trading_date = numpy.zeros(capacity, dtype='datetime64[ns]')
+        self._values = numpy.zeros(
+            (capacity, len(KLineRingBuffer.COLUMNS)), dtype=numpy.float64
+        )
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, dataframe):
+        # dataframe 需按 actual_time 升序排列
+        actual_times = pandas.to_datetime(dataframe['actual_time']).values
+        trading_dates = pandas.to_datetime(dataframe['trading_date']).values
+        values = dataframe.reindex(
+            columns=KLineRingBuffer.COLUMNS
+        ).to_numpy(dtype=numpy.float64)
+
+        if self._size == 0:
+            # 缓冲区为空时直接复制最后 capacity 根K线
+            count = min(len(actual_times), self._capacity)
+            self._actual_time[0:count] = actual_times[-count:]
+            self._trading_date[0:count] = trading_dates[-count:]
+            self._values[0:count] = values[-count:]
+            self._start = 0
+            self._size = count
+            return
+
+        last = (self._start + self._size - 1) % self._capacity
+        for i in range(len(actual_times)):
+            if actual_times[i] < self._actual_time[last]:
+                continue
+            if actual_times[i] > self._actual_time[last]:
+                if self._size < self._capacity:
+                    last = (self._start + self._size) % self._capacity
+                    self._size += 1
+                else:
+                    last = self._start
+                    self._start = (self._start + 1) % self._capacity
+            self._actual_time[last] = actual_times[i]
+            self._trading_date[last] = trading_dates[i]
+            self._values[last] = values[i]
+
+    def to_dataframe(self, start_date=None, columns=None):
+        # 按时间顺序返回交易日期不早于 start_date 的K线数据，没有数据时返回 None
+        positions = (
+            self._start + numpy.arange(self._size)
+        ) % self._capacity
+        if start_date is not None:
+            positions = positions[
+                self._trading_date[positions] >= numpy.datetime64(start_date)
+            ]
+        if len(positions) == 0:
+            return None
+
+        if columns is None:
+            columns = ['actual_time', 'trading_date'] + KLineRingBuffer.COLUMNS
+        data = {}
+        for column in columns:
+            if column == 'actual_time':
+                data[column] = self._actual_time[positions]
+            elif column == 'trading_date':
+                data[column] = self._trading_date[positions]
+            else:
+                data[column] = self._values[
+                    positions, KLineRingBuffer.COLUMNS.index(column)
+                ]
+
+        return pandas.DataFrame(data, columns=columns)
+
+
+class KLineBufferStore(object):
+
+    '''
+        按 (合约代码, K线数据管理类) 保存K线环形缓冲区。
+        实时计算开始时从数据库预热一次，之后只追加实时获取和生成的K线。
+    '''
+
+    def __init__(self):
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def warm(self, manager, contract_codes, start_date, end_date, capacity):
+        k_line_data = manager.get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, as_dict=True
+        )
+        with self._lock:
+            for contract_code in contract_codes:
+                buffer = KLineRingBuffer(capacity)
+                if contract_code in k_line_data:
+                    buffer.append(k_line_data[contract_code])
+                self._buffers[(contract_code, manager)] = buffer
+
+    def append(self, manager, dataframe):
+        with self._lock:
+            for contract_code, k_line_data in dataframe.groupby(
+                    'contract_code'):
+                buffer = self._buffers.get((contract_code, manager))
+                if buffer is not None:
+                    buffer.append(k_line_data.sort_values('actual_time'))
+
+    def get_k_line_data(
+            self, manager, contract_codes, start_date=None, columns=None):
+        # 返回 {合约代码: 数据}，columns 为空时返回全部字段
+        k_line_data = {}
+        with self._lock:
+            for contract_code in contract_codes:
+                buffer = self._buffers.get((contract_code, manager))
+                if buffer is None:
+                    continue
+                dataframe = buffer.to_dataframe(start_date, columns)
+                if dataframe is not None:
+                    if columns is None:
+                        dataframe.insert(0, 'contract_code', contract_code)
+                    k_line_data[contract_code] = dataframe
+        return k_line_data
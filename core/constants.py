@@ -16,6 +16,43 @@ DB_CONNECT_URL = 'mysql+pymysql://{2}:{3}@{0}:{1}/{4}'.format(
     _DATABASE
 )
 
+# K线数据批量写入的每批行数
+K_LINE_STORE_BATCH_SIZE = 1000
+# K线数据读取时每次从游标获取的行数
+K_LINE_FETCH_SIZE = 5000
+# K线数据缓存的内存上限（字节）
+K_LINE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 进程内交易日历的有效期（秒），过期后重新读取，长时间运行的进程也能看到其他进程写入的交易日数据
+TRADING_CALENDAR_TTL = 3600
+
+# 异步写入队列配置
+
+WRITE_BEHIND_QUEUE_SIZE = 1000
+WRITE_BEHIND_FLUSH_SIZE = 100
+WRITE_BEHIND_FLUSH_INTERVAL = 1.0
+# 写入失败后保留重试的最大行数，超过时丢弃最早的数据
+WRITE_BEHIND_RETRY_ROWS = 200000
+
+# K线数据分区配置
+
+# 提前建立分区的天数
+K_LINE_PARTITION_DAYS_AHEAD = 62
+# K线数据和均线策略信号历史保留天数，None 表示永久保留
+K_LINE_RETENTION_DAYS = {
+    't_future_k_line_1d': None,
+    't_future_k_line_1m': 400,
+    't_future_k_line_3m': 800,
+    't_future_k_line_5m': 800,
+    't_future_k_line_15m': None,
+    't_future_ma_strategy_history': None,
+}
+
+
+# 策略计算配置
+
+# 批量计算的默认进程数，1 表示在当前进程中顺序计算；并行计算通过 --extras processes=N 指定
+STRATEGY_BATCH_PROCESSES = 1
+
 
 # 金融市场相关
 
@@ -88,3 +125,70 @@ FUTURE_MARKET_CLOSING_TIME = '15:00:00'
 #     # 'TF',  # 五债
 #     # 'T',  # 十债
 # ]
+
+# 期货交易时段：交易时段类型 -> 交易单元列表，每个交易单元由若干交易时间段组成。
+# K线按交易分钟数划分，不跨越交易单元（夜盘、日盘），可以跨越交易单元内的休息时间。
+FUTURE_TRADING_SESSIONS = {
+    'DAY': [
+        [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    ],
+    'NIGHT_2300': [
+        [('21:00', '23:00')],
+        [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    ],
+    'NIGHT_0100': [
+        [('21:00', '01:00')],
+        [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    ],
+    'NIGHT_0230': [
+        [('21:00', '02:30')],
+        [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    ],
+}
+
+# 合约品种默认的交易时段类型，用于初始化 t_future_contract_symbol.trading_session
+FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS = {
+    'C': 'NIGHT_2300',
+    'A': 'NIGHT_2300',
+    'M': 'NIGHT_2300',
+    'RM': 'NIGHT_2300',
+    'Y': 'NIGHT_2300',
+    'OI': 'NIGHT_2300',
+    'P': 'NIGHT_2300',
+    'SR': 'NIGHT_2300',
+    'CF': 'NIGHT_2300',
+    'JD': 'DAY',
+    'AP': 'DAY',
+    'ZC': 'NIGHT_2300',
+    'JM': 'NIGHT_2300',
+    'J': 'NIGHT_2300',
+    'I': 'NIGHT_2300',
+    'SM': 'DAY',
+    'SF': 'DAY',
+    'RB': 'NIGHT_2300',
+    'HC': 'NIGHT_2300',
+    'SS': 'NIGHT_0100',
+    'NI': 'NIGHT_0100',
+    'CU': 'NIGHT_0100',
+    'AL': 'NIGHT_0100',
+    'ZN': 'NIGHT_0100',
+    'AU': 'NIGHT_0230',
+    'AG': 'NIGHT_0230',
+    'SC': 'NIGHT_0230',
+    'BU': 'NIGHT_2300',
+    'FU': 'NIGHT_2300',
+    'LU': 'NIGHT_2300',
+    'PG': 'NIGHT_2300',
+    'MA': 'NIGHT_2300',
+    'EG': 'NIGHT_2300',
+    'TA': 'NIGHT_2300',
+    'PF': 'NIGHT_2300',
+    'EB': 'NIGHT_2300',
+    'L': 'NIGHT_2300',
+    'V': 'NIGHT_2300',
+    'PP': 'NIGHT_2300',
+    'RU': 'NIGHT_2300',
+    'SA': 'NIGHT_2300',
+    'FG': 'NIGHT_2300',
+    'SP': 'NIGHT_2300',
+}
@@ -1,40 +1,473 @@
 # -*- coding: utf-8 -*-
 
+import bisect
+import collections
 import datetime
 import json
+import threading
+import time
 import requests
 import rqdatac
+import numpy
 import pandas
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column
+from sqlalchemy import BigInteger
 from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import DECIMAL
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import Text
 from sqlalchemy import PrimaryKeyConstraint
 from sqlalchemy import UniqueConstraint
 from sqlalchemy import Index
 from sqlalchemy import and_
 from sqlalchemy import asc
-from sqlalchemy import desc
+from sqlalchemy import text
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert
 from constants import DB_CONNECT_URL
+from constants import K_LINE_STORE_BATCH_SIZE
+from constants import K_LINE_FETCH_SIZE
+from constants import K_LINE_CACHE_MAX_BYTES
+from constants import TRADING_CALENDAR_TTL
+from utils import createdate_list
+from resamplers import resample_k_line_data
+
+
+def _create_engine():
+    return create_engine(
+        DB_CONNECT_URL,
+        pool_pre_ping=True,
+        pool_size=20,
+        pool_recycle=3600,
+        pool_timeout=15
+    )
 
 
-_engine = create_engine(
-    DB_CONNECT_URL,
-    pool_pre_ping=True,
-    pool_size=20,
-    pool_recycle=3600,
-    pool_timeout=15
-)
+_engine = _create_engine()
 _session_factory = sessionmaker(bind=_engine)
 
 _baseObject = declarative_base()
 
+# K线数据字段
+_K_LINE_COLUMNS = [
+    'contract_code',
+    'actual_time',
+    'trading_date',
+    'open',
+    'close',
+    'high',
+    'low',
+    'volume',
+    'open_interest'
+]
+
+
+def _upsert_statement(entity, rows, update_columns):
+    statement = insert(entity.__table__).values(rows)
+    return statement.on_duplicate_key_update(
+        {column: statement.inserted[column] for column in update_columns}
+    )
+
+
+def _bulk_upsert(entity, rows, update_columns, batch_size):
+    # 按批次生成 INSERT ... ON DUPLICATE KEY UPDATE 语句，返回写入行数
+    count = 0
+
+    if not rows:
+        return count
+
+    session = scoped_session(_session_factory)
+    try:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            session.execute(_upsert_statement(entity, batch, update_columns))
+            count += len(batch)
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    return count
+
+
+# K线数据增量写入的高水位：{表名: {合约代码: 最近写入的K线时间}}
+_k_line_high_water_marks = {}
+_k_line_high_water_marks_lock = threading.Lock()
+
+
+def _store_k_line_data(entity, dataframe, batch_size, incremental=False):
+    table_name = entity.__tablename__
+    if incremental:
+        # 只写入高水位及之后的K线，高水位所在K线可能仍未走完，需要重新写入
+        with _k_line_high_water_marks_lock:
+            marks = dict(_k_line_high_water_marks.get(table_name, {}))
+        if marks:
+            mark_series = pandas.to_datetime(
+                dataframe['contract_code'].map(marks)
+            )
+            dataframe = dataframe[
+                mark_series.isnull().values
+                | (pandas.to_datetime(dataframe['actual_time'])
+                   >= mark_series).values
+            ]
+
+    # 主键包括 trading_date，K线的唯一标识仍为 (contract_code, actual_time)：
+    # 交易日期由K线时间决定，写入前必须已确定，修改同一根K线的交易日期不会覆盖原有数据
+    rows = []
+    for row in dataframe[_K_LINE_COLUMNS].itertuples(index=False):
+        rows.append({
+            'contract_code': row.contract_code,
+            'actual_time': row.actual_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'trading_date': row.trading_date.strftime('%Y-%m-%d'),
+            'open': float(row.open),
+            'close': float(row.close),
+            'high': float(row.high),
+            'low': float(row.low),
+            'volume': float(row.volume),
+            'open_interest': float(row.open_interest)
+        })
+
+    count = _bulk_upsert(entity, rows, _K_LINE_COLUMNS[3:], batch_size)
+
+    if count > 0:
+        trading_dates = pandas.to_datetime(
+            dataframe['trading_date']
+        ).dt.strftime('%Y-%m-%d')
+        for contract_code, dates in trading_dates.groupby(
+                dataframe['contract_code']):
+            _k_line_data_cache.invalidate(
+                table_name, contract_code, sorted(set(dates))
+            )
+
+        latest = pandas.to_datetime(dataframe['actual_time']).groupby(
+            dataframe['contract_code']
+        ).max()
+        with _k_line_high_water_marks_lock:
+            marks = _k_line_high_water_marks.setdefault(table_name, {})
+            for contract_code, actual_time in latest.items():
+                if (contract_code not in marks
+                        or actual_time > marks[contract_code]):
+                    marks[contract_code] = actual_time
+
+    return count
+
+
+def _next_month(date):
+    if date.month == 12:
+        return datetime.date(date.year + 1, 1, 1)
+    return datetime.date(date.year, date.month + 1, 1)
+
+
+def _month_starts(start_date, end_date):
+    # 返回 [start_date, end_date] 覆盖的每个月的第一天
+    months = []
+    month = datetime.date(start_date.year, start_date.month, 1)
+    while month <= end_date:
+        months.append(month)
+        month = _next_month(month)
+
+    return months
+
+
+def _get_k_line_data(
+        entity, contract_codes, start_date, end_date, exact=False,
+        columns=None):
+    # 不构建ORM对象，游标结果按批直接写入列数组，columns 指定需要读取的字段
+    # 默认返回 float64 和 datetime64 列，exact 为真时价格等字段保留 Decimal
+    k_line_data = None
+
+    if columns is None:
+        columns = _K_LINE_COLUMNS
+    table = entity.__table__
+    statement = select(
+        *[table.c[column] for column in columns]
+    ).where(
+        and_(
+            table.c.contract_code.in_(contract_codes),
+            table.c.trading_date >= start_date,
+            table.c.trading_date <= end_date
+        )
+    ).order_by(
+        asc(table.c.contract_code),
+        asc(table.c.trading_date),
+        asc(table.c.actual_time)
+    )
+
+    session = scoped_session(_session_factory)
+    try:
+        result = session.execute(
+            statement.execution_options(stream_results=True)
+        )
+        chunks = {column: [] for column in columns}
+        count = 0
+        while True:
+            rows = result.fetchmany(K_LINE_FETCH_SIZE)
+            if not rows:
+                break
+            count += len(rows)
+            for column, values in zip(columns, zip(*rows)):
+                if column in _K_LINE_COLUMNS[3:] and not exact:
+                    values = numpy.array(values, dtype=numpy.float64)
+                chunks[column].append(values)
+        if count > 0:
+            k_line_data_dict = {}
+            for column in columns:
+                if column in _K_LINE_COLUMNS[3:] and not exact:
+                    k_line_data_dict[column] = numpy.concatenate(
+                        chunks[column]
+                    )
+                else:
+                    values = []
+                    for chunk in chunks[column]:
+                        values.extend(chunk)
+                    if column in ['actual_time', 'trading_date']:
+                        values = pandas.to_datetime(values)
+                    k_line_data_dict[column] = values
+            k_line_data = pandas.DataFrame(
+                data=k_line_data_dict,
+                index=range(count)
+            )
+    finally:
+        session.close()
+
+    return k_line_data
+
+
+def _load_k_line_data_by_contract(
+        entity, contract_codes, start_date, end_date, exact, columns):
+    # 一次查询多个合约的K线数据，按合约拆分为 {合约代码: 数据}
+    k_line_data_dict = {}
+
+    query_columns = list(columns)
+    if 'contract_code' not in query_columns:
+        query_columns.insert(0, 'contract_code')
+    k_line_data = _get_k_line_data(
+        entity, contract_codes, start_date, end_date, exact, query_columns
+    )
+    if k_line_data is not None:
+        # 查询结果按合约代码排序，按合约代码变化的位置切分
+        contract_code_values = k_line_data['contract_code'].values
+        boundaries = numpy.flatnonzero(
+            contract_code_values[1:] != contract_code_values[:-1]
+        ) + 1
+        starts = [0] + boundaries.tolist()
+        ends = boundaries.tolist() + [len(k_line_data)]
+        for start, end in zip(starts, ends):
+            k_line_data_dict[contract_code_values[start]] = k_line_data.iloc[
+                start:end
+            ][columns].reset_index(drop=True)
+
+    return k_line_data_dict
+
+
+def _date_string(value):
+    if isinstance(value, str):
+        return value[0:10]
+    return value.strftime('%Y-%m-%d')
+
+
+class _KLineDataCache(object):
+
+    '''
+        K线数据缓存：按 (表名, 合约代码, 开始日期, 结束日期, 字段, 是否精确) 缓存查询结果，
+        按最近最少使用淘汰，缓存数据的总内存不超过 max_bytes。
+        写入K线数据时使与写入交易日期有交集的缓存失效，并增加该合约的版本号，
+        查询前后版本号不一致的结果不放入缓存。
+    '''
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._keys = {}
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                dataframe = self._entries[key][0]
+                if dataframe is not None:
+                    dataframe = dataframe.copy()
+                return True, dataframe
+            self._stats['misses'] += 1
+        return False, None
+
+    def generation(self, table_name, contract_code):
+        with self._lock:
+            return self._generations.get((table_name, contract_code), 0)
+
+    def put(self, key, dataframe, generation):
+        size = 0
+        if dataframe is not None:
+            size = int(dataframe.memory_usage(deep=True).sum())
+            dataframe = dataframe.copy()
+        if size > self._max_bytes:
+            return
+
+        with self._lock:
+            if self._generations.get(key[0:2], 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (dataframe, size)
+            self._keys.setdefault(key[0:2], set()).add(key)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate(self, table_name, contract_code, trading_dates):
+        # trading_dates 为已排序的交易日期字符串列表
+        with self._lock:
+            self._generations[(table_name, contract_code)] = (
+                self._generations.get((table_name, contract_code), 0) + 1
+            )
+            for key in list(self._keys.get((table_name, contract_code), ())):
+                index = bisect.bisect_left(trading_dates, key[2])
+                if (index < len(trading_dates)
+                        and trading_dates[index] <= key[3]):
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        return stats
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+        self._keys[key[0:2]].discard(key)
+
+
+_k_line_data_cache = _KLineDataCache(K_LINE_CACHE_MAX_BYTES)
+
+
+def _get_current_trading_date():
+    # 不晚于今天的最后一个交易日。夜盘K线的交易日期为下一交易日，晚于今天，
+    # 因此不能按自然日判断；这个交易日及之后的K线仍可能写入
+    today = datetime.date.today().strftime('%Y-%m-%d')
+    return _trading_calendar.get_latest_trading_date(today) or today
+
+
+def _get_cached_k_line_data(
+        entity, contract_codes, start_date, end_date, exact, columns):
+    # 返回 {合约代码: 数据}，缓存未命中的合约合并为一次查询
+    table_name = entity.__tablename__
+    start_date = _date_string(start_date)
+    end_date = _date_string(end_date)
+    if columns is None:
+        columns = _K_LINE_COLUMNS
+    columns = tuple(columns)
+
+    # 历史交易日的数据不会再变化，当前交易日及之后的数据单独缓存，写入时只有这部分失效
+    ranges = [(start_date, end_date)]
+    current_date = _get_current_trading_date()
+    if start_date < current_date <= end_date:
+        previous_date = (
+            datetime.datetime.strptime(current_date, '%Y-%m-%d')
+            + datetime.timedelta(days=-1)
+        ).strftime('%Y-%m-%d')
+        ranges = [(start_date, previous_date), (current_date, end_date)]
+
+    pieces = {contract_code: [] for contract_code in contract_codes}
+    for range_start, range_end in ranges:
+        missing = []
+        for contract_code in contract_codes:
+            found, dataframe = _k_line_data_cache.get(
+                (table_name, contract_code, range_start, range_end,
+                 columns, exact)
+            )
+            if found:
+                pieces[contract_code].append(dataframe)
+            else:
+                missing.append(contract_code)
+        if missing:
+            generations = {
+                contract_code: _k_line_data_cache.generation(
+                    table_name, contract_code
+                )
+                for contract_code in missing
+            }
+            k_line_data_dict = _load_k_line_data_by_contract(
+                entity, missing, range_start, range_end, exact, list(columns)
+            )
+            for contract_code in missing:
+                dataframe = k_line_data_dict.get(contract_code)
+                _k_line_data_cache.put(
+                    (table_name, contract_code, range_start, range_end,
+                     columns, exact),
+                    dataframe,
+                    generations[contract_code]
+                )
+                pieces[contract_code].append(dataframe)
+
+    k_line_data_dict = {}
+    for contract_code, dataframes in pieces.items():
+        dataframes = [
+            dataframe for dataframe in dataframes if dataframe is not None
+        ]
+        if len(dataframes) == 1:
+            k_line_data_dict[contract_code] = dataframes[0]
+        elif len(dataframes) > 1:
+            k_line_data_dict[contract_code] = pandas.concat(
+                dataframes, ignore_index=True
+            )
+
+    return k_line_data_dict
+
+
+def _get_k_line_data_by_contract(
+        entity, contract_codes, start_date, end_date, exact=False,
+        columns=None, as_dict=False, cache=True):
+    # as_dict 为真时返回 {合约代码: 数据}，否则按合约代码顺序合并为一个数据表
+    # 回测、校验等大批量读取时 cache 为假，直接查询，不占用也不淘汰实时计算使用的缓存
+    if cache:
+        k_line_data_dict = _get_cached_k_line_data(
+            entity, contract_codes, start_date, end_date, exact, columns
+        )
+    else:
+        k_line_data_dict = _load_k_line_data_by_contract(
+            entity, contract_codes, start_date, end_date, exact,
+            columns or _K_LINE_COLUMNS
+        )
+    if as_dict:
+        return k_line_data_dict
+
+    if not k_line_data_dict:
+        return None
+    return pandas.concat(
+        [k_line_data_dict[contract_code]
+         for contract_code in sorted(k_line_data_dict.keys())],
+        ignore_index=True
+    )
+
 
 # 基础数据
 
@@ -99,12 +532,32 @@ class BasisCalendarManager(object):
                 obj.is_trading = is_trading
             session.merge(obj)
             session.commit()
+            _trading_calendar.refresh()
         except BaseException:
             session.rollback()
             raise
         finally:
             session.close()
 
+    @staticmethod
+    def store_all(start_date, end_date, trading_dates):
+        # 一次写入日期区间内的所有自然日，交易日为'Y'，非交易日为'N'
+        trading_dates = set(trading_dates)
+        rows = []
+        for date_name in createdate_list(start_date, end_date):
+            rows.append({
+                'date_name': date_name,
+                'year_name': date_name[0:4],
+                'month_name': date_name[5:7],
+                'is_trading': 'Y' if date_name in trading_dates else 'N'
+            })
+
+        count = _bulk_upsert(
+            BasisCalendar, rows, ['is_trading'], max(len(rows), 1)
+        )
+        _trading_calendar.refresh()
+        return count
+
 
 class BasisTradingDateView(_baseObject):
 
@@ -133,83 +586,100 @@ class BasisTradingDateView(_baseObject):
     )
 
 
-class BasisTradingDateViewManager(object):
+class _TradingCalendar(object):
 
-    @staticmethod
-    def get_trading_dates(start_date, end_date):
-        trading_dates = []
+    '''
+        进程内交易日历：第一次使用时从 v_basic_trading_date 读取全部交易日，按日期升序保存。
+        日期偏移和区间查询在内存中用 bisect 完成，结果与按条件查询视图相同。
+        写入日历数据后调用 refresh，下次使用时重新读取；由其他进程写入时，超过 ttl 秒后重新读取。
+    '''
 
+    def __init__(self, ttl=TRADING_CALENDAR_TTL):
+        self._ttl = ttl
+        self._dates = None
+        self._loaded_time = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            self._dates = None
+
+    def get_trading_dates(self, start_date, end_date):
+        dates = self._get_dates()
+        return dates[
+            bisect.bisect_left(dates, _date_string(start_date)):
+            bisect.bisect_right(dates, _date_string(end_date))
+        ]
+
+    def get_previous_trading_date(self, date, n):
+        # 早于 date 的第 n 个交易日，不足 n 个时为最早的交易日
+        dates = self._get_dates()
+        index = bisect.bisect_left(dates, _date_string(date))
+        if n < 1 or index == 0:
+            return None
+        return dates[max(index - n, 0)]
+
+    def get_next_trading_date(self, date, n):
+        # 晚于 date 的第 n 个交易日，不足 n 个时为最晚的交易日
+        dates = self._get_dates()
+        index = bisect.bisect_right(dates, _date_string(date))
+        if n < 1 or index == len(dates):
+            return None
+        return dates[min(index + n - 1, len(dates) - 1)]
+
+    def get_latest_trading_date(self, date):
+        # 不晚于 date 的最后一个交易日
+        dates = self._get_dates()
+        index = bisect.bisect_right(dates, _date_string(date))
+        if index == 0:
+            return None
+        return dates[index - 1]
+
+    def _get_dates(self):
+        with self._lock:
+            if (self._dates is None
+                    or time.monotonic() - self._loaded_time >= self._ttl):
+                self._dates = self._load()
+                self._loaded_time = time.monotonic()
+            return self._dates
+
+    def _load(self):
         session = scoped_session(_session_factory)
         try:
-            objs = session.query(BasisTradingDateView).filter(
-                and_(
-                    BasisTradingDateView.date_name >= start_date,
-                    BasisTradingDateView.date_name <= end_date
-                )
-            ).order_by(
+            objs = session.query(BasisTradingDateView.date_name).order_by(
                 asc(BasisTradingDateView.date_name)
             ).all()
-            for obj in objs:
-                trading_dates.append(obj.date_name)
+            return [obj.date_name for obj in objs]
         finally:
             session.close()
 
-        return trading_dates
 
-    @staticmethod
-    def get_previous_trading_date(date, n):
-        previous_trading_date = None
+_trading_calendar = _TradingCalendar()
 
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(BasisTradingDateView).filter(
-                BasisTradingDateView.date_name < date
-            ).order_by(
-                desc(BasisTradingDateView.date_name)
-            ).limit(n).all()
-            if objs:
-                previous_trading_date = objs[-1].date_name
-        finally:
-            session.close()
 
-        return previous_trading_date
+class BasisTradingDateViewManager(object):
 
     @staticmethod
-    def get_next_trading_date(date, n):
-        next_trading_date = None
+    def get_trading_dates(start_date, end_date):
+        return _trading_calendar.get_trading_dates(start_date, end_date)
 
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(BasisTradingDateView).filter(
-                BasisTradingDateView.date_name > date
-            ).order_by(
-                asc(BasisTradingDateView.date_name)
-            ).limit(n).all()
-            if objs:
-                next_trading_date = objs[-1].date_name
-        finally:
-            session.close()
+    @staticmethod
+    def get_previous_trading_date(date, n):
+        return _trading_calendar.get_previous_trading_date(date, n)
 
-        return next_trading_date
+    @staticmethod
+    def get_next_trading_date(date, n):
+        return _trading_calendar.get_next_trading_date(date, n)
 
     @staticmethod
     def get_latest_trading_date():
-        latest_trading_date = None
-
-        session = scoped_session(_session_factory)
-        try:
-            today = datetime.date.today().strftime('%Y-%m-%d')
-            obj = session.query(BasisTradingDateView).filter(
-                BasisTradingDateView.date_name <= today
-            ).order_by(
-                desc(BasisTradingDateView.date_name)
-            ).limit(1).first()
-            if obj is not None:
-                latest_trading_date = obj.date_name
-        finally:
-            session.close()
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        return _trading_calendar.get_latest_trading_date(today)
 
-        return latest_trading_date
+    @staticmethod
+    def refresh():
+        # 交易日数据写入后重新读取进程内交易日历
+        _trading_calendar.refresh()
 
 
 # 基金数据
@@ -291,6 +761,7 @@ class FutureContractSymbol(_baseObject):
              symbol_name     VARCHAR(10) NOT NULL,
              tick_size       VARCHAR(20) NOT NULL,
              trading_units   VARCHAR(20) NOT NULL,
+             trading_session VARCHAR(20),
              display_order   INT(10) NOT NULL,
              CONSTRAINT pk_future_contract_symbol PRIMARY KEY (contract_symbol)
           )
@@ -303,6 +774,8 @@ class FutureContractSymbol(_baseObject):
     symbol_name = Column(String(10), nullable=False)
     tick_size = Column(String(20), nullable=False)
     trading_units = Column(String(20), nullable=False)
+    # 由迁移版本 3 添加，延迟加载使迁移前查询合约品种的作业不受影响
+    trading_session = deferred(Column(String(20)))
     display_order = Column(Integer, nullable=False)
 
     __table_args__ = (
@@ -331,6 +804,49 @@ class FutureContractSymbolManager(object):
 
         return contract_symbols
 
+    @staticmethod
+    def get_trading_sessions():
+        # 返回 {合约品种: 交易时段类型}，未设置交易时段的合约品种不返回
+        # 尚未执行迁移版本 3 时返回空字典，K线按自然时间划分
+        trading_sessions = {}
+
+        if not SchemaMigrationManager.column_exists(
+                FutureContractSymbol.__tablename__, 'trading_session'):
+            return trading_sessions
+
+        session = scoped_session(_session_factory)
+        try:
+            rows = session.query(
+                FutureContractSymbol.contract_symbol,
+                FutureContractSymbol.trading_session
+            ).filter(
+                FutureContractSymbol.trading_session.isnot(None)
+            ).all()
+            for row in rows:
+                trading_sessions[row[0]] = row[1]
+        finally:
+            session.close()
+
+        return trading_sessions
+
+    @staticmethod
+    def get_contract_specifications():
+        # 返回 {合约品种: (最小变动价位, 交易单位)}，保存的原始字符串
+        contract_specifications = {}
+
+        session = scoped_session(_session_factory)
+        try:
+            objs = session.query(FutureContractSymbol).all()
+            for obj in objs:
+                contract_specifications[obj.contract_symbol] = (
+                    obj.tick_size,
+                    obj.trading_units
+                )
+        finally:
+            session.close()
+
+        return contract_specifications
+
 
 class FutureMainContract(_baseObject):
 
@@ -413,6 +929,31 @@ class FutureMainContractManager(object):
 
         return main_contracts
 
+    @staticmethod
+    def get_main_contracts_by_date_range(start_date, end_date):
+        # 返回 {合约代码: (开始日期, 结束日期)}，主力期间与日期区间有交集的合约
+        main_contracts = {}
+
+        session = scoped_session(_session_factory)
+        try:
+            objs = session.query(FutureMainContract).filter(
+                and_(
+                    FutureMainContract.start_date <= end_date,
+                    FutureMainContract.end_date >= start_date
+                )
+            ).order_by(
+                asc(FutureMainContract.contract_code)
+            ).all()
+            for obj in objs:
+                main_contracts[obj.contract_code] = (
+                    obj.start_date,
+                    obj.end_date
+                )
+        finally:
+            session.close()
+
+        return main_contracts
+
     @staticmethod
     def get_main_contracts_by_switch_date(trading_date):
         main_contracts = []
@@ -508,10 +1049,13 @@ class FutureKline1d(_baseObject):
              low           DECIMAL(20, 5) NOT NULL,
              volume        DECIMAL(20, 5) NOT NULL,
              open_interest DECIMAL(20, 5) NOT NULL,
-             CONSTRAINT pk_future_k_line_1d PRIMARY KEY (contract_code, actual_time),
-             INDEX idx_future_k_line_1d (trading_date)
+             CONSTRAINT pk_future_k_line_1d PRIMARY KEY (contract_code, trading_date, actual_time)
           )
-        ENGINE=innodb DEFAULT CHARSET=utf8;
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
     '''
 
     __tablename__ = 't_future_k_line_1d'
@@ -529,13 +1073,10 @@ class FutureKline1d(_baseObject):
     __table_args__ = (
         PrimaryKeyConstraint(
             'contract_code',
+            'trading_date',
             'actual_time',
             name='pk_future_k_line_1d'
         ),
-        Index(
-            'idx_future_k_line_1d',
-            'trading_date'
-        ),
     )
 
 
@@ -572,106 +1113,28 @@ class FutureKline1dManager(object):
         return k_line_data
 
     @staticmethod
-    def store(dataframe):
-        session = scoped_session(_session_factory)
-        try:
-            for row in dataframe.itertuples():
-                session.merge(
-                    FutureKline1d(
-                        contract_code=getattr(
-                            row, 'contract_code'
-                        ),
-                        actual_time=getattr(
-                            row, 'actual_time'
-                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                        trading_date=getattr(
-                            row, 'trading_date'
-                        ).strftime('%Y-%m-%d'),
-                        open=getattr(
-                            row, 'open'
-                        ),
-                        close=getattr(
-                            row, 'close'
-                        ),
-                        high=getattr(
-                            row, 'high'
-                        ),
-                        low=getattr(
-                            row, 'low'
-                        ),
-                        volume=getattr(
-                            row, 'volume'
-                        ),
-                        open_interest=getattr(
-                            row, 'open_interest'
-                        )
-                    )
-                )
-            session.commit()
-        except BaseException:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+    def store(dataframe, batch_size=K_LINE_STORE_BATCH_SIZE,
+              incremental=False):
+        return _store_k_line_data(
+            FutureKline1d, dataframe, batch_size, incremental
+        )
 
     @staticmethod
     def get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, end_date):
-        k_line_data = None
-
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(FutureKline1d).filter(
-                and_(
-                    FutureKline1d.contract_code == contract_code,
-                    FutureKline1d.trading_date >= start_date,
-                    FutureKline1d.trading_date <= end_date
-                )
-            ).order_by(
-                asc(FutureKline1d.contract_code),
-                asc(FutureKline1d.actual_time)
-            ).all()
-            if objs:
-                index_list = []
-                contract_code_list = []
-                actual_time_list = []
-                trading_date_list = []
-                open_list = []
-                close_list = []
-                high_list = []
-                low_list = []
-                volume_list = []
-                open_interest_list = []
-                for i in range(len(objs)):
-                    index_list.append(i)
-                    contract_code_list.append(objs[i].contract_code)
-                    actual_time_list.append(objs[i].actual_time)
-                    trading_date_list.append(objs[i].trading_date)
-                    open_list.append(objs[i].open)
-                    close_list.append(objs[i].close)
-                    high_list.append(objs[i].high)
-                    low_list.append(objs[i].low)
-                    volume_list.append(objs[i].volume)
-                    open_interest_list.append(objs[i].open_interest)
-                k_line_data_dict = {
-                    'contract_code': contract_code_list,
-                    'actual_time': actual_time_list,
-                    'trading_date': trading_date_list,
-                    'open': open_list,
-                    'close': close_list,
-                    'high': high_list,
-                    'low': low_list,
-                    'volume': volume_list,
-                    'open_interest': open_interest_list,
-                }
-                k_line_data = pandas.DataFrame(
-                    data=k_line_data_dict,
-                    index=index_list
-                )
-        finally:
-            session.close()
+            contract_code, start_date, end_date, exact=False, columns=None):
+        return _get_cached_k_line_data(
+            FutureKline1d, [contract_code], start_date, end_date, exact,
+            columns
+        ).get(contract_code)
 
-        return k_line_data
+    @staticmethod
+    def get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, exact=False, columns=None,
+            as_dict=False, cache=True):
+        return _get_k_line_data_by_contract(
+            FutureKline1d, contract_codes, start_date, end_date, exact,
+            columns, as_dict, cache
+        )
 
 
 class FutureKline1m(_baseObject):
@@ -688,10 +1151,13 @@ class FutureKline1m(_baseObject):
              low           DECIMAL(20, 5) NOT NULL,
              volume        DECIMAL(20, 5) NOT NULL,
              open_interest DECIMAL(20, 5) NOT NULL,
-             CONSTRAINT pk_future_k_line_1m PRIMARY KEY (contract_code, actual_time),
-             INDEX idx_future_k_line_1m (trading_date)
+             CONSTRAINT pk_future_k_line_1m PRIMARY KEY (contract_code, trading_date, actual_time)
           )
-        ENGINE=innodb DEFAULT CHARSET=utf8;
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
 
     '''
 
@@ -710,13 +1176,10 @@ class FutureKline1m(_baseObject):
     __table_args__ = (
         PrimaryKeyConstraint(
             'contract_code',
+            'trading_date',
             'actual_time',
             name='pk_future_k_line_1m'
         ),
-        Index(
-            'idx_future_k_line_1m',
-            'trading_date'
-        ),
     )
 
 
@@ -752,6 +1215,27 @@ class FutureKline1mManager(object):
 
         return k_line_data
 
+    @staticmethod
+    def generate_and_store_k_line_data(
+            dataframe, trading_sessions=None,
+            batch_size=K_LINE_STORE_BATCH_SIZE):
+        # 由多个合约的1分钟K线一次合成3分钟、5分钟、15分钟K线并批量写入，返回 {频率: 写入行数}
+        k_line_data = resample_k_line_data(
+            dataframe, ['3m', '5m', '15m'], trading_sessions
+        )
+        counts = {}
+        for frequency, entity in [
+                ('3m', FutureKline3m),
+                ('5m', FutureKline5m),
+                ('15m', FutureKline15m)]:
+            counts[frequency] = 0
+            if k_line_data[frequency] is not None:
+                counts[frequency] = _store_k_line_data(
+                    entity, k_line_data[frequency], batch_size
+                )
+
+        return counts
+
     @staticmethod
     def fetch_current_minute(contract_codes):
         k_line_data = rqdatac.current_minute(
@@ -781,106 +1265,28 @@ class FutureKline1mManager(object):
         return k_line_data
 
     @staticmethod
-    def store(dataframe):
-        session = scoped_session(_session_factory)
-        try:
-            for row in dataframe.itertuples():
-                session.merge(
-                    FutureKline1m(
-                        contract_code=getattr(
-                            row, 'contract_code'
-                        ),
-                        actual_time=getattr(
-                            row, 'actual_time'
-                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                        trading_date=getattr(
-                            row, 'trading_date'
-                        ).strftime('%Y-%m-%d'),
-                        open=getattr(
-                            row, 'open'
-                        ),
-                        close=getattr(
-                            row, 'close'
-                        ),
-                        high=getattr(
-                            row, 'high'
-                        ),
-                        low=getattr(
-                            row, 'low'
-                        ),
-                        volume=getattr(
-                            row, 'volume'
-                        ),
-                        open_interest=getattr(
-                            row, 'open_interest'
-                        )
-                    )
-                )
-            session.commit()
-        except BaseException:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+    def store(dataframe, batch_size=K_LINE_STORE_BATCH_SIZE,
+              incremental=False):
+        return _store_k_line_data(
+            FutureKline1m, dataframe, batch_size, incremental
+        )
 
     @staticmethod
     def get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, end_date):
-        k_line_data = None
-
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(FutureKline1m).filter(
-                and_(
-                    FutureKline1m.contract_code == contract_code,
-                    FutureKline1m.trading_date >= start_date,
-                    FutureKline1m.trading_date <= end_date
-                )
-            ).order_by(
-                asc(FutureKline1m.contract_code),
-                asc(FutureKline1m.actual_time)
-            ).all()
-            if objs:
-                index_list = []
-                contract_code_list = []
-                actual_time_list = []
-                trading_date_list = []
-                open_list = []
-                close_list = []
-                high_list = []
-                low_list = []
-                volume_list = []
-                open_interest_list = []
-                for i in range(len(objs)):
-                    index_list.append(i)
-                    contract_code_list.append(objs[i].contract_code)
-                    actual_time_list.append(objs[i].actual_time)
-                    trading_date_list.append(objs[i].trading_date)
-                    open_list.append(objs[i].open)
-                    close_list.append(objs[i].close)
-                    high_list.append(objs[i].high)
-                    low_list.append(objs[i].low)
-                    volume_list.append(objs[i].volume)
-                    open_interest_list.append(objs[i].open_interest)
-                k_line_data_dict = {
-                    'contract_code': contract_code_list,
-                    'actual_time': actual_time_list,
-                    'trading_date': trading_date_list,
-                    'open': open_list,
-                    'close': close_list,
-                    'high': high_list,
-                    'low': low_list,
-                    'volume': volume_list,
-                    'open_interest': open_interest_list,
-                }
-                k_line_data = pandas.DataFrame(
-                    data=k_line_data_dict,
-                    index=index_list
-                )
-        finally:
-            session.close()
+            contract_code, start_date, end_date, exact=False, columns=None):
+        return _get_cached_k_line_data(
+            FutureKline1m, [contract_code], start_date, end_date, exact,
+            columns
+        ).get(contract_code)
 
-        return k_line_data
+    @staticmethod
+    def get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, exact=False, columns=None,
+            as_dict=False, cache=True):
+        return _get_k_line_data_by_contract(
+            FutureKline1m, contract_codes, start_date, end_date, exact,
+            columns, as_dict, cache
+        )
 
 
 class FutureKline3m(_baseObject):
@@ -897,10 +1303,13 @@ class FutureKline3m(_baseObject):
              low           DECIMAL(20, 5) NOT NULL,
              volume        DECIMAL(20, 5) NOT NULL,
              open_interest DECIMAL(20, 5) NOT NULL,
-             CONSTRAINT pk_future_k_line_3m PRIMARY KEY (contract_code, actual_time),
-             INDEX idx_future_k_line_3m (trading_date)
+             CONSTRAINT pk_future_k_line_3m PRIMARY KEY (contract_code, trading_date, actual_time)
           )
-        ENGINE=innodb DEFAULT CHARSET=utf8;
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
 
     '''
 
@@ -919,156 +1328,44 @@ class FutureKline3m(_baseObject):
     __table_args__ = (
         PrimaryKeyConstraint(
             'contract_code',
+            'trading_date',
             'actual_time',
             name='pk_future_k_line_3m'
         ),
-        Index(
-            'idx_future_k_line_3m',
-            'trading_date'
-        ),
     )
 
 
 class FutureKline3mManager(object):
 
     @staticmethod
-    def generate_k_line_data_from_1m(dataframe):
-        k1m_df = dataframe.copy(deep=True)
-        k1m_df.reset_index(inplace=True)
-        k1m_df.set_index(
-            'actual_time',
-            inplace=True
-        )
-        k3m_df = k1m_df.resample(
-            '3min', label='right', closed='right'
-        ).first()
-        k3m_df['open'] = k1m_df['open'].resample(
-            '3min', label='right', closed='right'
-        ).first()
-        k3m_df['close'] = k1m_df['close'].resample(
-            '3min', label='right', closed='right'
-        ).last()
-        k3m_df['high'] = k1m_df['high'].resample(
-            '3min', label='right', closed='right'
-        ).max()
-        k3m_df['low'] = k1m_df['low'].resample(
-            '3min', label='right', closed='right'
-        ).min()
-        k3m_df['volume'] = k1m_df['volume'].resample(
-            '3min', label='right', closed='right'
-        ).sum()
-        k3m_df['open_interest'] = k1m_df['open_interest'].resample(
-            '3min', label='right', closed='right'
-        ).last()
-        k3m_df.drop(
-            k3m_df[k3m_df.isnull().values].index,
-            inplace=True
-        )
-        k3m_df.reset_index(inplace=True)
-
-        return k3m_df
+    def generate_k_line_data_from_1m(dataframe, trading_sessions=None):
+        return resample_k_line_data(
+            dataframe, ['3m'], trading_sessions
+        )['3m']
 
     @staticmethod
-    def store(dataframe):
-        session = scoped_session(_session_factory)
-        try:
-            for row in dataframe.itertuples():
-                session.merge(
-                    FutureKline3m(
-                        contract_code=getattr(
-                            row, 'contract_code'
-                        ),
-                        actual_time=getattr(
-                            row, 'actual_time'
-                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                        trading_date=getattr(
-                            row, 'trading_date'
-                        ).strftime('%Y-%m-%d'),
-                        open=getattr(
-                            row, 'open'
-                        ),
-                        close=getattr(
-                            row, 'close'
-                        ),
-                        high=getattr(
-                            row, 'high'
-                        ),
-                        low=getattr(
-                            row, 'low'
-                        ),
-                        volume=getattr(
-                            row, 'volume'
-                        ),
-                        open_interest=getattr(
-                            row, 'open_interest'
-                        )
-                    )
-                )
-            session.commit()
-        except BaseException:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+    def store(dataframe, batch_size=K_LINE_STORE_BATCH_SIZE,
+              incremental=False):
+        return _store_k_line_data(
+            FutureKline3m, dataframe, batch_size, incremental
+        )
 
     @staticmethod
     def get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, end_date):
-        k_line_data = None
+            contract_code, start_date, end_date, exact=False, columns=None):
+        return _get_cached_k_line_data(
+            FutureKline3m, [contract_code], start_date, end_date, exact,
+            columns
+        ).get(contract_code)
 
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(FutureKline3m).filter(
-                and_(
-                    FutureKline3m.contract_code == contract_code,
-                    FutureKline3m.trading_date >= start_date,
-                    FutureKline3m.trading_date <= end_date
-                )
-            ).order_by(
-                asc(FutureKline3m.contract_code),
-                asc(FutureKline3m.actual_time)
-            ).all()
-            if objs:
-                index_list = []
-                contract_code_list = []
-                actual_time_list = []
-                trading_date_list = []
-                open_list = []
-                close_list = []
-                high_list = []
-                low_list = []
-                volume_list = []
-                open_interest_list = []
-                for i in range(len(objs)):
-                    index_list.append(i)
-                    contract_code_list.append(objs[i].contract_code)
-                    actual_time_list.append(objs[i].actual_time)
-                    trading_date_list.append(objs[i].trading_date)
-                    open_list.append(objs[i].open)
-                    close_list.append(objs[i].close)
-                    high_list.append(objs[i].high)
-                    low_list.append(objs[i].low)
-                    volume_list.append(objs[i].volume)
-                    open_interest_list.append(objs[i].open_interest)
-                k_line_data_dict = {
-                    'contract_code': contract_code_list,
-                    'actual_time': actual_time_list,
-                    'trading_date': trading_date_list,
-                    'open': open_list,
-                    'close': close_list,
-                    'high': high_list,
-                    'low': low_list,
-                    'volume': volume_list,
-                    'open_interest': open_interest_list,
-                }
-                k_line_data = pandas.DataFrame(
-                    data=k_line_data_dict,
-                    index=index_list
-                )
-        finally:
-            session.close()
-
-        return k_line_data
+    @staticmethod
+    def get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, exact=False, columns=None,
+            as_dict=False, cache=True):
+        return _get_k_line_data_by_contract(
+            FutureKline3m, contract_codes, start_date, end_date, exact,
+            columns, as_dict, cache
+        )
 
 
 class FutureKline5m(_baseObject):
@@ -1085,10 +1382,13 @@ class FutureKline5m(_baseObject):
              low           DECIMAL(20, 5) NOT NULL,
              volume        DECIMAL(20, 5) NOT NULL,
              open_interest DECIMAL(20, 5) NOT NULL,
-             CONSTRAINT pk_future_k_line_5m PRIMARY KEY (contract_code, actual_time),
-             INDEX idx_future_k_line_5m (trading_date)
+             CONSTRAINT pk_future_k_line_5m PRIMARY KEY (contract_code, trading_date, actual_time)
           )
-        ENGINE=innodb DEFAULT CHARSET=utf8;
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
 
     '''
 
@@ -1107,156 +1407,44 @@ class FutureKline5m(_baseObject):
     __table_args__ = (
         PrimaryKeyConstraint(
             'contract_code',
+            'trading_date',
             'actual_time',
             name='pk_future_k_line_5m'
         ),
-        Index(
-            'idx_future_k_line_5m',
-            'trading_date'
-        ),
     )
 
 
 class FutureKline5mManager(object):
 
     @staticmethod
-    def generate_k_line_data_from_1m(dataframe):
-        k1m_df = dataframe.copy(deep=True)
-        k1m_df.reset_index(inplace=True)
-        k1m_df.set_index(
-            'actual_time',
-            inplace=True
-        )
-        k5m_df = k1m_df.resample(
-            '5min', label='right', closed='right'
-        ).first()
-        k5m_df['open'] = k1m_df['open'].resample(
-            '5min', label='right', closed='right'
-        ).first()
-        k5m_df['close'] = k1m_df['close'].resample(
-            '5min', label='right', closed='right'
-        ).last()
-        k5m_df['high'] = k1m_df['high'].resample(
-            '5min', label='right', closed='right'
-        ).max()
-        k5m_df['low'] = k1m_df['low'].resample(
-            '5min', label='right', closed='right'
-        ).min()
-        k5m_df['volume'] = k1m_df['volume'].resample(
-            '5min', label='right', closed='right'
-        ).sum()
-        k5m_df['open_interest'] = k1m_df['open_interest'].resample(
-            '5min', label='right', closed='right'
-        ).last()
-        k5m_df.drop(
-            k5m_df[k5m_df.isnull().values].index,
-            inplace=True
-        )
-        k5m_df.reset_index(inplace=True)
-
-        return k5m_df
+    def generate_k_line_data_from_1m(dataframe, trading_sessions=None):
+        return resample_k_line_data(
+            dataframe, ['5m'], trading_sessions
+        )['5m']
 
     @staticmethod
-    def store(dataframe):
-        session = scoped_session(_session_factory)
-        try:
-            for row in dataframe.itertuples():
-                session.merge(
-                    FutureKline5m(
-                        contract_code=getattr(
-                            row, 'contract_code'
-                        ),
-                        actual_time=getattr(
-                            row, 'actual_time'
-                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                        trading_date=getattr(
-                            row, 'trading_date'
-                        ).strftime('%Y-%m-%d'),
-                        open=getattr(
-                            row, 'open'
-                        ),
-                        close=getattr(
-                            row, 'close'
-                        ),
-                        high=getattr(
-                            row, 'high'
-                        ),
-                        low=getattr(
-                            row, 'low'
-                        ),
-                        volume=getattr(
-                            row, 'volume'
-                        ),
-                        open_interest=getattr(
-                            row, 'open_interest'
-                        )
-                    )
-                )
-            session.commit()
-        except BaseException:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+    def store(dataframe, batch_size=K_LINE_STORE_BATCH_SIZE,
+              incremental=False):
+        return _store_k_line_data(
+            FutureKline5m, dataframe, batch_size, incremental
+        )
 
     @staticmethod
     def get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, end_date):
-        k_line_data = None
-
-        session = scoped_session(_session_factory)
-        try:
-            objs = session.query(FutureKline5m).filter(
-                and_(
-                    FutureKline5m.contract_code == contract_code,
-                    FutureKline5m.trading_date >= start_date,
-                    FutureKline5m.trading_date <= end_date
-                )
-            ).order_by(
-                asc(FutureKline5m.contract_code),
-                asc(FutureKline5m.actual_time)
-            ).all()
-            if objs:
-                index_list = []
-                contract_code_list = []
-                actual_time_list = []
-                trading_date_list = []
-                open_list = []
-                close_list = []
-                high_list = []
-                low_list = []
-                volume_list = []
-                open_interest_list = []
-                for i in range(len(objs)):
-                    index_list.append(i)
-                    contract_code_list.append(objs[i].contract_code)
-                    actual_time_list.append(objs[i].actual_time)
-                    trading_date_list.append(objs[i].trading_date)
-                    open_list.append(objs[i].open)
-                    close_list.append(objs[i].close)
-                    high_list.append(objs[i].high)
-                    low_list.append(objs[i].low)
-                    volume_list.append(objs[i].volume)
-                    open_interest_list.append(objs[i].open_interest)
-                k_line_data_dict = {
-                    'contract_code': contract_code_list,
-                    'actual_time': actual_time_list,
-                    'trading_date': trading_date_list,
-                    'open': open_list,
-                    'close': close_list,
-                    'high': high_list,
-                    'low': low_list,
-                    'volume': volume_list,
-                    'open_interest': open_interest_list,
-                }
-                k_line_data = pandas.DataFrame(
-                    data=k_line_data_dict,
-                    index=index_list
-                )
-        finally:
-            session.close()
+            contract_code, start_date, end_date, exact=False, columns=None):
+        return _get_cached_k_line_data(
+            FutureKline5m, [contract_code], start_date, end_date, exact,
+            columns
+        ).get(contract_code)
 
-        return k_line_data
+    @staticmethod
+    def get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, exact=False, columns=None,
+            as_dict=False, cache=True):
+        return _get_k_line_data_by_contract(
+            FutureKline5m, contract_codes, start_date, end_date, exact,
+            columns, as_dict, cache
+        )
 
 
 class FutureKline15m(_baseObject):
@@ -1273,10 +1461,13 @@ class FutureKline15m(_baseObject):
              low           DECIMAL(20, 5) NOT NULL,
              volume        DECIMAL(20, 5) NOT NULL,
              open_interest DECIMAL(20, 5) NOT NULL,
-             CONSTRAINT pk_future_k_line_15m PRIMARY KEY (contract_code, actual_time),
-             INDEX idx_future_k_line_15m (trading_date)
+             CONSTRAINT pk_future_k_line_15m PRIMARY KEY (contract_code, trading_date, actual_time)
           )
-        ENGINE=innodb DEFAULT CHARSET=utf8;
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
     '''
 
     __tablename__ = 't_future_k_line_15m'
@@ -1294,91 +1485,114 @@ class FutureKline15m(_baseObject):
     __table_args__ = (
         PrimaryKeyConstraint(
             'contract_code',
+            'trading_date',
             'actual_time',
             name='pk_future_k_line_15m'
         ),
-        Index(
-            'idx_future_k_line_15m',
-            'trading_date'
-        ),
     )
 
 
 class FutureKline15mManager(object):
 
     @staticmethod
-    def generate_k_line_data_from_1m(dataframe):
-        k1m_df = dataframe.copy(deep=True)
-        k1m_df.reset_index(inplace=True)
-        k1m_df.set_index(
-            'actual_time',
-            inplace=True
+    def generate_k_line_data_from_1m(dataframe, trading_sessions=None):
+        return resample_k_line_data(
+            dataframe, ['15m'], trading_sessions
+        )['15m']
+
+    @staticmethod
+    def store(dataframe, batch_size=K_LINE_STORE_BATCH_SIZE,
+              incremental=False):
+        return _store_k_line_data(
+            FutureKline15m, dataframe, batch_size, incremental
         )
-        k15m_df = k1m_df.resample(
-            '15min', label='right', closed='right'
-        ).first()
-        k15m_df['open'] = k1m_df['open'].resample(
-            '15min', label='right', closed='right'
-        ).first()
-        k15m_df['close'] = k1m_df['close'].resample(
-            '15min', label='right', closed='right'
-        ).last()
-        k15m_df['high'] = k1m_df['high'].resample(
-            '15min', label='right', closed='right'
-        ).max()
-        k15m_df['low'] = k1m_df['low'].resample(
-            '15min', label='right', closed='right'
-        ).min()
-        k15m_df['volume'] = k1m_df['volume'].resample(
-            '15min', label='right', closed='right'
-        ).sum()
-        k15m_df['open_interest'] = k1m_df['open_interest'].resample(
-            '15min', label='right', closed='right'
-        ).last()
-        k15m_df.drop(
-            k15m_df[k15m_df.isnull().values].index,
-            inplace=True
+
+    @staticmethod
+    def get_contract_k_line_data_by_trading_date(
+            contract_code, start_date, end_date, exact=False, columns=None):
+        return _get_cached_k_line_data(
+            FutureKline15m, [contract_code], start_date, end_date, exact,
+            columns
+        ).get(contract_code)
+
+    @staticmethod
+    def get_k_line_data_by_trading_date(
+            contract_codes, start_date, end_date, exact=False, columns=None,
+            as_dict=False, cache=True):
+        return _get_k_line_data_by_contract(
+            FutureKline15m, contract_codes, start_date, end_date, exact,
+            columns, as_dict, cache
         )
-        k15m_df.reset_index(inplace=True)
 
-        return k15m_df
+
+class FutureKlinePartitionManager(object):
+
+    '''
+        K线数据表和均线策略信号历史表按交易日期以月为单位进行范围分区，分区名称为 pYYYYMM，
+        最后一个分区 p_max 存放尚未建立分区的数据。
+    '''
+
+    @staticmethod
+    def get_partitions(entity):
+        return FutureKlinePartitionManager._get_partitions(
+            entity.__tablename__
+        )
+
+    @staticmethod
+    def _get_partitions(table_name):
+        partitions = []
+
+        session = scoped_session(_session_factory)
+        try:
+            rows = session.execute(
+                text(
+                    'SELECT partition_name, partition_description '
+                    'FROM information_schema.partitions '
+                    'WHERE table_schema = DATABASE() '
+                    'AND table_name = :table_name '
+                    'AND partition_name IS NOT NULL '
+                    'ORDER BY partition_ordinal_position'
+                ),
+                {'table_name': table_name}
+            ).fetchall()
+            for row in rows:
+                partitions.append((row[0], row[1].strip("'")))
+        finally:
+            session.close()
+
+        return partitions
 
     @staticmethod
-    def store(dataframe):
+    def partition_table(entity, end_date):
+        # 一次性迁移，会重建整张表，只在 job_schema_migration 中执行
+        # 分区字段需包含在主键中，主键已由迁移版本 2 改为 (contract_code, trading_date, actual_time)，
+        # 按月建立分区直到 end_date
         session = scoped_session(_session_factory)
         try:
-            for row in dataframe.itertuples():
-                session.merge(
-                    FutureKline15m(
-                        contract_code=getattr(
-                            row, 'contract_code'
-                        ),
-                        actual_time=getattr(
-                            row, 'actual_time'
-                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                        trading_date=getattr(
-                            row, 'trading_date'
-                        ).strftime('%Y-%m-%d'),
-                        open=getattr(
-                            row, 'open'
-                        ),
-                        close=getattr(
-                            row, 'close'
-                        ),
-                        high=getattr(
-                            row, 'high'
-                        ),
-                        low=getattr(
-                            row, 'low'
-                        ),
-                        volume=getattr(
-                            row, 'volume'
-                        ),
-                        open_interest=getattr(
-                            row, 'open_interest'
+            start_date = session.execute(
+                text(
+                    'SELECT MIN(trading_date) FROM {}'.format(
+                        entity.__tablename__
+                    )
+                )
+            ).scalar()
+            if start_date is None:
+                start_date = datetime.date.today()
+            if isinstance(end_date, str):
+                end_date = datetime.datetime.strptime(
+                    end_date, '%Y-%m-%d'
+                ).date()
+            session.execute(
+                text(
+                    'ALTER TABLE {} '
+                    'PARTITION BY RANGE COLUMNS (trading_date) ({})'.format(
+                        entity.__tablename__,
+                        FutureKlinePartitionManager._partition_definitions(
+                            start_date, end_date
                         )
                     )
                 )
+            )
             session.commit()
         except BaseException:
             session.rollback()
@@ -1387,63 +1601,164 @@ class FutureKline15mManager(object):
             session.close()
 
     @staticmethod
-    def get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, end_date):
-        k_line_data = None
-
+    def ensure_partitions(entity, end_date):
+        # 拆分 p_max，为 end_date 之前尚无分区的月份建立分区
+        partitions = FutureKlinePartitionManager.get_partitions(entity)
+        bounds = [
+            description for _, description in partitions
+            if description != 'MAXVALUE'
+        ]
+        if bounds:
+            start_date = datetime.datetime.strptime(
+                bounds[-1], '%Y-%m-%d'
+            ).date()
+        else:
+            start_date = datetime.date.today()
+        if isinstance(end_date, str):
+            end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+        if start_date > end_date:
+            return []
+
+        names = [
+            'p' + month.strftime('%Y%m')
+            for month in _month_starts(start_date, end_date)
+        ]
         session = scoped_session(_session_factory)
         try:
-            objs = session.query(FutureKline15m).filter(
-                and_(
-                    FutureKline15m.contract_code == contract_code,
-                    FutureKline15m.trading_date >= start_date,
-                    FutureKline15m.trading_date <= end_date
-                )
-            ).order_by(
-                asc(FutureKline15m.contract_code),
-                asc(FutureKline15m.actual_time)
-            ).all()
-            if objs:
-                index_list = []
-                contract_code_list = []
-                actual_time_list = []
-                trading_date_list = []
-                open_list = []
-                close_list = []
-                high_list = []
-                low_list = []
-                volume_list = []
-                open_interest_list = []
-                for i in range(len(objs)):
-                    index_list.append(i)
-                    contract_code_list.append(objs[i].contract_code)
-                    actual_time_list.append(objs[i].actual_time)
-                    trading_date_list.append(objs[i].trading_date)
-                    open_list.append(objs[i].open)
-                    close_list.append(objs[i].close)
-                    high_list.append(objs[i].high)
-                    low_list.append(objs[i].low)
-                    volume_list.append(objs[i].volume)
-                    open_interest_list.append(objs[i].open_interest)
-                k_line_data_dict = {
-                    'contract_code': contract_code_list,
-                    'actual_time': actual_time_list,
-                    'trading_date': trading_date_list,
-                    'open': open_list,
-                    'close': close_list,
-                    'high': high_list,
-                    'low': low_list,
-                    'volume': volume_list,
-                    'open_interest': open_interest_list,
-                }
-                k_line_data = pandas.DataFrame(
-                    data=k_line_data_dict,
-                    index=index_list
+            session.execute(
+                text(
+                    'ALTER TABLE {} REORGANIZE PARTITION p_max INTO ({})'.format(
+                        entity.__tablename__,
+                        FutureKlinePartitionManager._partition_definitions(
+                            start_date, end_date
+                        )
+                    )
                 )
+            )
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
         finally:
             session.close()
 
-        return k_line_data
+        return names
+
+    @staticmethod
+    def drop_partitions(entity, before_date, archive=False):
+        # 删除上界不晚于 before_date 的分区，archive 为真时先将分区交换到归档表
+        # DDL 语句立即提交，无法回滚，上次执行在建归档表或交换分区后失败时，重新执行从中断处继续
+        dropped = []
+
+        if isinstance(before_date, datetime.date):
+            before_date = before_date.strftime('%Y-%m-%d')
+        partitions = FutureKlinePartitionManager.get_partitions(entity)
+        for name, description in partitions:
+            if description == 'MAXVALUE' or description > before_date:
+                continue
+            session = scoped_session(_session_factory)
+            try:
+                if archive:
+                    archive_table = '{}_{}'.format(entity.__tablename__, name)
+                    session.execute(
+                        text(
+                            'CREATE TABLE IF NOT EXISTS {} LIKE {}'.format(
+                                archive_table, entity.__tablename__
+                            )
+                        )
+                    )
+                    if FutureKlinePartitionManager._get_partitions(
+                            archive_table):
+                        session.execute(
+                            text(
+                                'ALTER TABLE {} REMOVE PARTITIONING'.format(
+                                    archive_table
+                                )
+                            )
+                        )
+                    archived = session.execute(
+                        text('SELECT 1 FROM {} LIMIT 1'.format(archive_table))
+                    ).first() is not None
+                    remaining = session.execute(
+                        text(
+                            'SELECT 1 FROM {} PARTITION ({}) LIMIT 1'.format(
+                                entity.__tablename__, name
+                            )
+                        )
+                    ).first() is not None
+                    if archived and remaining:
+                        # 归档表和分区都有数据时无法判断归档是否完整，不删除分区
+                        raise ValueError(
+                            'archive table {} is not empty, partition {} of {} '
+                            'is not dropped.'.format(
+                                archive_table, name, entity.__tablename__
+                            )
+                        )
+                    if not archived:
+                        # 归档表有数据而分区为空时，上次执行已交换分区，直接删除分区
+                        session.execute(
+                            text(
+                                'ALTER TABLE {} EXCHANGE PARTITION {} '
+                                'WITH TABLE {}'.format(
+                                    entity.__tablename__, name, archive_table
+                                )
+                            )
+                        )
+                session.execute(
+                    text(
+                        'ALTER TABLE {} DROP PARTITION {}'.format(
+                            entity.__tablename__, name
+                        )
+                    )
+                )
+                session.commit()
+            except BaseException:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+            dropped.append(name)
+
+        return dropped
+
+    @staticmethod
+    def _partition_definitions(start_date, end_date):
+        definitions = []
+        for month in _month_starts(start_date, end_date):
+            definitions.append(
+                'PARTITION p{} VALUES LESS THAN (\'{}\')'.format(
+                    month.strftime('%Y%m'),
+                    _next_month(month).strftime('%Y-%m-%d')
+                )
+            )
+        definitions.append('PARTITION p_max VALUES LESS THAN (MAXVALUE)')
+
+        return ', '.join(definitions)
+
+
+class DatabaseManager(object):
+
+    @staticmethod
+    def reset_engine():
+        '''
+            在子进程中建立自己的数据库连接池。
+            fork 继承的连接仍由父进程使用，只丢弃不关闭。
+        '''
+        global _engine
+        _engine.dispose(close=False)
+        _engine = _create_engine()
+        _session_factory.configure(bind=_engine)
+
+
+class FutureKlineCacheManager(object):
+
+    @staticmethod
+    def get_stats():
+        return _k_line_data_cache.stats()
+
+    @staticmethod
+    def clear():
+        _k_line_data_cache.clear()
 
 
 class FutureMaStrategy(_baseObject):
@@ -1529,3 +1844,348 @@ class FutureMaStrategyManager(object):
             raise
         finally:
             session.close()
+
+    @staticmethod
+    def store_all(ma_strategies):
+        '''
+            在同一事务中把所有策略信号追加到历史表，并更新当前状态表。
+            没有 update_time 的信号使用当前时间；没有 trading_date 的信号只更新当前状态表；
+            同一合约同一K线类型有多条信号时，历史表全部保留，当前状态表只更新为最后一条。
+            返回写入历史表的行数。
+        '''
+        count = 0
+
+        if not ma_strategies:
+            return count
+
+        update_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        history_rows = []
+        rows = {}
+        for ma_strategy in ma_strategies:
+            row = dict(ma_strategy)
+            row.setdefault('update_time', update_time)
+            trading_date = row.pop('trading_date', None)
+            if trading_date is not None:
+                history_row = dict(row)
+                history_row['trading_date'] = trading_date
+                history_rows.append(history_row)
+            rows[(row['contract_code'], row['k_line_type'])] = row
+
+        session = scoped_session(_session_factory)
+        try:
+            if history_rows:
+                session.execute(
+                    insert(FutureMaStrategyHistory.__table__).values(
+                        history_rows
+                    )
+                )
+            session.execute(
+                _upsert_statement(
+                    FutureMaStrategy,
+                    list(rows.values()),
+                    [
+                        'transaction',
+                        'short_term_ma',
+                        'long_term_ma',
+                        'ma60',
+                        'ma120',
+                        'ma250',
+                        'update_time'
+                    ]
+                )
+            )
+            session.commit()
+            count = len(history_rows)
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        return count
+
+
+class FutureMaStrategyHistory(_baseObject):
+
+    '''
+        CREATE TABLE t_future_ma_strategy_history
+          (
+             history_id    BIGINT(20) NOT NULL AUTO_INCREMENT,
+             trading_date  DATE NOT NULL,
+             contract_code VARCHAR(10) NOT NULL,
+             k_line_type   VARCHAR(10) NOT NULL,
+             transaction   VARCHAR(10) NOT NULL DEFAULT 'UNKNOWN',
+             short_term_ma VARCHAR(1) NOT NULL DEFAULT 'N',
+             long_term_ma  VARCHAR(1) NOT NULL DEFAULT 'N',
+             ma60          VARCHAR(1) NOT NULL DEFAULT 'N',
+             ma120         VARCHAR(1) NOT NULL DEFAULT 'N',
+             ma250         VARCHAR(1) NOT NULL DEFAULT 'N',
+             update_time   DATETIME NOT NULL,
+             CONSTRAINT pk_future_ma_strategy_history PRIMARY KEY (history_id, trading_date),
+             INDEX idx_future_ma_strategy_history (contract_code, k_line_type, update_time)
+          )
+        ENGINE=innodb DEFAULT CHARSET=utf8
+        PARTITION BY RANGE COLUMNS (trading_date)
+          (
+             PARTITION p_max VALUES LESS THAN (MAXVALUE)
+          );
+    '''
+
+    __tablename__ = 't_future_ma_strategy_history'
+
+    history_id = Column(BigInteger, nullable=False, autoincrement=True)
+    trading_date = Column(Date, nullable=False)
+    contract_code = Column(String(10), nullable=False)
+    k_line_type = Column(String(10), nullable=False)
+    transaction = Column(String(10), nullable=False, default='UNKNOWN')
+    short_term_ma = Column(String(1), nullable=False, default='N')
+    long_term_ma = Column(String(1), nullable=False, default='N')
+    ma60 = Column(String(1), nullable=False, default='N')
+    ma120 = Column(String(1), nullable=False, default='N')
+    ma250 = Column(String(1), nullable=False, default='N')
+    update_time = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'history_id',
+            'trading_date',
+            name='pk_future_ma_strategy_history'
+        ),
+        Index(
+            'idx_future_ma_strategy_history',
+            'contract_code',
+            'k_line_type',
+            'update_time'
+        ),
+    )
+
+
+class FutureMaStrategyHistoryManager(object):
+
+    @staticmethod
+    def get_contract_ma_strategies(
+            contract_code, start_time, end_time, k_line_type=None):
+        ma_strategies = None
+
+        session = scoped_session(_session_factory)
+        try:
+            conditions = [
+                FutureMaStrategyHistory.contract_code == contract_code,
+                FutureMaStrategyHistory.update_time >= start_time,
+                FutureMaStrategyHistory.update_time <= end_time
+            ]
+            if k_line_type is not None:
+                conditions.append(
+                    FutureMaStrategyHistory.k_line_type == k_line_type
+                )
+            objs = session.query(FutureMaStrategyHistory).filter(
+                and_(*conditions)
+            ).order_by(
+                asc(FutureMaStrategyHistory.k_line_type),
+                asc(FutureMaStrategyHistory.update_time)
+            ).all()
+            if objs:
+                ma_strategies = pandas.DataFrame(
+                    data=[
+                        {
+                            'trading_date': obj.trading_date,
+                            'contract_code': obj.contract_code,
+                            'k_line_type': obj.k_line_type,
+                            'transaction': obj.transaction,
+                            'short_term_ma': obj.short_term_ma,
+                            'long_term_ma': obj.long_term_ma,
+                            'ma60': obj.ma60,
+                            'ma120': obj.ma120,
+                            'ma250': obj.ma250,
+                            'update_time': obj.update_time,
+                        }
+                        for obj in objs
+                    ]
+                )
+        finally:
+            session.close()
+
+        return ma_strategies
+
+
+# 数据库结构
+
+class SchemaMigration(_baseObject):
+
+    '''
+        CREATE TABLE t_schema_migration
+          (
+             version        INT(10) NOT NULL,
+             description    VARCHAR(200) NOT NULL,
+             explain_before TEXT,
+             explain_after  TEXT,
+             applied_time   DATETIME NOT NULL,
+             CONSTRAINT pk_schema_migration PRIMARY KEY (version)
+          )
+        ENGINE=innodb DEFAULT CHARSET=utf8;
+    '''
+
+    __tablename__ = 't_schema_migration'
+
+    version = Column(Integer, nullable=False, autoincrement=False)
+    description = Column(String(200), nullable=False)
+    explain_before = Column(Text)
+    explain_after = Column(Text)
+    applied_time = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'version',
+            name='pk_schema_migration'
+        ),
+    )
+
+
+class SchemaMigrationManager(object):
+
+    @staticmethod
+    def create_table():
+        SchemaMigration.__table__.create(bind=_engine, checkfirst=True)
+
+    @staticmethod
+    def store(version, description, explain_before, explain_after):
+        session = scoped_session(_session_factory)
+        try:
+            session.merge(
+                SchemaMigration(
+                    version=version,
+                    description=description,
+                    explain_before=explain_before,
+                    explain_after=explain_after,
+                    applied_time=datetime.datetime.now()
+                )
+            )
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def get_applied_versions():
+        versions = []
+
+        session = scoped_session(_session_factory)
+        try:
+            objs = session.query(SchemaMigration).order_by(
+                asc(SchemaMigration.version)
+            ).all()
+            for obj in objs:
+                versions.append(obj.version)
+        finally:
+            session.close()
+
+        return versions
+
+    @staticmethod
+    def execute(statement, params=None):
+        session = scoped_session(_session_factory)
+        try:
+            session.execute(text(statement), params or {})
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def explain(statement, params=None):
+        plan = []
+
+        session = scoped_session(_session_factory)
+        try:
+            result = session.execute(
+                text('EXPLAIN ' + statement), params or {}
+            )
+            columns = list(result.keys())
+            for row in result.fetchall():
+                plan.append(
+                    {column: row[i] for i, column in enumerate(columns)}
+                )
+        finally:
+            session.close()
+
+        return plan
+
+    @staticmethod
+    def table_exists(table_name):
+        session = scoped_session(_session_factory)
+        try:
+            count = session.execute(
+                text(
+                    'SELECT COUNT(*) FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() '
+                    'AND table_name = :table_name'
+                ),
+                {'table_name': table_name}
+            ).scalar()
+        finally:
+            session.close()
+
+        return count > 0
+
+    @staticmethod
+    def get_primary_key(table_name):
+        columns = []
+
+        session = scoped_session(_session_factory)
+        try:
+            rows = session.execute(
+                text(
+                    'SELECT column_name FROM information_schema.key_column_usage '
+                    'WHERE table_schema = DATABASE() '
+                    'AND table_name = :table_name '
+                    'AND constraint_name = \'PRIMARY\' '
+                    'ORDER BY ordinal_position'
+                ),
+                {'table_name': table_name}
+            ).fetchall()
+            for row in rows:
+                columns.append(row[0])
+        finally:
+            session.close()
+
+        return columns
+
+    @staticmethod
+    def index_exists(table_name, index_name):
+        session = scoped_session(_session_factory)
+        try:
+            count = session.execute(
+                text(
+                    'SELECT COUNT(*) FROM information_schema.statistics '
+                    'WHERE table_schema = DATABASE() '
+                    'AND table_name = :table_name '
+                    'AND index_name = :index_name'
+                ),
+                {'table_name': table_name, 'index_name': index_name}
+            ).scalar()
+        finally:
+            session.close()
+
+        return count > 0
+
+    @staticmethod
+    def column_exists(table_name, column_name):
+        session = scoped_session(_session_factory)
+        try:
+            count = session.execute(
+                text(
+                    'SELECT COUNT(*) FROM information_schema.columns '
+                    'WHERE table_schema = DATABASE() '
+                    'AND table_name = :table_name '
+                    'AND column_name = :column_name'
+                ),
+                {'table_name': table_name, 'column_name': column_name}
+            ).scalar()
+        finally:
+            session.close()
+
+        return count > 0
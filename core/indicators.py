@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+import math
+import numpy
+
+
+def get_latest_moving_averages(closes, windows, count=2):
+    '''
+        由一次累计和计算多个窗口均线的最后 count 个值，返回 {窗口: 数组}。
+        K线数量不足时为 nan，与 rolling(window).mean() 相同。
+        只对最后 max(windows) + count - 1 根K线求累计和，增加窗口只增加一次减法。
+    '''
+    closes = numpy.asarray(closes, dtype=numpy.float64)
+    closes = closes[max(len(closes) - max(windows) - count + 1, 0):]
+    sums = numpy.concatenate(([0.0], numpy.cumsum(closes)))
+    ends = numpy.arange(len(closes) - count + 1, len(closes) + 1)
+
+    moving_averages = {}
+    for window in windows:
+        values = numpy.full(count, math.nan)
+        valid = (ends - window >= 0) & (ends >= 1)
+        values[valid] = (
+            sums[ends[valid]] - sums[ends[valid] - window]
+        ) / window
+        moving_averages[window] = values
+
+    return moving_averages
+
+
+class MovingAverageEngine(object):
+
+    '''
+        增量均线计算：按键（例如 (合约代码, K线类型)）保存最近 max(windows) + 1 根K线的收盘价和各均线窗口的累计和。
+        追加新K线或修改最后一根（未完成的）K线时，计算量只与窗口个数有关，与窗口长度无关。
+        为避免浮点误差累积，每追加 max(windows) + 1 根K线重新精确求和一次。
+    '''
+
+    def __init__(self, windows):
+        self._windows = sorted(set(windows))
+        self._capacity = self._windows[-1] + 1
+        self._states = {}
+
+    def update(self, key, actual_times, closes):
+        # actual_times 按升序排列；早于最后一根K线的数据忽略，时间相同时修改最后一根，时间更晚时追加
+        state = self._states.get(key)
+        if state is None:
+            state = {
+                'closes': numpy.zeros(self._capacity, dtype=numpy.float64),
+                'position': 0,
+                'count': 0,
+                'appended': 0,
+                'last_time': None,
+                'sums': {window: 0.0 for window in self._windows},
+            }
+            self._states[key] = state
+
+        actual_times = numpy.asarray(actual_times)
+        closes = numpy.asarray(closes, dtype=numpy.float64)
+        start = 0
+        if state['last_time'] is not None:
+            start = numpy.searchsorted(
+                actual_times, state['last_time'], side='left'
+            )
+        for i in range(start, len(actual_times)):
+            if actual_times[i] == state['last_time']:
+                self._revise(state, closes[i])
+            else:
+                self._append(state, closes[i])
+                state['last_time'] = actual_times[i]
+
+    def get(self, key):
+        # 返回 {窗口: (最新值, 前一值)}，K线数量不足时为 nan，与 rolling(window).mean() 相同
+        state = self._states[key]
+        closes = state['closes']
+        count = state['count']
+        last = closes[(state['position'] - 1) % self._capacity]
+
+        moving_averages = {}
+        for window in self._windows:
+            latest = math.nan
+            before_last = math.nan
+            if count >= window:
+                latest = state['sums'][window] / window
+            if count >= window + 1:
+                before_last = (
+                    state['sums'][window] - last + closes[
+                        (state['position'] - 1 - window) % self._capacity
+                    ]
+                ) / window
+            moving_averages[window] = (latest, before_last)
+
+        return moving_averages
+
+    def _append(self, state, close):
+        closes = state['closes']
+        position = state['position']
+        for window in self._windows:
+            if state['count'] >= window:
+                state['sums'][window] -= closes[
+                    (position - window) % self._capacity
+                ]
+            state['sums'][window] += close
+        closes[position] = close
+        state['position'] = (position + 1) % self._capacity
+        state['count'] += 1
+
+        state['appended'] += 1
+        if state['appended'] == self._capacity:
+            state['appended'] = 0
+            self._resum(state)
+
+    def _revise(self, state, close):
+        closes = state['closes']
+        last = (state['position'] - 1) % self._capacity
+        for window in self._windows:
+            state['sums'][window] += close - closes[last]
+        closes[last] = close
+
+    def _resum(self, state):
+        closes = state['closes']
+        for window in self._windows:
+            count = min(window, state['count'])
+            state['sums'][window] = math.fsum(
+                closes[(state['position'] - 1 - i) % self._capacity]
+                for i in range(count)
+            )
+
+
+def get_latest_panel_moving_averages(closes_list, windows, count=2):
+    '''
+        get_latest_moving_averages 的面板版本：各合约的收盘价按最后一根K线对齐为 (时间 × 合约) 矩阵，
+        按列求一次累计和，返回 {窗口: (count × 合约数) 数组}。
+        K线数量不足的合约在矩阵前面补 0，对应的均线为 nan，结果与逐个合约计算完全相同。
+    '''
+    length = max(windows) + count - 1
+    panel = numpy.zeros((length, len(closes_list)), dtype=numpy.float64)
+    counts = numpy.zeros(len(closes_list), dtype=numpy.int64)
+    for column, closes in enumerate(closes_list):
+        closes = numpy.asarray(closes, dtype=numpy.float64)[-length:]
+        panel[length - len(closes):, column] = closes
+        counts[column] = len(closes)
+
+    sums = numpy.zeros((length + 1, len(closes_list)), dtype=numpy.float64)
+    numpy.cumsum(panel, axis=0, out=sums[1:])
+    ends = numpy.arange(length - count + 1, length + 1)
+    # 每列第一根有效K线在矩阵中的位置
+    firsts = length - counts
+
+    moving_averages = {}
+    for window in windows:
+        starts = ends - window
+        valid = starts[:, numpy.newaxis] >= firsts[numpy.newaxis, :]
+        moving_averages[window] = numpy.where(
+            valid,
+            (sums[ends] - sums[numpy.maximum(starts, 0)]) / window,
+            math.nan
+        )
+
+    return moving_averages
+
+
+def get_moving_average_series(closes, firsts, windows, block_size=4096):
+    '''
+        计算每根K线的均线最新值和前一值，返回 {窗口: (最新值数组, 前一值数组)}。
+        firsts 为每根K线可以使用的第一根K线的位置（例如所属合约的第一根K线），
+        与实时计算一样，两个值都只使用 firsts 之后的K线，K线数量不足时为 nan。
+        累计和按 block_size 分块求和，一年的分钟K线也不会因累计和过大损失精度。
+    '''
+    closes = numpy.asarray(closes, dtype=numpy.float64)
+    firsts = numpy.asarray(firsts, dtype=numpy.int64)
+    size = len(closes)
+    block_size = max(block_size, max(windows))
+    block_count = -(-size // block_size)
+
+    # 块内累计和（包括当前K线）和各块合计
+    padded = numpy.zeros(block_count * block_size, dtype=numpy.float64)
+    padded[:size] = closes
+    sums = numpy.cumsum(
+        padded.reshape(block_count, block_size), axis=1
+    )
+    totals = sums[:, -1]
+    sums = sums.ravel()[:size]
+    positions = numpy.arange(size)
+    blocks = positions // block_size
+
+    moving_averages = {}
+    for window in windows:
+        # 以每根K线结束的 window 根K线的合计：窗口前一根K线在上一块中时加上上一块的合计
+        previous_sums = numpy.zeros(size, dtype=numpy.float64)
+        previous_sums[window:] = sums[:max(size - window, 0)]
+        previous_blocks = blocks.copy()
+        previous_blocks[window:] = blocks[:max(size - window, 0)]
+        values = sums - previous_sums + numpy.where(
+            previous_blocks != blocks, totals[previous_blocks], 0.0
+        )
+        values /= window
+
+        latest = numpy.where(positions - window + 1 >= firsts, values, math.nan)
+        before_last = numpy.full(size, math.nan)
+        before_last[1:] = values[:-1]
+        before_last[positions - window < firsts] = math.nan
+        moving_averages[window] = (latest, before_last)
+
+    return moving_averages
@@ -7,12 +7,17 @@ import logging
 import logging.config
 import yaml
 import os
+import numpy
+import pandas
 import rqdatac
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.executors.pool import ProcessPoolExecutor
 from constants import STOCK_MARKET_CLOSING_TIME
 from constants import FUTURE_MARKET_CLOSING_TIME
+from constants import K_LINE_PARTITION_DAYS_AHEAD
+from constants import K_LINE_RETENTION_DAYS
+from constants import STRATEGY_BATCH_PROCESSES
 from entries import BasisCalendarManager
 from entries import BasisTradingDateViewManager
 from entries import FundScaleManager
@@ -21,10 +26,18 @@ from entries import FutureMainContractManager
 from entries import FutureLatestMainContractViewManager
 from entries import FutureKline1dManager
 from entries import FutureKline1mManager
-from entries import FutureKline3mManager
-from entries import FutureKline5mManager
-from entries import FutureKline15mManager
+from entries import FutureKlinePartitionManager
+from entries import FutureKline1d
+from entries import FutureKline1m
+from entries import FutureKline3m
+from entries import FutureKline5m
+from entries import FutureKline15m
+from entries import FutureMaStrategyHistory
+from backtests import MaBacktest
+from backtests import MaParameterSweep
+from migrations import MigrationRunner
 from strategies import MaStrategy
+from writers import WriteBehindQueue
 
 rqdatac.init()
 
@@ -37,6 +50,41 @@ with open(logging_yaml_path, 'r') as file:
 logger = logging.getLogger('jobs')
 
 
+# 数据库结构迁移作业
+def job_schema_migration(args):
+    logger.info('[job_schema_migration] job start.')
+
+    target_version = None
+    if 'version' in args.keys():
+        target_version = int(args['version'])
+
+    # 记录执行计划使用的合约和日期区间
+    today = datetime.date.today()
+    start_date = (today + datetime.timedelta(days=-30)).strftime('%Y-%m-%d')
+    end_date = today.strftime('%Y-%m-%d')
+    contract_code = None
+    if 'contract' in args.keys():
+        contract_code = args['contract']
+    try:
+        if contract_code is None:
+            latest_main_contracts = FutureLatestMainContractViewManager.get_latest_main_contracts()
+            if latest_main_contracts:
+                contract_code = latest_main_contracts[0]
+    except BaseException:
+        logger.info('[job_schema_migration] no main contract available.')
+
+    try:
+        runner = MigrationRunner(contract_code, start_date, end_date)
+        versions = runner.run(target_version)
+        logger.info(
+            '[job_schema_migration] versions applied: {}.'.format(versions)
+        )
+    except BaseException:
+        logger.error('[job_schema_migration] job failed.')
+
+    logger.info('[job_schema_migration] job end.')
+
+
 # 交易日数据作业
 def job_calendar(args):
     logger.info('[job_calendar] job start.')
@@ -46,8 +94,12 @@ def job_calendar(args):
         end_date = args['end']
     else:
         today = datetime.date.today()
-        start_date = today + datetime.timedelta(days=-30)
-        end_date = today + datetime.timedelta(days=+30)
+        start_date = (
+            today + datetime.timedelta(days=-30)
+        ).strftime('%Y-%m-%d')
+        end_date = (
+            today + datetime.timedelta(days=+30)
+        ).strftime('%Y-%m-%d')
 
     logger.info(
         '[job_calendar] start_date = {}, end_date = {}.'.format(
@@ -55,12 +107,18 @@ def job_calendar(args):
         )
     )
     try:
+        # 多年的交易日也只需调用一次接口，并一次写入区间内的所有自然日
         trading_dates = rqdatac.get_trading_dates(
-            start_date=start_date.strftime('%Y-%m-%d'),
-            end_date=end_date.strftime('%Y-%m-%d')
+            start_date=start_date,
+            end_date=end_date
         )
-        for trading_date in trading_dates:
-            BasisCalendarManager.store(trading_date.strftime('%Y-%m-%d'), 'Y')
+        count = BasisCalendarManager.store_all(
+            start_date,
+            end_date,
+            [trading_date.strftime('%Y-%m-%d')
+             for trading_date in trading_dates]
+        )
+        logger.info('[job_calendar] {} dates stored.'.format(count))
     except BaseException:
         logger.error('[job_calendar] job failed.')
 
@@ -132,6 +190,9 @@ def _job_fund_scale(trading_date):
 def job_future_main_contract(args):
     logger.info('[job_future_main_contract] job start.')
 
+    # 写入后从数据库读取1分钟K线校验
+    verify = 'verify' in args.keys() and args['verify'] == 'Y'
+
     if 'start' in args.keys() and 'end' in args.keys():
         start_date = args['start']
         end_date = args['end']
@@ -147,7 +208,7 @@ def job_future_main_contract(args):
                     trading_date
                 )
             )
-            _job_future_main_contract(trading_date)
+            _job_future_main_contract(trading_date, verify)
     else:
         today = datetime.date.today().strftime('%Y-%m-%d')
         latest_trading_date = BasisTradingDateViewManager.get_latest_trading_date()
@@ -163,12 +224,12 @@ def job_future_main_contract(args):
                         next_trading_date
                     )
                 )
-                _job_future_main_contract(next_trading_date)
+                _job_future_main_contract(next_trading_date, verify)
 
     logger.info('[job_future_main_contract] job end.')
 
 
-def _job_future_main_contract(next_trading_date):
+def _job_future_main_contract(next_trading_date, verify=False):
     # 更新期货主力合约切换信息
     contract_symbols = FutureContractSymbolManager.get_contract_symbols()
     for contract_symbol in contract_symbols:
@@ -211,6 +272,7 @@ def _job_future_main_contract(next_trading_date):
         main_contracts = FutureMainContractManager.get_main_contracts_by_switch_date(
             next_trading_date)
         if main_contracts:
+            trading_sessions = FutureContractSymbolManager.get_trading_sessions()
             start_date = BasisTradingDateViewManager.get_previous_trading_date(
                 next_trading_date, 61
             )
@@ -228,7 +290,12 @@ def _job_future_main_contract(next_trading_date):
                 logger.info(
                     '[job_future_main_contract] store history k line data, type is 1d.'
                 )
-                FutureKline1dManager.store(k1d)
+                count = FutureKline1dManager.store(k1d)
+                logger.info(
+                    '[job_future_main_contract] {} rows stored, type is 1d.'.format(
+                        count
+                    )
+                )
 
             logger.info(
                 '[job_future_main_contract] fetch and store history k line minute data.'
@@ -253,61 +320,35 @@ def _job_future_main_contract(next_trading_date):
                     logger.info(
                         '[job_future_main_contract] store history k line data, type is 1m.'
                     )
-                    FutureKline1mManager.store(k1m)
-
-                logger.info(
-                    '[job_future_main_contract] generate and store other history k line data.'
-                )
-                for main_contract in main_contracts:
+                    count = FutureKline1mManager.store(k1m)
                     logger.info(
-                        '[job_future_main_contract] load {} history k line data, type is 1m.'.format(
-                            main_contract
+                        '[job_future_main_contract] {} rows stored, type is 1m.'.format(
+                            count
                         )
                     )
-                    k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                        main_contract, trading_date, trading_date)
-                    if k1m is not None:
-                        logger.info(
-                            '[job_future_main_contract] generate {} history k line data, type is 3m.'.format(
-                                main_contract
-                            )
+                    if verify:
+                        _verify_k_line_data(
+                            'job_future_main_contract',
+                            FutureKline1mManager,
+                            k1m,
+                            main_contracts,
+                            trading_date
                         )
-                        k3m = FutureKline3mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        logger.info(
-                            '[job_future_main_contract] store {} history k line data, type is 3m.'.format(
-                                main_contract
-                            )
-                        )
-                        FutureKline3mManager.store(k3m)
 
+                    # 由获取的1分钟K线合成其他频率的K线，不再从数据库读取
+                    logger.info(
+                        '[job_future_main_contract] generate and store other history k line data.'
+                    )
+                    counts = FutureKline1mManager.generate_and_store_k_line_data(
+                        k1m, trading_sessions
+                    )
+                    for frequency, count in counts.items():
                         logger.info(
-                            '[job_future_main_contract] generate {} history k line data, type is 5m.'.format(
-                                main_contract
-                            )
-                        )
-                        k5m = FutureKline5mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        logger.info(
-                            '[job_future_main_contract] store {} history k line data, type is 5m.'.format(
-                                main_contract
+                            '[job_future_main_contract] {} rows stored, type is {}.'.format(
+                                count, frequency
                             )
                         )
-                        FutureKline5mManager.store(k5m)
 
-                        logger.info(
-                            '[job_future_main_contract] generate {} history k line data, type is 15m.'.format(
-                                main_contract
-                            )
-                        )
-                        k15m = FutureKline15mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        logger.info(
-                            '[job_future_main_contract] store {} history k line data, type is 15m.'.format(
-                                main_contract
-                            )
-                        )
-                        FutureKline15mManager.store(k15m)
         logger.info(
             '[job_future_main_contract] preload future main contract history k line data end.'
         )
@@ -321,6 +362,9 @@ def _job_future_main_contract(next_trading_date):
 def job_future_history_k_line_data(args):
     logger.info('[job_future_history_k_line_data] job start.')
 
+    # 写入后从数据库读取1分钟K线校验
+    verify = 'verify' in args.keys() and args['verify'] == 'Y'
+
     if 'start' in args.keys() and 'end' in args.keys():
         start_date = args['start']
         end_date = args['end']
@@ -336,7 +380,7 @@ def job_future_history_k_line_data(args):
                     trading_date
                 )
             )
-            _job_future_history_k_line_data(trading_date)
+            _job_future_history_k_line_data(trading_date, verify)
     else:
         today = datetime.date.today().strftime('%Y-%m-%d')
         latest_trading_date = BasisTradingDateViewManager.get_latest_trading_date()
@@ -350,12 +394,12 @@ def job_future_history_k_line_data(args):
                         latest_trading_date
                     )
                 )
-                _job_future_history_k_line_data(latest_trading_date)
+                _job_future_history_k_line_data(latest_trading_date, verify)
 
     logger.info('[job_future_history_k_line_data] job end.')
 
 
-def _job_future_history_k_line_data(trading_date):
+def _job_future_history_k_line_data(trading_date, verify=False):
     try:
         logger.info(
             '[job_future_history_k_line_data] load future history k line data start. trading_date = {}.'.format(
@@ -365,6 +409,7 @@ def _job_future_history_k_line_data(trading_date):
         main_contracts = FutureMainContractManager.get_main_contracts_by_trading_date(
             trading_date)
         if main_contracts:
+            trading_sessions = FutureContractSymbolManager.get_trading_sessions()
             logger.info(
                 '[job_future_history_k_line_data] fetch history k line data, type is 1d.'
             )
@@ -375,7 +420,12 @@ def _job_future_history_k_line_data(trading_date):
                 logger.info(
                     '[job_future_history_k_line_data] store history k line data, type is 1d.'
                 )
-                FutureKline1dManager.store(k1d)
+                count = FutureKline1dManager.store(k1d)
+                logger.info(
+                    '[job_future_history_k_line_data] {} rows stored, type is 1d.'.format(
+                        count
+                    )
+                )
 
             logger.info(
                 '[job_future_history_k_line_data] fetch history k line data, type is 1m.'
@@ -387,61 +437,35 @@ def _job_future_history_k_line_data(trading_date):
                 logger.info(
                     '[job_future_history_k_line_data] store history k line data, type is 1m.'
                 )
-                FutureKline1mManager.store(k1m)
-
-            logger.info(
-                '[job_future_history_k_line_data] generate and store other history k line data.'
-            )
-            for main_contract in main_contracts:
+                count = FutureKline1mManager.store(k1m)
                 logger.info(
-                    '[job_future_history_k_line_data] load {} history k line data, type is 1m.'.format(
-                        main_contract
+                    '[job_future_history_k_line_data] {} rows stored, type is 1m.'.format(
+                        count
                     )
                 )
-                k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                    main_contract, trading_date, trading_date)
-                if k1m is not None:
-                    logger.info(
-                        '[job_future_history_k_line_data] generate {} history k line data, type is 3m.'.format(
-                            main_contract
-                        )
-                    )
-                    k3m = FutureKline3mManager.generate_k_line_data_from_1m(
-                        k1m)
-                    logger.info(
-                        '[job_future_history_k_line_data] store {} history k line data, type is 3m.'.format(
-                            main_contract
-                        )
+                if verify:
+                    _verify_k_line_data(
+                        'job_future_history_k_line_data',
+                        FutureKline1mManager,
+                        k1m,
+                        main_contracts,
+                        trading_date
                     )
-                    FutureKline3mManager.store(k3m)
 
+                # 所有合约一次合成其他频率的K线
+                logger.info(
+                    '[job_future_history_k_line_data] generate and store other history k line data.'
+                )
+                counts = FutureKline1mManager.generate_and_store_k_line_data(
+                    k1m, trading_sessions
+                )
+                for frequency, count in counts.items():
                     logger.info(
-                        '[job_future_history_k_line_data] generate {} history k line data, type is 5m.'.format(
-                            main_contract
-                        )
-                    )
-                    k5m = FutureKline5mManager.generate_k_line_data_from_1m(
-                        k1m)
-                    logger.info(
-                        '[job_future_history_k_line_data] store {} history k line data, type is 5m.'.format(
-                            main_contract
+                        '[job_future_history_k_line_data] {} rows stored, type is {}.'.format(
+                            count, frequency
                         )
                     )
-                    FutureKline5mManager.store(k5m)
 
-                    logger.info(
-                        '[job_future_history_k_line_data] generate {} history k line data, type is 15m.'.format(
-                            main_contract
-                        )
-                    )
-                    k15m = FutureKline15mManager.generate_k_line_data_from_1m(
-                        k1m)
-                    logger.info(
-                        '[job_future_history_k_line_data] store {} history k line data, type is 15m.'.format(
-                            main_contract
-                        )
-                    )
-                    FutureKline15mManager.store(k15m)
         logger.info(
             '[job_future_history_k_line_data] load future history k line data end. trading_date = {}.'.format(
                 trading_date
@@ -455,12 +479,117 @@ def _job_future_history_k_line_data(trading_date):
         )
 
 
+def _verify_k_line_data(job_name, manager, k_line_data, contract_codes,
+                        trading_date):
+    # 一次从数据库读取所有合约写入的K线数据，与获取的数据比较行数、时间和收盘价
+    stored = manager.get_k_line_data_by_trading_date(
+        contract_codes, trading_date, trading_date,
+        columns=['contract_code', 'actual_time', 'close'],
+        cache=False
+    )
+    expected = k_line_data[['contract_code', 'actual_time', 'close']].copy()
+    expected['actual_time'] = pandas.to_datetime(expected['actual_time'])
+    expected = expected.sort_values(
+        ['contract_code', 'actual_time']
+    ).reset_index(drop=True)
+    if stored is not None:
+        stored = stored.sort_values(
+            ['contract_code', 'actual_time']
+        ).reset_index(drop=True)
+
+    if (stored is None
+            or len(stored) != len(expected)
+            or not (stored['contract_code'] == expected['contract_code']).all()
+            or not (stored['actual_time'] == expected['actual_time']).all()
+            or not numpy.allclose(stored['close'], expected['close'])):
+        logger.error(
+            '[{}] verify k line data failed: {}@{}, {} rows fetched, {} rows stored.'.format(
+                job_name,
+                manager.__name__,
+                trading_date,
+                len(expected),
+                0 if stored is None else len(stored)
+            )
+        )
+        return False
+
+    logger.info(
+        '[{}] verify k line data passed: {}@{}, {} rows.'.format(
+            job_name, manager.__name__, trading_date, len(stored)
+        )
+    )
+    return True
+
+
+# 期货K线数据分区维护作业
+def job_future_k_line_partition(args):
+    logger.info('[job_future_k_line_partition] job start.')
+
+    archive = 'archive' in args.keys() and args['archive'] == 'Y'
+    today = datetime.date.today()
+    end_date = today + datetime.timedelta(days=K_LINE_PARTITION_DAYS_AHEAD)
+    entities = [
+        FutureKline1d,
+        FutureKline1m,
+        FutureKline3m,
+        FutureKline5m,
+        FutureKline15m,
+        FutureMaStrategyHistory
+    ]
+    for entity in entities:
+        table_name = entity.__tablename__
+        try:
+            # 未分区的表需要先由 job_schema_migration 转换，定时作业不重建表
+            if not FutureKlinePartitionManager.get_partitions(entity):
+                logger.warning(
+                    '[job_future_k_line_partition] {} is not partitioned, skipped.'.format(
+                        table_name
+                    )
+                )
+                continue
+
+            # 建立分区
+            names = FutureKlinePartitionManager.ensure_partitions(
+                entity, end_date
+            )
+            logger.info(
+                '[job_future_k_line_partition] {} partitions added: {}.'.format(
+                    table_name, names
+                )
+            )
+
+            # 删除过期分区
+            retention_days = K_LINE_RETENTION_DAYS[table_name]
+            if retention_days is not None:
+                before_date = today + datetime.timedelta(days=-retention_days)
+                names = FutureKlinePartitionManager.drop_partitions(
+                    entity, before_date, archive
+                )
+                logger.info(
+                    '[job_future_k_line_partition] {} partitions dropped: {}, archive = {}.'.format(
+                        table_name, names, archive
+                    )
+                )
+        except BaseException:
+            logger.error(
+                '[job_future_k_line_partition] maintain partitions failed: {}.'.format(
+                    table_name
+                )
+            )
+
+    logger.info('[job_future_k_line_partition] job end.')
+
+
 # 期货均线策略计算作业
 def job_future_ma_strategy(args):
     logger.info('[job_future_ma_strategy] job start.')
 
+    processes = STRATEGY_BATCH_PROCESSES
+    if 'processes' in args.keys():
+        processes = int(args['processes'])
+
     if 'type' in args.keys():
-        types = ['realtime', 'batch']
+        types = ['realtime', 'batch', 'backtest', 'sweep']
         if args['type'] in types:
             if args['type'] == 'batch':
                 trading_date = None
@@ -470,7 +599,54 @@ def job_future_ma_strategy(args):
                     trading_date = BasisTradingDateViewManager.get_latest_trading_date()
                 main_contracts = FutureMainContractManager.get_main_contracts_by_trading_date(
                     trading_date)
-                _job_future_ma_strategy_batch(trading_date, main_contracts)
+                _job_future_ma_strategy_batch(
+                    trading_date, main_contracts, processes)
+
+            if args['type'] == 'backtest':
+                if 'start' in args.keys() and 'end' in args.keys():
+                    slippage_ticks = 0
+                    if 'slippage' in args.keys():
+                        slippage_ticks = float(args['slippage'])
+                    output = None
+                    if 'output' in args.keys():
+                        output = args['output']
+                    _job_future_ma_strategy_backtest(
+                        args['start'], args['end'], slippage_ticks, output)
+                else:
+                    logger.error(
+                        '[job_future_ma_strategy] start or end is not specified.')
+
+            if args['type'] == 'sweep':
+                # 各均线窗口的候选值用 / 分隔，例如 short=3/5/8
+                keys = ['start', 'end', 'k_line_type', 'short', 'long', 'trend']
+                if (all(key in args.keys() for key in keys)
+                        and args['k_line_type'] not in MaBacktest.K_LINE_TYPES):
+                    logger.error(
+                        '[job_future_ma_strategy] sweep k_line_type must be one of {}.'.format(
+                            MaBacktest.K_LINE_TYPES
+                        )
+                    )
+                elif all(key in args.keys() for key in keys):
+                    slippage_ticks = 0
+                    if 'slippage' in args.keys():
+                        slippage_ticks = float(args['slippage'])
+                    output = None
+                    if 'output' in args.keys():
+                        output = args['output']
+                    windows = [
+                        [int(window) for window in args[key].split('/')]
+                        for key in ['short', 'long', 'trend']
+                    ]
+                    # 未指定进程数时使用全部 CPU
+                    sweep_processes = None
+                    if 'processes' in args.keys():
+                        sweep_processes = processes
+                    _job_future_ma_strategy_sweep(
+                        args['start'], args['end'], args['k_line_type'],
+                        windows, slippage_ticks, sweep_processes, output)
+                else:
+                    logger.error(
+                        '[job_future_ma_strategy] sweep arguments are not specified.')
 
             if args['type'] == 'realtime':
                 trading_date = None
@@ -486,7 +662,7 @@ def job_future_ma_strategy(args):
                         trading_date = latest_trading_date
                     main_contracts = FutureLatestMainContractViewManager.get_latest_main_contracts()
                     _job_future_ma_strategy_realtime(
-                        trading_date, main_contracts)
+                        trading_date, main_contracts, processes)
         else:
             logger.error('[job_future_ma_strategy] bad type specified.')
     else:
@@ -495,15 +671,73 @@ def job_future_ma_strategy(args):
     logger.info('[job_future_ma_strategy] job end.')
 
 
-def _job_future_ma_strategy_batch(trading_date, main_contracts):
+def _job_future_ma_strategy_batch(trading_date, main_contracts, processes):
     strategy = MaStrategy(trading_date, main_contracts)
-    strategy.batch()
+    strategy.batch(processes)
+
 
+def _job_future_ma_strategy_backtest(start_date, end_date, slippage_ticks, output):
+    backtest = MaBacktest(start_date, end_date, slippage_ticks=slippage_ticks)
+    signals, statistics = backtest.run()
+    if statistics is None:
+        logger.info('[job_future_ma_strategy] no k line data to backtest.')
+        return
+
+    for k_line_type, k_line_statistics in statistics.groupby(
+            'k_line_type', sort=False):
+        trades = k_line_statistics['trades'].sum()
+        wins = k_line_statistics['wins'].sum()
+        logger.info(
+            '[job_future_ma_strategy] backtest {}: {} contracts, {} trades, win rate {:.2%}, pnl {:.2f}.'.format(
+                k_line_type,
+                len(k_line_statistics.index),
+                trades,
+                wins / trades if trades > 0 else 0,
+                k_line_statistics['pnl'].sum()
+            )
+        )
+    if output is not None:
+        # 统计数据和逐根K线的信号分别保存为 CSV 文件
+        statistics.to_csv(output, index=False)
+        signals.to_csv(
+            os.path.splitext(output)[0] + '_signals.csv', index=False
+        )
 
-def _job_future_ma_strategy_realtime(trading_date, main_contracts):
+
+def _job_future_ma_strategy_sweep(
+        start_date, end_date, k_line_type, windows, slippage_ticks, processes,
+        output):
+    short_term_windows, long_term_windows, trend_windows = windows
+    sweep = MaParameterSweep(
+        start_date,
+        end_date,
+        k_line_type,
+        short_term_windows,
+        long_term_windows,
+        trend_windows,
+        slippage_ticks=slippage_ticks,
+        processes=processes
+    )
+    # 排名前列的参数组合由 MaParameterSweep 输出到日志，完整结果保存为 CSV 文件
+    results = sweep.run()
+    if results is None:
+        logger.info('[job_future_ma_strategy] no k line data to sweep.')
+        return
+
+    if output is not None:
+        results.to_csv(output, index=False)
+
+
+def _job_future_ma_strategy_realtime(trading_date, main_contracts, processes):
     strategy = MaStrategy(trading_date, main_contracts)
     strategy.fix_k_line_data()
-    strategy.batch()
+    strategy.batch(processes)
+    strategy.warm_k_line_buffers()
+
+    # 实时计算期间异步写入K线数据和策略信号
+    writer = WriteBehindQueue()
+    writer.start()
+    strategy.writer = writer
 
     fetchScheduler = BackgroundScheduler(
         executors={
@@ -608,14 +842,17 @@ def _job_future_ma_strategy_realtime(trading_date, main_contracts):
     finally:
         fetchScheduler.shutdown()
         otherScheduler.shutdown()
+        writer.stop()
 
 
 if __name__ == '__main__':
     jobs = [
+        'job_schema_migration',  # 数据库结构迁移作业
         'job_calendar',  # 交易日数据作业
         'job_fund_scale',  # 基金份额数据作业
         'job_future_main_contract',  # 期货主力合约数据作业
         'job_future_history_k_line_data',  # 期货历史K线数据作业
+        'job_future_k_line_partition',  # 期货K线数据分区维护作业
         'job_future_ma_strategy',  # 期货均线策略计算作业
     ]
 
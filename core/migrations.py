@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import logging
+from constants import FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS
+from constants import K_LINE_PARTITION_DAYS_AHEAD
+from entries import BasisCalendar
+from entries import BasisTradingDateView
+from entries import FundScale
+from entries import FutureContractSymbol
+from entries import FutureMainContract
+from entries import FutureLatestMainContractView
+from entries import FutureKline1d
+from entries import FutureKline1m
+from entries import FutureKline3m
+from entries import FutureKline5m
+from entries import FutureKline15m
+from entries import FutureMaStrategy
+from entries import FutureMaStrategyHistory
+from entries import FutureKlinePartitionManager
+from entries import SchemaMigrationManager
+
+
+logger = logging.getLogger('jobs')
+
+_K_LINE_ENTITIES = [
+    FutureKline1d,
+    FutureKline1m,
+    FutureKline3m,
+    FutureKline5m,
+    FutureKline15m
+]
+
+# 需要记录执行计划的高频查询
+_HOT_QUERIES = [
+    (
+        '{} by contract and trading date'.format(entity.__tablename__),
+        'SELECT * FROM {} '
+        'WHERE contract_code = :contract_code '
+        'AND trading_date >= :start_date '
+        'AND trading_date <= :end_date '
+        'ORDER BY contract_code, trading_date, actual_time'.format(
+            entity.__tablename__
+        )
+    )
+    for entity in _K_LINE_ENTITIES
+] + [
+    (
+        't_future_ma_strategy_history by contract and update time',
+        'SELECT * FROM t_future_ma_strategy_history '
+        'WHERE contract_code = :contract_code '
+        'AND update_time >= :start_date '
+        'AND update_time <= :end_date '
+        'ORDER BY k_line_type, update_time'
+    ),
+]
+
+
+# 版本迁移
+
+def _create_tables():
+    # 以实体类注释中的建表语句为准，只创建不存在的表和视图
+    entities = [
+        BasisCalendar,
+        FundScale,
+        FutureContractSymbol,
+        FutureMainContract,
+        FutureKline1d,
+        FutureKline1m,
+        FutureKline3m,
+        FutureKline5m,
+        FutureKline15m,
+        FutureMaStrategy,
+        FutureMaStrategyHistory,
+        BasisTradingDateView,
+        FutureLatestMainContractView
+    ]
+    for entity in entities:
+        if not SchemaMigrationManager.table_exists(entity.__tablename__):
+            logger.info(
+                '[MigrationRunner] create {}.'.format(entity.__tablename__)
+            )
+            SchemaMigrationManager.execute(
+                entity.__doc__.strip().rstrip(';')
+            )
+
+
+def _reorder_k_line_primary_key():
+    # InnoDB 按主键聚簇存储，主键改为 (contract_code, trading_date, actual_time) 后，
+    # 按合约代码和交易日期区间读取所有字段时直接范围扫描主键，不需要额外的覆盖索引
+    for entity in _K_LINE_ENTITIES:
+        table_name = entity.__tablename__
+        primary_key = [
+            column.name for column in entity.__table__.primary_key.columns
+        ]
+        if SchemaMigrationManager.get_primary_key(table_name) != primary_key:
+            logger.info(
+                '[MigrationRunner] reorder primary key of {}.'.format(
+                    table_name
+                )
+            )
+            SchemaMigrationManager.execute(
+                'ALTER TABLE {} DROP PRIMARY KEY, '
+                'ADD CONSTRAINT pk_{} PRIMARY KEY ({})'.format(
+                    table_name, table_name[2:], ', '.join(primary_key)
+                )
+            )
+
+
+def _add_contract_symbol_trading_session():
+    # 交易时段类型用于按交易分钟数划分K线，按默认配置初始化
+    if not SchemaMigrationManager.column_exists(
+            't_future_contract_symbol', 'trading_session'):
+        logger.info(
+            '[MigrationRunner] add column trading_session to '
+            't_future_contract_symbol.'
+        )
+        SchemaMigrationManager.execute(
+            'ALTER TABLE t_future_contract_symbol '
+            'ADD COLUMN trading_session VARCHAR(20) AFTER trading_units'
+        )
+    for contract_symbol, trading_session in (
+            FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS.items()):
+        SchemaMigrationManager.execute(
+            'UPDATE t_future_contract_symbol '
+            'SET trading_session = :trading_session '
+            'WHERE contract_symbol = :contract_symbol '
+            'AND trading_session IS NULL',
+            {
+                'contract_symbol': contract_symbol,
+                'trading_session': trading_session
+            }
+        )
+
+
+def _partition_k_line_tables():
+    # 未分区的K线数据表需要重建，表较大时耗时较长并锁表，由运维人员在收盘后执行
+    # 按交易日期分区后，按交易日期的查询由分区裁剪完成，主键也已包含交易日期，
+    # 交易日期索引只增加写入开销，一并删除
+    end_date = datetime.date.today() + datetime.timedelta(
+        days=K_LINE_PARTITION_DAYS_AHEAD
+    )
+    for entity in _K_LINE_ENTITIES:
+        table_name = entity.__tablename__
+        if not FutureKlinePartitionManager.get_partitions(entity):
+            logger.info('[MigrationRunner] partition {}.'.format(table_name))
+            FutureKlinePartitionManager.partition_table(entity, end_date)
+        index_name = 'idx_{}'.format(table_name[2:])
+        if SchemaMigrationManager.index_exists(table_name, index_name):
+            logger.info(
+                '[MigrationRunner] drop index {} from {}.'.format(
+                    index_name, table_name
+                )
+            )
+            SchemaMigrationManager.execute(
+                'ALTER TABLE {} DROP INDEX {}'.format(table_name, index_name)
+            )
+
+
+MIGRATIONS = [
+    (1, 'create tables and views', _create_tables),
+    (
+        2,
+        'reorder k line primary key to (contract_code, trading_date, actual_time), '
+        'the clustered primary key covers reads by contract and trading date range',
+        _reorder_k_line_primary_key
+    ),
+    (
+        3,
+        'add trading_session to t_future_contract_symbol',
+        _add_contract_symbol_trading_session
+    ),
+    (
+        4,
+        'partition k line tables by trading_date, drop the trading_date index',
+        _partition_k_line_tables
+    ),
+]
+
+
+class MigrationRunner(object):
+
+    def __init__(self, contract_code, start_date, end_date):
+        # 记录执行计划时使用的查询参数
+        self.params = {
+            'contract_code': contract_code,
+            'start_date': start_date,
+            'end_date': end_date
+        }
+
+    def pending_migrations(self, target_version=None):
+        SchemaMigrationManager.create_table()
+        applied_versions = set(SchemaMigrationManager.get_applied_versions())
+
+        return [
+            migration for migration in MIGRATIONS
+            if migration[0] not in applied_versions
+            and (target_version is None or migration[0] <= target_version)
+        ]
+
+    def run(self, target_version=None):
+        applied = []
+
+        for version, description, upgrade in self.pending_migrations(
+                target_version):
+            logger.info(
+                '[MigrationRunner] migrate to version {}: {}.'.format(
+                    version, description
+                )
+            )
+            explain_before = self.explain()
+            upgrade()
+            explain_after = self.explain()
+            SchemaMigrationManager.store(
+                version,
+                description,
+                json.dumps(explain_before, default=str),
+                json.dumps(explain_after, default=str)
+            )
+            applied.append(version)
+
+        return applied
+
+    def explain(self):
+        plans = {}
+
+        for name, statement in _HOT_QUERIES:
+            try:
+                plans[name] = SchemaMigrationManager.explain(
+                    statement, self.params
+                )
+            except BaseException as e:
+                # 表尚未创建时无法获取执行计划
+                plans[name] = str(e)
+
+        return plans
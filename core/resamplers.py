@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+from sessions import get_bar_end_times
+from sessions import get_contract_symbol
+
+
+# 支持合成的K线频率：分钟数，'1d' 按交易日合成
+K_LINE_FREQUENCIES = {
+    '3m': 3,
+    '5m': 5,
+    '15m': 15,
+    '30m': 30,
+    '60m': 60,
+    '1d': None,
+}
+
+
+def resample_k_line_data(
+        dataframe, frequencies=('3m', '5m', '15m'), trading_sessions=None):
+    '''
+        由1分钟K线一次合成多个频率的K线，返回 {频率: 数据}，没有数据时为 None。
+        trading_sessions 为 {合约品种: 交易时段类型}，分钟频率按交易时段的交易分钟数划分K线，
+        K线时间为最后一分钟的结束时间；没有交易时段的合约按右边界标记、右边界闭合分组，
+        与 resample(label='right', closed='right') 相同。'1d' 按交易日分组，K线时间为交易日期。
+        排序和字段转换只做一次，各频率按分组编号对连续区间做 reduceat 聚合。
+    '''
+    if dataframe is None or len(dataframe) == 0:
+        return {frequency: None for frequency in frequencies}
+
+    contract_ids, contract_codes = pandas.factorize(dataframe['contract_code'])
+    actual_times = pandas.to_datetime(
+        dataframe['actual_time']
+    ).values.astype('datetime64[ns]').view('int64')
+    trading_dates = pandas.to_datetime(
+        dataframe['trading_date']
+    ).values.astype('datetime64[ns]').view('int64')
+
+    # 按合约、时间排序后，同一分组的1分钟K线是连续的
+    order = numpy.lexsort((actual_times, contract_ids))
+    contract_ids = contract_ids[order]
+    actual_times = actual_times[order]
+    trading_dates = trading_dates[order]
+    values = {
+        column: dataframe[column].to_numpy(dtype=numpy.float64)[order]
+        for column in ['open', 'close', 'high', 'low', 'volume',
+                       'open_interest']
+    }
+    contract_changes = contract_ids[1:] != contract_ids[:-1]
+    if trading_sessions is None:
+        trading_sessions = {}
+    sessions = numpy.array([
+        trading_sessions.get(get_contract_symbol(contract_code))
+        for contract_code in contract_codes
+    ], dtype=object)[contract_ids]
+
+    k_line_data_dict = {}
+    for frequency in frequencies:
+        minutes = K_LINE_FREQUENCIES[frequency]
+        if minutes is None:
+            buckets = trading_dates
+        else:
+            buckets = get_bar_end_times(actual_times, sessions, minutes)
+
+        starts = numpy.flatnonzero(
+            numpy.concatenate((
+                [True], contract_changes | (buckets[1:] != buckets[:-1])
+            ))
+        )
+        ends = numpy.append(starts[1:], len(buckets)) - 1
+
+        k_line_data_dict[frequency] = pandas.DataFrame({
+            'contract_code': contract_codes[contract_ids[starts]],
+            'actual_time': buckets[starts].view('datetime64[ns]'),
+            'trading_date': trading_dates[starts].view('datetime64[ns]'),
+            'open': values['open'][starts],
+            'close': values['close'][ends],
+            'high': numpy.maximum.reduceat(values['high'], starts),
+            'low': numpy.minimum.reduceat(values['low'], starts),
+            'volume': numpy.add.reduceat(values['volume'], starts),
+            'open_interest': values['open_interest'][ends],
+        })
+
+    return k_line_data_dict
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import re
+import numpy
+import pandas
+from constants import FUTURE_TRADING_SESSIONS
+
+
+_MINUTES_PER_DAY = 24 * 60
+_NANOSECONDS_PER_MINUTE = 60 * 1000000000
+# 交易日从前一自然日 18:00 开始计算分钟数，夜盘跨越零点后分钟数仍然递增
+_TRADING_DAY_START = 18 * 60
+# 不在任何交易单元内的分钟
+_OUTSIDE = numpy.iinfo(numpy.int64).min
+
+_session_maps = {}
+
+
+def get_contract_symbol(contract_code):
+    # 合约代码开头的字母为合约品种，例如 RB2105 -> RB
+    match = re.match('[A-Za-z]+', contract_code)
+    if match is None:
+        return None
+    return match.group(0).upper()
+
+
+def _trading_day_minute(value):
+    hour, minute = value.split(':')
+    return (int(hour) * 60 + int(minute) - _TRADING_DAY_START) % _MINUTES_PER_DAY
+
+
+def get_session_map(trading_session, minutes):
+    '''
+        返回长度为 1440 的数组：下标为1分钟K线结束时间在一天中的分钟数，
+        值为到所属 minutes 分钟K线结束时间的分钟数。
+        交易单元内休息时间的分钟归入休息前最后一根K线，交易单元外的分钟为 _OUTSIDE。
+    '''
+    key = (trading_session, minutes)
+    if key not in _session_maps:
+        session_map = numpy.full(_MINUTES_PER_DAY, _OUTSIDE, dtype=numpy.int64)
+        for unit in FUTURE_TRADING_SESSIONS[trading_session]:
+            # 交易单元内每根1分钟K线的结束时间
+            unit_minutes = []
+            for start, end in unit:
+                unit_minutes.extend(range(
+                    _trading_day_minute(start) + 1,
+                    _trading_day_minute(end) + 1
+                ))
+            end_minutes = [
+                unit_minutes[
+                    min((index // minutes + 1) * minutes, len(unit_minutes)) - 1
+                ]
+                for index in range(len(unit_minutes))
+            ]
+            index = 0
+            for minute in range(unit_minutes[0], unit_minutes[-1] + 1):
+                if unit_minutes[index + 1:index + 2] == [minute]:
+                    index += 1
+                session_map[
+                    (minute + _TRADING_DAY_START) % _MINUTES_PER_DAY
+                ] = end_minutes[index] - minute
+        _session_maps[key] = session_map
+
+    return _session_maps[key]
+
+
+def get_bar_end_time(actual_time, trading_session, minutes):
+    # 1分钟K线所属 minutes 分钟K线的结束时间，没有交易时段或不在交易时间内时按自然时间向上取整
+    if trading_session is not None:
+        offset = get_session_map(trading_session, minutes)[
+            actual_time.hour * 60 + actual_time.minute
+        ]
+        if offset != _OUTSIDE:
+            return actual_time.floor('1min') + pandas.Timedelta(minutes=offset)
+    return actual_time.ceil('{}min'.format(minutes))
+
+
+def get_bar_end_times(actual_times, trading_sessions, minutes):
+    '''
+        get_bar_end_time 的向量化版本。
+        actual_times 为 int64 纳秒数组，trading_sessions 为每根K线的交易时段类型（可以为 None），
+        返回 int64 纳秒数组。
+    '''
+    width = minutes * _NANOSECONDS_PER_MINUTE
+    end_times = -(-actual_times // width) * width
+
+    actual_minutes = actual_times // _NANOSECONDS_PER_MINUTE
+    minutes_of_day = actual_minutes % _MINUTES_PER_DAY
+    for trading_session in set(trading_sessions):
+        if trading_session is None:
+            continue
+        rows = numpy.flatnonzero(trading_sessions == trading_session)
+        offsets = get_session_map(trading_session, minutes)[
+            minutes_of_day[rows]
+        ]
+        inside = offsets != _OUTSIDE
+        rows = rows[inside]
+        end_times[rows] = (
+            actual_minutes[rows] + offsets[inside]
+        ) * _NANOSECONDS_PER_MINUTE
+
+    return end_times
@@ -1,20 +1,30 @@
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
 import datetime
 import time
 import logging
 import logging.config
 import yaml
 import os
+import numpy
+import pandas
 import rqdatac
 from enum import Enum
 from entries import BasisTradingDateViewManager
+from entries import DatabaseManager
 from entries import FutureKline1dManager
 from entries import FutureKline1mManager
 from entries import FutureKline3mManager
 from entries import FutureKline5mManager
 from entries import FutureKline15mManager
+from entries import FutureKlineCacheManager
+from entries import FutureContractSymbolManager
 from entries import FutureMaStrategyManager
+from aggregators import KLineAggregator
+from buffers import KLineBufferStore
+from indicators import MovingAverageEngine
+from indicators import get_latest_panel_moving_averages
 
 
 file_path = os.path.dirname(os.path.realpath(__file__))
@@ -32,26 +42,151 @@ class BaseStrategy(object):
     trading_date = None
     # 主力合约列表
     main_contracts = None
+    # 异步写入队列
+    writer = None
+    # 实时计算期间的K线缓冲区
+    buffers = None
+    # 实时计算期间由1分钟K线增量合成其他频率K线 {K线数据管理类: 合成器}
+    aggregators = None
+
+    # 当日1分钟K线缓冲区大小
+    K1M_BUFFER_SIZE = 24 * 60
+    # 批量计算的K线类型
+    K_LINE_TYPES = ['k1d', 'k15m', 'k5m', 'k3m', 'k1m']
 
     def __init__(self, trading_date, main_contracts):
         self.trading_date = trading_date
         self.main_contracts = main_contracts
 
-    def batch(self):
+    def batch(self, processes=1):
+        # processes 大于 1 时按合约分片，由进程池并行计算，结果合并后一次写入
         try:
             logger.info('[BaseStrategy] batch start.')
 
-            for main_contract in self.main_contracts:
-                self.strategy_for_k1d(main_contract)
-                self.strategy_for_k15m(main_contract)
-                self.strategy_for_k5m(main_contract)
-                self.strategy_for_k3m(main_contract)
-                self.strategy_for_k1m(main_contract)
+            if processes > 1 and len(self.main_contracts) > 1:
+                results = self.parallel_batch(processes)
+            else:
+                results = self.batch_for(self.main_contracts)
+            self.store_strategy_results(results)
 
             logger.info('[BaseStrategy] batch end.')
         except BaseException:
             logger.error('[BaseStrategy] batch failed.')
 
+    def batch_for(self, contract_codes):
+        results = []
+        for k_line_type in BaseStrategy.K_LINE_TYPES:
+            results.extend(self.strategy_for(k_line_type, contract_codes))
+        return results
+
+    def parallel_batch(self, processes):
+        shards = [
+            list(shard) for shard in numpy.array_split(
+                self.main_contracts, min(processes, len(self.main_contracts))
+            )
+        ]
+        start = time.perf_counter()
+        # 每个子进程建立自己的数据库连接池，不与父进程共用
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=len(shards),
+                initializer=DatabaseManager.reset_engine) as executor:
+            futures = [
+                executor.submit(_batch_shard, self, shard) for shard in shards
+            ]
+            results = []
+            for index, future in enumerate(futures):
+                shard_results, elapsed = future.result()
+                logger.info(
+                    '[BaseStrategy] batch shard {}/{}: {} contracts, {} signals, {:.3f}s.'.format(
+                        index + 1,
+                        len(shards),
+                        len(shards[index]),
+                        len(shard_results),
+                        elapsed
+                    )
+                )
+                results.extend(shard_results)
+        logger.info(
+            '[BaseStrategy] parallel batch: {} processes, {:.3f}s.'.format(
+                len(shards), time.perf_counter() - start
+            )
+        )
+        return results
+
+    def __getstate__(self):
+        # 并行批量计算时只把计算参数传给子进程，异步写入队列和实时缓冲区留在当前进程
+        state = self.__dict__.copy()
+        for name in ['writer', 'buffers', 'aggregators']:
+            state.pop(name, None)
+        return state
+
+    def store_k_line_data(self, manager, dataframe, incremental=False):
+        if self.writer is not None:
+            self.writer.put_k_line_data(manager, dataframe, incremental)
+        else:
+            manager.store(dataframe, incremental=incremental)
+
+    def wait_for_writes(self):
+        # 读取数据库前等待异步写入完成
+        if self.writer is not None:
+            self.writer.flush()
+
+    def warm_k_line_buffers(self):
+        # 从数据库预热当日1分钟K线，实时计算期间不再读取数据库
+        logger.info('[BaseStrategy] warm k line buffers.')
+
+        self.buffers = KLineBufferStore()
+        self.buffers.warm(
+            FutureKline1mManager,
+            self.main_contracts,
+            self.trading_date,
+            self.trading_date,
+            BaseStrategy.K1M_BUFFER_SIZE
+        )
+
+        # 当日已有的K线已经写入数据库和缓冲区，预热后丢弃
+        trading_sessions = FutureContractSymbolManager.get_trading_sessions()
+        self.aggregators = {
+            FutureKline3mManager: KLineAggregator(3, trading_sessions),
+            FutureKline5mManager: KLineAggregator(5, trading_sessions),
+            FutureKline15mManager: KLineAggregator(15, trading_sessions),
+        }
+        k1m_data = self.buffers.get_k_line_data(
+            FutureKline1mManager, self.main_contracts
+        )
+        for aggregator in self.aggregators.values():
+            for k1m in k1m_data.values():
+                aggregator.update(k1m)
+            aggregator.drain()
+
+    def generate_k_line_data(self, manager):
+        # 生成其他频率的K线，返回有当日1分钟K线的合约列表
+        if self.aggregators is not None:
+            aggregator = self.aggregators[manager]
+            k_line_data = aggregator.drain()
+            if k_line_data is not None:
+                self.buffers.append(manager, k_line_data)
+                self.store_k_line_data(
+                    manager, k_line_data, incremental=True
+                )
+            return [
+                contract_code for contract_code in self.main_contracts
+                if contract_code in aggregator
+            ]
+
+        self.wait_for_writes()
+        k1m_data = FutureKline1mManager.get_k_line_data_by_trading_date(
+            self.main_contracts, self.trading_date, self.trading_date,
+            as_dict=True)
+        trading_sessions = FutureContractSymbolManager.get_trading_sessions()
+        for k1m in k1m_data.values():
+            manager.store(
+                manager.generate_k_line_data_from_1m(k1m, trading_sessions),
+                incremental=True
+            )
+
+        return list(k1m_data.keys())
+
     def fix_k_line_data(self):
         try:
             logger.info('[BaseStrategy] fix k line data.')
@@ -61,19 +196,11 @@ class BaseStrategy(object):
             )
             if k_line_data is not None:
                 FutureKline1mManager.store(k_line_data)
-                for main_contract in self.main_contracts:
-                    k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                        main_contract, self.trading_date, self.trading_date)
-                    if k1m is not None:
-                        k3m = FutureKline3mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline3mManager.store(k3m)
-                        k5m = FutureKline5mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline5mManager.store(k5m)
-                        k15m = FutureKline15mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline15mManager.store(k15m)
+                # 由获取的1分钟K线一次合成所有合约的其他频率K线
+                FutureKline1mManager.generate_and_store_k_line_data(
+                    k_line_data,
+                    FutureContractSymbolManager.get_trading_sessions()
+                )
 
             logger.info('[BaseStrategy] fix k line data finish.')
         except BaseException:
@@ -97,7 +224,12 @@ class BaseStrategy(object):
                     ].index,
                     inplace=True
                 )
-                FutureKline1mManager.store(k_line_data)
+                self.store_k_line_data(FutureKline1mManager, k_line_data)
+                if self.buffers is not None:
+                    self.buffers.append(FutureKline1mManager, k_line_data)
+                if self.aggregators is not None:
+                    for aggregator in self.aggregators.values():
+                        aggregator.update(k_line_data)
 
             logger.info('[BaseStrategy] fetch current minute k line finish.')
         except BaseException:
@@ -109,15 +241,13 @@ class BaseStrategy(object):
             logger.info('[BaseStrategy] realtime for k15m start.')
 
             if minute_number % 15 == 0:
-                for main_contract in self.main_contracts:
-                    k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                        main_contract, self.trading_date, self.trading_date)
-                    if k1m is not None:
-                        k15m = FutureKline15mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline15mManager.store(k15m)
+                contract_codes = self.generate_k_line_data(
+                    FutureKline15mManager
+                )
 
-                        self.strategy_for_k15m(main_contract)
+                self.store_strategy_results(
+                    self.strategy_for('k15m', contract_codes)
+                )
 
             logger.info('[BaseStrategy] realtime for k15m end.')
         except BaseException:
@@ -129,15 +259,13 @@ class BaseStrategy(object):
             logger.info('[BaseStrategy] realtime for k5m start.')
 
             if minute_number % 5 == 0:
-                for main_contract in self.main_contracts:
-                    k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                        main_contract, self.trading_date, self.trading_date)
-                    if k1m is not None:
-                        k5m = FutureKline5mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline5mManager.store(k5m)
+                contract_codes = self.generate_k_line_data(
+                    FutureKline5mManager
+                )
 
-                        self.strategy_for_k5m(main_contract)
+                self.store_strategy_results(
+                    self.strategy_for('k5m', contract_codes)
+                )
 
             logger.info('[BaseStrategy] realtime for k5m end.')
         except BaseException:
@@ -149,15 +277,13 @@ class BaseStrategy(object):
             logger.info('[BaseStrategy] realtime for k3m start.')
 
             if minute_number % 3 == 0:
-                for main_contract in self.main_contracts:
-                    k1m = FutureKline1mManager.get_contract_k_line_data_by_trading_date(
-                        main_contract, self.trading_date, self.trading_date)
-                    if k1m is not None:
-                        k3m = FutureKline3mManager.generate_k_line_data_from_1m(
-                            k1m)
-                        FutureKline3mManager.store(k3m)
+                contract_codes = self.generate_k_line_data(
+                    FutureKline3mManager
+                )
 
-                        self.strategy_for_k3m(main_contract)
+                self.store_strategy_results(
+                    self.strategy_for('k3m', contract_codes)
+                )
 
             logger.info('[BaseStrategy] realtime for k3m end.')
         except BaseException:
@@ -167,28 +293,63 @@ class BaseStrategy(object):
         try:
             logger.info('[BaseStrategy] realtime for k1m start.')
 
-            for main_contract in self.main_contracts:
-                self.strategy_for_k1m(main_contract)
+            self.store_strategy_results(
+                self.strategy_for('k1m', self.main_contracts)
+            )
+
+            if self.writer is not None:
+                logger.info(
+                    '[BaseStrategy] write behind queue stats = {}.'.format(
+                        self.writer.stats()
+                    )
+                )
+            logger.info(
+                '[BaseStrategy] k line cache stats = {}.'.format(
+                    FutureKlineCacheManager.get_stats()
+                )
+            )
 
             logger.info('[BaseStrategy] realtime for k1m end.')
         except BaseException:
             logger.error('[BaseStrategy] realtime for k1m failed.')
 
-    def strategy_for_k1d(self, main_contract):
+    def strategy_for(self, k_line_type, contract_codes):
+        # 一次查询所有合约的K线数据，再逐个合约计算
+        k_line_data = self.load_k_line_data(k_line_type, contract_codes)
+        strategy = getattr(self, 'strategy_for_' + k_line_type)
+        return [
+            strategy(contract_code, k_line_data.get(contract_code))
+            for contract_code in contract_codes
+        ]
+
+    def load_k_line_data(self, k_line_type, contract_codes):
+        return {}
+
+    def store_strategy_results(self, results):
         pass
 
-    def strategy_for_k15m(self, main_contract):
+    def strategy_for_k1d(self, main_contract, k_line_data):
         pass
 
-    def strategy_for_k5m(self, main_contract):
+    def strategy_for_k15m(self, main_contract, k_line_data):
         pass
 
-    def strategy_for_k3m(self, main_contract):
+    def strategy_for_k5m(self, main_contract, k_line_data):
         pass
 
-    def strategy_for_k1m(self, main_contract):
+    def strategy_for_k3m(self, main_contract, k_line_data):
         pass
 
+    def strategy_for_k1m(self, main_contract, k_line_data):
+        pass
+
+
+def _batch_shard(strategy, contract_codes):
+    # 在子进程中计算一个分片的策略信号，返回 (信号列表, 耗时秒数)
+    start = time.perf_counter()
+    results = strategy.batch_for(contract_codes)
+    return results, time.perf_counter() - start
+
 
 class TransactionType(Enum):
 
@@ -220,669 +381,281 @@ class MaStrategy(BaseStrategy):
     SHORT_TERM_MA = MaType.MA5
     LONG_TERM_MA = MaType.MA20
 
+    # 各K线类型的数据来源：K线数据管理类，向前读取的交易日数
+    K_LINE_DATA_SOURCES = {
+        'k1d': (FutureKline1dManager, 61),
+        'k15m': (FutureKline15mManager, 20),
+        'k5m': (FutureKline5mManager, 7),
+        'k3m': (FutureKline5mManager, 5),
+        'k1m': (FutureKline5mManager, 2),
+    }
+
+    # 各K线类型默认计算的均线，策略规则使用这些均线
+    K_LINE_MA_TYPES = {
+        'k1d': [SHORT_TERM_MA, LONG_TERM_MA, MaType.MA60],
+        'k15m': [SHORT_TERM_MA, LONG_TERM_MA, MaType.MA60, MaType.MA120,
+                 MaType.MA250],
+        'k5m': [SHORT_TERM_MA, LONG_TERM_MA, MaType.MA60, MaType.MA120,
+                MaType.MA250],
+        'k3m': [SHORT_TERM_MA, LONG_TERM_MA, MaType.MA60, MaType.MA120,
+                MaType.MA250],
+        'k1m': [SHORT_TERM_MA, LONG_TERM_MA, MaType.MA60, MaType.MA120,
+                MaType.MA250],
+    }
+
+    # 策略信号中各均线方向字段对应的均线类型，K线类型默认不计算的均线为 'X'
+    SIGNAL_MA_TYPES = [
+        ('short_term_ma', SHORT_TERM_MA),
+        ('long_term_ma', LONG_TERM_MA),
+        ('ma60', MaType.MA60),
+        ('ma120', MaType.MA120),
+        ('ma250', MaType.MA250),
+    ]
+
+    # 实时计算期间的增量均线计算
+    ma_engine = None
+
     _realtime_status = True
+    # 各K线类型向前读取的开始日期，预热缓冲区时计算
+    _start_dates = None
 
-    def __init__(self, trading_date, main_contracts):
+    def __init__(self, trading_date, main_contracts, k_line_ma_types=None):
         super().__init__(trading_date, main_contracts)
+        # k_line_ma_types 为 {K线类型: 额外计算的均线类型列表}
+        self.k_line_ma_types = {}
+        for k_line_type, ma_types in MaStrategy.K_LINE_MA_TYPES.items():
+            extra_ma_types = (k_line_ma_types or {}).get(k_line_type, [])
+            self.k_line_ma_types[k_line_type] = list(
+                dict.fromkeys(ma_types + list(extra_ma_types))
+            )
+        self.windows = sorted(set(
+            ma_type.value
+            for ma_types in self.k_line_ma_types.values()
+            for ma_type in ma_types
+        ))
 
     def realtime_status(self):
         return self._realtime_status
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('ma_engine', None)
+        return state
+
     def realtime_stop(self):
+        # 停止前写入异步队列中的剩余数据
+        writer = self.writer
+        self.writer = None
+        if writer is not None:
+            writer.stop()
         self._realtime_status = False
 
-    def strategy_for_k1d(self, contract_code):
-        start_date = BasisTradingDateViewManager.get_previous_trading_date(
-            self.trading_date, 61
-        )
-        k1d = FutureKline1dManager.get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, self.trading_date
-        )
-        if k1d is not None:
-            # 计算短期均线
-            k1d[MaStrategy.SHORT_TERM_MA.name] = k1d['close'].rolling(
-                MaStrategy.SHORT_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算长期均线
-            k1d[MaStrategy.LONG_TERM_MA.name] = k1d['close'].rolling(
-                MaStrategy.LONG_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算MA60
-            k1d[MaType.MA60.name] = k1d['close'].rolling(
-                MaType.MA60.value
-            ).mean().round(decimals=5)
-
-            # 获取均线数据
-            index_latest = k1d.index[-1]
-            index_before_last = k1d.index[-2]
-            short_term_ma_latest = getattr(
-                k1d, MaStrategy.SHORT_TERM_MA.name
-            )[index_latest]
-            short_term_ma_before_last = getattr(
-                k1d, MaStrategy.SHORT_TERM_MA.name
-            )[index_before_last]
-            long_term_ma_latest = getattr(
-                k1d, MaStrategy.LONG_TERM_MA.name
-            )[index_latest]
-            long_term_ma_before_last = getattr(
-                k1d, MaStrategy.LONG_TERM_MA.name
-            )[index_before_last]
-            ma60_latest = k1d[MaType.MA60.name][index_latest]
-            ma60_before_last = k1d[MaType.MA60.name][index_before_last]
-
-            # 判断交易方向
-            transaction = TransactionType.UNKNOWN.value
-            # 短期均线上穿长期均线，MA60向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                    and (ma60_latest > ma60_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线上穿长期均线，短期均线向上，长期均线向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                and (short_term_ma_latest > short_term_ma_before_last)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线下穿长期均线，MA60向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                    and (ma60_latest < ma60_before_last)):
-                transaction = TransactionType.SELL.value
-            # 短期均线下穿长期均线，短期均线向下，长期均线向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                and (short_term_ma_latest < short_term_ma_before_last)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                transaction = TransactionType.SELL.value
-
-            # 判断短期均线方向
-            short_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且短期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (short_term_ma_latest > short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且短期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (short_term_ma_latest < short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-
-            # 判断长期均线方向
-            long_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且长期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且长期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-
-            # 判断MA60方向
-            ma60 = YesOrNo.NO.value
-            # 如果方向为多，且MA60向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma60_latest > ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-            # 如果方向为空，且MA60向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma60_latest < ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-
-            FutureMaStrategyManager.store(
-                contract_code,
-                'k1d',
-                transaction,
-                short_term_ma,
-                long_term_ma,
-                ma60,
-                'X',
-                'X'
+    def warm_k_line_buffers(self):
+        super().warm_k_line_buffers()
+
+        # 同一数据来源按最长的读取区间预热一次，读取时再按开始日期过滤
+        self._start_dates = {}
+        warm_start_dates = {}
+        for k_line_type, (manager, days) in (
+                MaStrategy.K_LINE_DATA_SOURCES.items()):
+            start_date = BasisTradingDateViewManager.get_previous_trading_date(
+                self.trading_date, days
+            )
+            self._start_dates[k_line_type] = start_date
+            if (manager not in warm_start_dates
+                    or start_date < warm_start_dates[manager]):
+                warm_start_dates[manager] = start_date
+        for manager, start_date in warm_start_dates.items():
+            self.buffers.warm(
+                manager,
+                self.main_contracts,
+                start_date,
+                self.trading_date,
+                # 保存最长均线最近两个值所需的K线
+                self.windows[-1] + 1
             )
 
-    def strategy_for_k15m(self, contract_code):
-        start_date = BasisTradingDateViewManager.get_previous_trading_date(
-            self.trading_date, 20
-        )
-        k15m = FutureKline15mManager.get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, self.trading_date
-        )
-        if k15m is not None:
-            # 计算短期均线
-            k15m[MaStrategy.SHORT_TERM_MA.name] = k15m['close'].rolling(
-                MaStrategy.SHORT_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算长期均线
-            k15m[MaStrategy.LONG_TERM_MA.name] = k15m['close'].rolling(
-                MaStrategy.LONG_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算MA60
-            k15m[MaType.MA60.name] = k15m['close'].rolling(
-                MaType.MA60.value
-            ).mean().round(decimals=5)
-            # 计算MA120
-            k15m[MaType.MA120.name] = k15m['close'].rolling(
-                MaType.MA120.value
-            ).mean().round(decimals=5)
-            # 计算MA250
-            k15m[MaType.MA250.name] = k15m['close'].rolling(
-                MaType.MA250.value
-            ).mean().round(decimals=5)
-
-            # 获取均线数据
-            index_latest = k15m.index[-1]
-            index_before_last = k15m.index[-2]
-            short_term_ma_latest = getattr(
-                k15m, MaStrategy.SHORT_TERM_MA.name
-            )[index_latest]
-            short_term_ma_before_last = getattr(
-                k15m, MaStrategy.SHORT_TERM_MA.name
-            )[index_before_last]
-            long_term_ma_latest = getattr(
-                k15m, MaStrategy.LONG_TERM_MA.name
-            )[index_latest]
-            long_term_ma_before_last = getattr(
-                k15m, MaStrategy.LONG_TERM_MA.name
-            )[index_before_last]
-            ma60_latest = k15m[MaType.MA60.name][index_latest]
-            ma60_before_last = k15m[MaType.MA60.name][index_before_last]
-            ma120_latest = k15m[MaType.MA120.name][index_latest]
-            ma120_before_last = k15m[MaType.MA120.name][index_before_last]
-            ma250_latest = k15m[MaType.MA250.name][index_latest]
-            ma250_before_last = k15m[MaType.MA250.name][index_before_last]
-
-            # 判断交易方向
-            transaction = TransactionType.UNKNOWN.value
-            # 短期均线上穿长期均线，MA60向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                    and (ma60_latest > ma60_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线上穿长期均线，短期均线向上，长期均线向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                and (short_term_ma_latest > short_term_ma_before_last)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线下穿长期均线，MA60向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                    and (ma60_latest < ma60_before_last)):
-                transaction = TransactionType.SELL.value
-            # 短期均线下穿长期均线，短期均线向下，长期均线向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                and (short_term_ma_latest < short_term_ma_before_last)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                transaction = TransactionType.SELL.value
-
-            # 判断短期均线方向
-            short_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且短期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (short_term_ma_latest > short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且短期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (short_term_ma_latest < short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-
-            # 判断长期均线方向
-            long_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且长期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且长期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-
-            # 判断MA60方向
-            ma60 = YesOrNo.NO.value
-            # 如果方向为多，且MA60向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma60_latest > ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-            # 如果方向为空，且MA60向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma60_latest < ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-
-            # 判断MA120方向
-            ma120 = YesOrNo.NO.value
-            # 如果方向为多，且MA120向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma120_latest > ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-            # 如果方向为空，且MA120向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma120_latest < ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-
-            # 判断MA250方向
-            ma250 = YesOrNo.NO.value
-            # 如果方向为多，且MA250向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma250_latest > ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-            # 如果方向为空，且MA250向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma250_latest < ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-
-            FutureMaStrategyManager.store(
-                contract_code,
-                'k15m',
-                transaction,
-                short_term_ma,
-                long_term_ma,
-                ma60,
-                ma120,
-                ma250
+        self.ma_engine = MovingAverageEngine(self.windows)
+
+    def load_k_line_data(self, k_line_type, contract_codes):
+        manager, days = MaStrategy.K_LINE_DATA_SOURCES[k_line_type]
+        if self.buffers is not None:
+            return self.buffers.get_k_line_data(
+                manager,
+                contract_codes,
+                self._start_dates[k_line_type],
+                columns=['actual_time', 'close']
             )
 
-    def strategy_for_k5m(self, contract_code):
         start_date = BasisTradingDateViewManager.get_previous_trading_date(
-            self.trading_date, 7
+            self.trading_date, days
         )
-        k5m = FutureKline5mManager.get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, self.trading_date
+        return manager.get_k_line_data_by_trading_date(
+            contract_codes,
+            start_date,
+            self.trading_date,
+            columns=['close'],
+            as_dict=True
         )
-        if k5m is not None:
-            # 计算短期均线
-            k5m[MaStrategy.SHORT_TERM_MA.name] = k5m['close'].rolling(
-                MaStrategy.SHORT_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算长期均线
-            k5m[MaStrategy.LONG_TERM_MA.name] = k5m['close'].rolling(
-                MaStrategy.LONG_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算MA60
-            k5m[MaType.MA60.name] = k5m['close'].rolling(
-                MaType.MA60.value
-            ).mean().round(decimals=5)
-            # 计算MA120
-            k5m[MaType.MA120.name] = k5m['close'].rolling(
-                MaType.MA120.value
-            ).mean().round(decimals=5)
-            # 计算MA250
-            k5m[MaType.MA250.name] = k5m['close'].rolling(
-                MaType.MA250.value
-            ).mean().round(decimals=5)
-
-            # 获取均线数据
-            index_latest = k5m.index[-1]
-            index_before_last = k5m.index[-2]
-            short_term_ma_latest = getattr(
-                k5m, MaStrategy.SHORT_TERM_MA.name
-            )[index_latest]
-            short_term_ma_before_last = getattr(
-                k5m, MaStrategy.SHORT_TERM_MA.name
-            )[index_before_last]
-            long_term_ma_latest = getattr(
-                k5m, MaStrategy.LONG_TERM_MA.name
-            )[index_latest]
-            long_term_ma_before_last = getattr(
-                k5m, MaStrategy.LONG_TERM_MA.name
-            )[index_before_last]
-            ma60_latest = k5m[MaType.MA60.name][index_latest]
-            ma60_before_last = k5m[MaType.MA60.name][index_before_last]
-            ma120_latest = k5m[MaType.MA120.name][index_latest]
-            ma120_before_last = k5m[MaType.MA120.name][index_before_last]
-            ma250_latest = k5m[MaType.MA250.name][index_latest]
-            ma250_before_last = k5m[MaType.MA250.name][index_before_last]
-
-            # 判断交易方向
-            transaction = TransactionType.UNKNOWN.value
-            # 短期均线上穿长期均线，MA60向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                    and (ma60_latest > ma60_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线上穿长期均线，短期均线向上，长期均线向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                and (short_term_ma_latest > short_term_ma_before_last)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线下穿长期均线，MA60向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                    and (ma60_latest < ma60_before_last)):
-                transaction = TransactionType.SELL.value
-            # 短期均线下穿长期均线，短期均线向下，长期均线向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                and (short_term_ma_latest < short_term_ma_before_last)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                transaction = TransactionType.SELL.value
-
-            # 判断短期均线方向
-            short_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且短期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (short_term_ma_latest > short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且短期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (short_term_ma_latest < short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-
-            # 判断长期均线方向
-            long_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且长期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且长期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-
-            # 判断MA60方向
-            ma60 = YesOrNo.NO.value
-            # 如果方向为多，且MA60向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma60_latest > ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-            # 如果方向为空，且MA60向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma60_latest < ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-
-            # 判断MA120方向
-            ma120 = YesOrNo.NO.value
-            # 如果方向为多，且MA120向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma120_latest > ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-            # 如果方向为空，且MA120向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma120_latest < ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-
-            # 判断MA250方向
-            ma250 = YesOrNo.NO.value
-            # 如果方向为多，且MA250向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma250_latest > ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-            # 如果方向为空，且MA250向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma250_latest < ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-
-            FutureMaStrategyManager.store(
-                contract_code,
-                'k5m',
-                transaction,
-                short_term_ma,
-                long_term_ma,
-                ma60,
-                ma120,
-                ma250
-            )
 
-    def strategy_for_k3m(self, contract_code):
-        start_date = BasisTradingDateViewManager.get_previous_trading_date(
-            self.trading_date, 5
+    def store_strategy_results(self, results):
+        # 一个计算周期的策略信号一次写入
+        ma_strategies = [result for result in results if result is not None]
+        for ma_strategy in ma_strategies:
+            ma_strategy['trading_date'] = self.trading_date
+        if ma_strategies:
+            if self.writer is not None:
+                self.writer.put_ma_strategies(ma_strategies)
+            else:
+                FutureMaStrategyManager.store_all(ma_strategies)
+
+    def strategy_for(self, k_line_type, contract_codes):
+        # 一次计算所有合约的策略信号，没有K线数据或K线不足两根的合约不返回
+        return self.signal_table(k_line_type, contract_codes).to_dict('records')
+
+    def signal_table(self, k_line_type, contract_codes):
+        '''
+            按 (时间 × 合约) 矩阵一次计算所有合约的均线和策略规则，返回一个计算周期的策略信号表。
+            规则与逐个合约判断相同：均线为 nan 时比较结果为假。
+        '''
+        k_line_data = self.load_k_line_data(k_line_type, contract_codes)
+        contract_codes = [
+            contract_code for contract_code in contract_codes
+            if k_line_data.get(contract_code) is not None
+        ]
+        # 新上市或不活跃的合约K线不足两根时无法判断均线方向，只跳过这些合约
+        short_contract_codes = [
+            contract_code for contract_code in contract_codes
+            if len(k_line_data[contract_code].index) < 2
+        ]
+        if short_contract_codes:
+            logger.info(
+                '[MaStrategy] {} k line data is not enough: {}.'.format(
+                    k_line_type, short_contract_codes
+                )
+            )
+            contract_codes = [
+                contract_code for contract_code in contract_codes
+                if contract_code not in short_contract_codes
+            ]
+        moving_averages = self.moving_averages(
+            k_line_type, contract_codes, k_line_data
         )
-        k3m = FutureKline5mManager.get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, self.trading_date
+        signals = {
+            'contract_code': contract_codes,
+            'k_line_type': k_line_type,
+        }
+        signals.update(
+            MaStrategy.evaluate_signals(k_line_type, moving_averages)
         )
-        if k3m is not None:
-            # 计算短期均线
-            k3m[MaStrategy.SHORT_TERM_MA.name] = k3m['close'].rolling(
-                MaStrategy.SHORT_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算长期均线
-            k3m[MaStrategy.LONG_TERM_MA.name] = k3m['close'].rolling(
-                MaStrategy.LONG_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算MA60
-            k3m[MaType.MA60.name] = k3m['close'].rolling(
-                MaType.MA60.value
-            ).mean().round(decimals=5)
-            # 计算MA120
-            k3m[MaType.MA120.name] = k3m['close'].rolling(
-                MaType.MA120.value
-            ).mean().round(decimals=5)
-            # 计算MA250
-            k3m[MaType.MA250.name] = k3m['close'].rolling(
-                MaType.MA250.value
-            ).mean().round(decimals=5)
-
-            # 获取均线数据
-            index_latest = k3m.index[-1]
-            index_before_last = k3m.index[-2]
-            short_term_ma_latest = getattr(
-                k3m, MaStrategy.SHORT_TERM_MA.name
-            )[index_latest]
-            short_term_ma_before_last = getattr(
-                k3m, MaStrategy.SHORT_TERM_MA.name
-            )[index_before_last]
-            long_term_ma_latest = getattr(
-                k3m, MaStrategy.LONG_TERM_MA.name
-            )[index_latest]
-            long_term_ma_before_last = getattr(
-                k3m, MaStrategy.LONG_TERM_MA.name
-            )[index_before_last]
-            ma60_latest = k3m[MaType.MA60.name][index_latest]
-            ma60_before_last = k3m[MaType.MA60.name][index_before_last]
-            ma120_latest = k3m[MaType.MA120.name][index_latest]
-            ma120_before_last = k3m[MaType.MA120.name][index_before_last]
-            ma250_latest = k3m[MaType.MA250.name][index_latest]
-            ma250_before_last = k3m[MaType.MA250.name][index_before_last]
-
-            # 判断交易方向
-            transaction = TransactionType.UNKNOWN.value
-            # 短期均线上穿长期均线，MA60向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                    and (ma60_latest > ma60_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线上穿长期均线，短期均线向上，长期均线向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                and (short_term_ma_latest > short_term_ma_before_last)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线下穿长期均线，MA60向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                    and (ma60_latest < ma60_before_last)):
-                transaction = TransactionType.SELL.value
-            # 短期均线下穿长期均线，短期均线向下，长期均线向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                and (short_term_ma_latest < short_term_ma_before_last)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                transaction = TransactionType.SELL.value
-
-            # 判断短期均线方向
-            short_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且短期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (short_term_ma_latest > short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且短期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (short_term_ma_latest < short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-
-            # 判断长期均线方向
-            long_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且长期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且长期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-
-            # 判断MA60方向
-            ma60 = YesOrNo.NO.value
-            # 如果方向为多，且MA60向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma60_latest > ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-            # 如果方向为空，且MA60向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma60_latest < ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-
-            # 判断MA120方向
-            ma120 = YesOrNo.NO.value
-            # 如果方向为多，且MA120向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma120_latest > ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-            # 如果方向为空，且MA120向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma120_latest < ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-
-            # 判断MA250方向
-            ma250 = YesOrNo.NO.value
-            # 如果方向为多，且MA250向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma250_latest > ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-            # 如果方向为空，且MA250向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma250_latest < ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-
-            FutureMaStrategyManager.store(
-                contract_code,
-                'k3m',
-                transaction,
-                short_term_ma,
-                long_term_ma,
-                ma60,
-                ma120,
-                ma250
+
+        return pandas.DataFrame(signals, columns=[
+            'contract_code', 'k_line_type', 'transaction'
+        ] + [column for column, ma_type in MaStrategy.SIGNAL_MA_TYPES])
+
+    @staticmethod
+    def evaluate_signals(k_line_type, moving_averages):
+        '''
+            按数组计算策略规则，moving_averages 为 {均线类型: (最新值数组, 前一值数组)}，
+            返回 {字段: 数组}，包括交易方向和各均线方向。均线为 nan 时比较结果为假，与逐个判断相同。
+        '''
+        buy, sell = MaStrategy.evaluate_transactions(
+            moving_averages[MaStrategy.SHORT_TERM_MA],
+            moving_averages[MaStrategy.LONG_TERM_MA],
+            moving_averages[MaType.MA60]
+        )
+        signals = {
+            'transaction': numpy.select(
+                [sell, buy],
+                [TransactionType.SELL.value, TransactionType.BUY.value],
+                TransactionType.UNKNOWN.value
+            ),
+        }
+
+        # 判断各均线方向：方向为多且均线向上，或方向为空且均线向下
+        for column, ma_type in MaStrategy.SIGNAL_MA_TYPES:
+            if ma_type not in MaStrategy.K_LINE_MA_TYPES[k_line_type]:
+                signals[column] = 'X'
+                continue
+            latest, before_last = moving_averages[ma_type]
+            signals[column] = numpy.where(
+                (buy & (latest > before_last))
+                | (sell & (latest < before_last)),
+                YesOrNo.YES.value,
+                YesOrNo.NO.value
             )
 
-    def strategy_for_k1m(self, contract_code):
-        start_date = BasisTradingDateViewManager.get_previous_trading_date(
-            self.trading_date, 2
+        return signals
+
+    @staticmethod
+    def evaluate_transactions(short_term_ma, long_term_ma, trend_ma):
+        '''
+            按数组判断交易方向，参数为短期均线、长期均线和趋势均线（默认为MA60）的 (最新值数组, 前一值数组)，
+            返回 (方向为多, 方向为空) 两个布尔数组。
+        '''
+        short_term_ma_latest, short_term_ma_before_last = short_term_ma
+        long_term_ma_latest, long_term_ma_before_last = long_term_ma
+        trend_ma_latest, trend_ma_before_last = trend_ma
+
+        # 短期均线上穿长期均线，趋势均线向上，或短期均线向上且长期均线向上，方向：多
+        buy = (short_term_ma_latest > long_term_ma_latest) & (
+            (trend_ma_latest > trend_ma_before_last)
+            | ((short_term_ma_latest > short_term_ma_before_last)
+               & (long_term_ma_latest > long_term_ma_before_last))
         )
-        k1m = FutureKline5mManager.get_contract_k_line_data_by_trading_date(
-            contract_code, start_date, self.trading_date
+        # 短期均线下穿长期均线，趋势均线向下，或短期均线向下且长期均线向下，方向：空
+        sell = (short_term_ma_latest < long_term_ma_latest) & (
+            (trend_ma_latest < trend_ma_before_last)
+            | ((short_term_ma_latest < short_term_ma_before_last)
+               & (long_term_ma_latest < long_term_ma_before_last))
         )
-        if k1m is not None:
-            # 计算短期均线
-            k1m[MaStrategy.SHORT_TERM_MA.name] = k1m['close'].rolling(
-                MaStrategy.SHORT_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算长期均线
-            k1m[MaStrategy.LONG_TERM_MA.name] = k1m['close'].rolling(
-                MaStrategy.LONG_TERM_MA.value
-            ).mean().round(decimals=5)
-            # 计算MA60
-            k1m[MaType.MA60.name] = k1m['close'].rolling(
-                MaType.MA60.value
-            ).mean().round(decimals=5)
-            # 计算MA120
-            k1m[MaType.MA120.name] = k1m['close'].rolling(
-                MaType.MA120.value
-            ).mean().round(decimals=5)
-            # 计算MA250
-            k1m[MaType.MA250.name] = k1m['close'].rolling(
-                MaType.MA250.value
-            ).mean().round(decimals=5)
-
-            # 获取均线数据
-            index_latest = k1m.index[-1]
-            index_before_last = k1m.index[-2]
-            short_term_ma_latest = getattr(
-                k1m, MaStrategy.SHORT_TERM_MA.name
-            )[index_latest]
-            short_term_ma_before_last = getattr(
-                k1m, MaStrategy.SHORT_TERM_MA.name
-            )[index_before_last]
-            long_term_ma_latest = getattr(
-                k1m, MaStrategy.LONG_TERM_MA.name
-            )[index_latest]
-            long_term_ma_before_last = getattr(
-                k1m, MaStrategy.LONG_TERM_MA.name
-            )[index_before_last]
-            ma60_latest = k1m[MaType.MA60.name][index_latest]
-            ma60_before_last = k1m[MaType.MA60.name][index_before_last]
-            ma120_latest = k1m[MaType.MA120.name][index_latest]
-            ma120_before_last = k1m[MaType.MA120.name][index_before_last]
-            ma250_latest = k1m[MaType.MA250.name][index_latest]
-            ma250_before_last = k1m[MaType.MA250.name][index_before_last]
-
-            # 判断交易方向
-            transaction = TransactionType.UNKNOWN.value
-            # 短期均线上穿长期均线，MA60向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                    and (ma60_latest > ma60_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线上穿长期均线，短期均线向上，长期均线向上，方向：多
-            if ((short_term_ma_latest > long_term_ma_latest)
-                and (short_term_ma_latest > short_term_ma_before_last)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                transaction = TransactionType.BUY.value
-            # 短期均线下穿长期均线，MA60向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                    and (ma60_latest < ma60_before_last)):
-                transaction = TransactionType.SELL.value
-            # 短期均线下穿长期均线，短期均线向下，长期均线向下，方向：空
-            if ((short_term_ma_latest < long_term_ma_latest)
-                and (short_term_ma_latest < short_term_ma_before_last)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                transaction = TransactionType.SELL.value
-
-            # 判断短期均线方向
-            short_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且短期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (short_term_ma_latest > short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且短期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (short_term_ma_latest < short_term_ma_before_last)):
-                short_term_ma = YesOrNo.YES.value
-
-            # 判断长期均线方向
-            long_term_ma = YesOrNo.NO.value
-            # 如果方向为多，且长期均线向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (long_term_ma_latest > long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-            # 如果方向为空，且长期均线向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (long_term_ma_latest < long_term_ma_before_last)):
-                long_term_ma = YesOrNo.YES.value
-
-            # 判断MA60方向
-            ma60 = YesOrNo.NO.value
-            # 如果方向为多，且MA60向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma60_latest > ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-            # 如果方向为空，且MA60向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma60_latest < ma60_before_last)):
-                ma60 = YesOrNo.YES.value
-
-            # 判断MA120方向
-            ma120 = YesOrNo.NO.value
-            # 如果方向为多，且MA120向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma120_latest > ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-            # 如果方向为空，且MA120向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma120_latest < ma120_before_last)):
-                ma120 = YesOrNo.YES.value
-
-            # 判断MA250方向
-            ma250 = YesOrNo.NO.value
-            # 如果方向为多，且MA250向上
-            if ((transaction == TransactionType.BUY.value)
-                    and (ma250_latest > ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-            # 如果方向为空，且MA250向下
-            if ((transaction == TransactionType.SELL.value)
-                    and (ma250_latest < ma250_before_last)):
-                ma250 = YesOrNo.YES.value
-
-            FutureMaStrategyManager.store(
-                contract_code,
-                'k1m',
-                transaction,
-                short_term_ma,
-                long_term_ma,
-                ma60,
-                ma120,
-                ma250
+
+        return buy, sell
+
+    def moving_averages(self, k_line_type, contract_codes, k_line_data):
+        # 返回 {均线类型: (最新值数组, 前一值数组)}，按 contract_codes 顺序排列，保留5位小数
+        # K线数量不足的合约对应的均线为 nan
+        ma_types = self.k_line_ma_types[k_line_type]
+        windows = [ma_type.value for ma_type in ma_types]
+
+        if not contract_codes:
+            values = {
+                window: numpy.zeros((2, 0), dtype=numpy.float64)
+                for window in windows
+            }
+        elif self.ma_engine is not None and all(
+                'actual_time' in k_line_data[contract_code]
+                for contract_code in contract_codes):
+            # 只把新增和修改的K线计入累计和
+            values = {
+                window: numpy.empty((2, len(contract_codes)))
+                for window in windows
+            }
+            for column, contract_code in enumerate(contract_codes):
+                key = (contract_code, k_line_type)
+                self.ma_engine.update(
+                    key,
+                    k_line_data[contract_code]['actual_time'].values,
+                    k_line_data[contract_code]['close'].values
+                )
+                for window, (latest, before_last) in self.ma_engine.get(
+                        key).items():
+                    if window in values:
+                        values[window][:, column] = (before_last, latest)
+        else:
+            # 一次累计和计算所有合约所有窗口
+            values = get_latest_panel_moving_averages(
+                [
+                    k_line_data[contract_code]['close'].values
+                    for contract_code in contract_codes
+                ],
+                windows
+            )
+
+        return {
+            ma_type: (
+                numpy.round(values[ma_type.value][1], 5),
+                numpy.round(values[ma_type.value][0], 5)
             )
+            for ma_type in ma_types
+        }
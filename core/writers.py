@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import queue
+import threading
+import time
+import logging
+import pandas
+from constants import WRITE_BEHIND_QUEUE_SIZE
+from constants import WRITE_BEHIND_FLUSH_SIZE
+from constants import WRITE_BEHIND_FLUSH_INTERVAL
+from constants import WRITE_BEHIND_RETRY_ROWS
+from entries import FutureMaStrategyManager
+
+
+logger = logging.getLogger('strategies')
+
+
+class WriteBehindQueue(object):
+
+    '''
+        异步写入队列：在后台线程中批量写入K线数据和均线策略信号。
+        队列满时 put 会阻塞调用方，阻塞时长计入统计数据。
+        写入失败的数据保留在下一批的最前面，在下个写入间隔重试，
+        保留的行数超过 retry_rows 时丢弃最早的数据，丢弃的行数计入统计数据。
+    '''
+
+    _K_LINE = 'k_line'
+    _MA_STRATEGY = 'ma_strategy'
+    _FLUSH = 'flush'
+    _STOP = 'stop'
+
+    def __init__(
+            self,
+            max_size=WRITE_BEHIND_QUEUE_SIZE,
+            flush_size=WRITE_BEHIND_FLUSH_SIZE,
+            flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+            retry_rows=WRITE_BEHIND_RETRY_ROWS):
+        self._queue = queue.Queue(maxsize=max_size)
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._retry_rows = retry_rows
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'max_depth': 0,
+            'put_count': 0,
+            'put_wait_seconds': 0.0,
+            'flush_count': 0,
+            'flush_error_count': 0,
+            'flush_rows': 0,
+            'retry_rows': 0,
+            'dropped_rows': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name='WriteBehindQueue',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put((WriteBehindQueue._STOP, None))
+            self._thread.join()
+            self._thread = None
+            stats = self.stats()
+            logger.info(
+                '[WriteBehindQueue] stopped. stats = {}.'.format(stats)
+            )
+            if stats['dropped_rows'] > 0:
+                logger.error(
+                    '[WriteBehindQueue] {} rows dropped after flush failures.'.format(
+                        stats['dropped_rows']
+                    )
+                )
+
+    def flush(self, timeout=None):
+        # 等待此前入队的数据全部写入
+        if self._thread is not None:
+            event = threading.Event()
+            self._queue.put((WriteBehindQueue._FLUSH, event))
+            event.wait(timeout)
+
+    def put_k_line_data(self, manager, dataframe, incremental=False):
+        self._put(
+            (WriteBehindQueue._K_LINE, (manager, dataframe, incremental))
+        )
+
+    def put_ma_strategies(self, ma_strategies):
+        # 入队时记录计算时间，同一批写入的多个计算周期在历史表中仍按计算时间区分
+        update_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._put((
+            WriteBehindQueue._MA_STRATEGY,
+            [dict(ma_strategy, update_time=update_time)
+             for ma_strategy in ma_strategies]
+        ))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        if stats['flush_count'] > 0:
+            stats['avg_flush_seconds'] = (
+                stats['total_flush_seconds'] / stats['flush_count']
+            )
+        else:
+            stats['avg_flush_seconds'] = 0.0
+        return stats
+
+    def _put(self, item):
+        start = time.time()
+        self._queue.put(item)
+        waited = time.time() - start
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['put_count'] += 1
+            self._stats['put_wait_seconds'] += waited
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+        if waited > self._flush_interval:
+            logger.warning(
+                '[WriteBehindQueue] queue is full, put blocked {:.3f}s.'.format(
+                    waited
+                )
+            )
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        running = True
+        while running:
+            events = []
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.time(), 0)
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+                if kind == WriteBehindQueue._FLUSH:
+                    events.append(payload)
+                elif kind == WriteBehindQueue._STOP:
+                    running = False
+                else:
+                    buffer.append((kind, payload))
+                    if deadline is None:
+                        deadline = time.time() + self._flush_interval
+            except queue.Empty:
+                pass
+
+            if buffer and (len(buffer) >= self._flush_size
+                           or time.time() >= deadline
+                           or events
+                           or not running):
+                buffer = self._flush(buffer)
+                deadline = None
+                if buffer:
+                    deadline = time.time() + self._flush_interval
+            for event in events:
+                event.set()
+
+        # 停止时仍未写入成功的数据不再重试
+        if buffer:
+            self._drop(buffer)
+
+    def _flush(self, buffer):
+        # 返回写入失败、需要重试的数据
+        start = time.time()
+
+        # 合并同一张表的K线数据；策略信号全部保留，由 store_all 追加到历史表后只更新最新状态
+        k_line_data = {}
+        ma_strategies = []
+        for kind, payload in buffer:
+            if kind == WriteBehindQueue._K_LINE:
+                manager, dataframe, incremental = payload
+                k_line_data.setdefault(
+                    (manager, incremental), []
+                ).append(dataframe)
+            if kind == WriteBehindQueue._MA_STRATEGY:
+                ma_strategies.extend(payload)
+
+        rows = 0
+        error = False
+        failed = []
+        for (manager, incremental), dataframes in k_line_data.items():
+            try:
+                dataframe = pandas.concat(dataframes, ignore_index=True)
+                # K线以 (contract_code, actual_time) 唯一标识，交易日期由K线时间决定
+                dataframe.drop_duplicates(
+                    ['contract_code', 'actual_time'],
+                    keep='last',
+                    inplace=True
+                )
+                rows += manager.store(dataframe, incremental=incremental)
+            except BaseException:
+                error = True
+                failed.extend(
+                    (WriteBehindQueue._K_LINE, (manager, dataframe, incremental))
+                    for dataframe in dataframes
+                )
+                logger.error(
+                    '[WriteBehindQueue] flush k line data failed: {}.'.format(
+                        manager.__name__
+                    )
+                )
+        if ma_strategies:
+            try:
+                rows += FutureMaStrategyManager.store_all(ma_strategies)
+            except BaseException:
+                error = True
+                failed.append((WriteBehindQueue._MA_STRATEGY, ma_strategies))
+                logger.error('[WriteBehindQueue] flush ma strategy failed.')
+
+        # 超过重试上限时丢弃最早的数据
+        retry_rows = sum(WriteBehindQueue._rows(item) for item in failed)
+        dropped = []
+        while failed and retry_rows > self._retry_rows:
+            item = failed.pop(0)
+            retry_rows -= WriteBehindQueue._rows(item)
+            dropped.append(item)
+        if dropped:
+            self._drop(dropped)
+
+        elapsed = time.time() - start
+        with self._stats_lock:
+            self._stats['flush_count'] += 1
+            self._stats['flush_rows'] += rows
+            self._stats['last_flush_seconds'] = elapsed
+            self._stats['total_flush_seconds'] += elapsed
+            if elapsed > self._stats['max_flush_seconds']:
+                self._stats['max_flush_seconds'] = elapsed
+            if error:
+                self._stats['flush_error_count'] += 1
+            self._stats['retry_rows'] = retry_rows
+
+        return failed
+
+    def _drop(self, buffer):
+        rows = sum(WriteBehindQueue._rows(item) for item in buffer)
+        with self._stats_lock:
+            self._stats['dropped_rows'] += rows
+            self._stats['retry_rows'] = 0
+        logger.error(
+            '[WriteBehindQueue] {} rows dropped after flush failures.'.format(
+                rows
+            )
+        )
+
+    @staticmethod
+    def _rows(item):
+        kind, payload = item
+        if kind == WriteBehindQueue._K_LINE:
+            return len(payload[1])
+        return len(payload)
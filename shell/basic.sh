@@ -10,5 +10,6 @@ source /root/.bash_profile
 source ${PYENV_HOME}/bin/activate
 
 python ${PYENV_HOME}/core/jobs.py --job job_calendar
+python ${PYENV_HOME}/core/jobs.py --job job_future_k_line_partition
 
 deactivate
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+
+# core 下的模块以脚本目录为路径互相导入
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core')
+)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+import pytest
+from aggregators import KLineAggregator
+from constants import FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS
+from resamplers import resample_k_line_data
+
+
+COLUMNS = ['contract_code', 'actual_time', 'trading_date', 'open', 'close',
+           'high', 'low', 'volume', 'open_interest']
+
+_DAY = [
+    ('2026-10-16 09:01', '2026-10-16 10:15'),
+    ('2026-10-16 10:31', '2026-10-16 11:30'),
+    ('2026-10-16 13:31', '2026-10-16 15:00'),
+]
+# 交易日 2026-10-16 一整个交易时段的1分钟K线时间，AU 夜盘到次日 02:30，JD 只有日盘
+_SESSION_TIMES = {
+    'AU2612': [('2026-10-15 21:01', '2026-10-16 02:30')] + _DAY,
+    'JD2611': _DAY,
+}
+
+
+def _k1m(contract_code, seed):
+    ranges = [
+        pandas.date_range(start, end, freq='min')
+        for start, end in _SESSION_TIMES[contract_code]
+    ]
+    actual_times = ranges[0].append(ranges[1:])
+    random = numpy.random.default_rng(seed)
+    size = len(actual_times)
+    closes = 3500.0 + numpy.cumsum(random.integers(-3, 4, size))
+    opens = numpy.concatenate(([closes[0]], closes[:-1]))
+    return pandas.DataFrame({
+        'contract_code': contract_code,
+        'actual_time': actual_times,
+        'trading_date': pandas.Timestamp('2026-10-16'),
+        'open': opens,
+        'close': closes,
+        'high': numpy.maximum(opens, closes) + random.integers(0, 3, size),
+        'low': numpy.minimum(opens, closes) - random.integers(0, 3, size),
+        'volume': random.integers(1, 500, size).astype(float),
+        'open_interest': 100000.0 + numpy.cumsum(random.integers(-20, 21, size)),
+    })
+
+
+def _session():
+    # 两个合约一个交易日的1分钟K线，按时间顺序逐分钟到达
+    return pandas.concat([
+        _k1m('AU2612', seed=0), _k1m('JD2611', seed=1)
+    ]).sort_values(['actual_time', 'contract_code']).reset_index(drop=True)
+
+
+def _sorted(dataframe):
+    return dataframe[COLUMNS].sort_values(
+        ['contract_code', 'actual_time']
+    ).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('frequency, minutes', [
+    ('3m', 3), ('5m', 5), ('15m', 15), ('30m', 30), ('60m', 60),
+])
+@pytest.mark.parametrize('with_sessions', [True, False])
+def test_drain_matches_resampler_over_a_session(
+        frequency, minutes, with_sessions):
+    k1m = _session()
+    trading_sessions = None
+    if with_sessions:
+        trading_sessions = {
+            symbol: FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS[symbol]
+            for symbol in ['AU', 'JD']
+        }
+    aggregator = KLineAggregator(minutes, trading_sessions)
+
+    completed = []
+    for i in range(len(k1m)):
+        bars = aggregator.update(k1m.iloc[i:i + 1])
+        if bars is not None:
+            completed.append(bars)
+
+    expected = _sorted(
+        resample_k_line_data(k1m, [frequency], trading_sessions)[frequency]
+    )
+    pandas.testing.assert_frame_equal(
+        _sorted(aggregator.drain()), expected, check_dtype=False
+    )
+    # 每根K线的最后一分钟到达时完成，全部完成的K线与合成结果相同
+    pandas.testing.assert_frame_equal(
+        _sorted(pandas.concat(completed)), expected, check_dtype=False
+    )
+    assert aggregator.drain() is None
+
+
+def test_drain_returns_updated_bars_only():
+    k1m = _k1m('JD2611', seed=2)
+    aggregator = KLineAggregator(15, {'JD': 'DAY'})
+    aggregator.update(k1m.iloc[:20])
+    aggregator.drain()
+
+    # 重复写入同一分钟时覆盖此前的值，drain 只返回更新过的未完成K线
+    revised = k1m.iloc[19:21].copy()
+    revised['close'] = 9999.0
+    aggregator.update(revised)
+    drained = aggregator.drain()
+    assert list(drained['actual_time']) == [pandas.Timestamp('2026-10-16 09:30')]
+    assert drained['close'].iloc[0] == 9999.0
+    assert drained['volume'].iloc[0] == k1m['volume'].iloc[15:21].sum()
+
+    # 已经完成的K线不再更新
+    assert aggregator.update(k1m.iloc[3:4]) is None
+    assert aggregator.drain() is None
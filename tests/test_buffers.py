@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+from buffers import KLineBufferStore
+from buffers import KLineRingBuffer
+
+
+def _k_line_data(size, start='2026-10-14 09:01', bars_per_day=5, seed=0):
+    # 每个交易日 bars_per_day 根K线，交易日期从 2026-10-14 开始
+    random = numpy.random.default_rng(seed)
+    actual_times = pandas.date_range(start, periods=size, freq='min')
+    trading_dates = pandas.Timestamp('2026-10-14') + pandas.to_timedelta(
+        numpy.arange(size) // bars_per_day, unit='D'
+    )
+    closes = 3500.0 + numpy.cumsum(random.integers(-3, 4, size))
+    return pandas.DataFrame({
+        'actual_time': actual_times,
+        'trading_date': trading_dates,
+        'open': closes - 1.0,
+        'close': closes,
+        'high': closes + 2.0,
+        'low': closes - 2.0,
+        'volume': random.integers(1, 500, size).astype(float),
+        'open_interest': 100000.0 + numpy.arange(size),
+    })
+
+
+def _assert_buffer_equal(buffer, expected, start_date=None, columns=None):
+    if columns is None:
+        columns = ['actual_time', 'trading_date'] + KLineRingBuffer.COLUMNS
+    pandas.testing.assert_frame_equal(
+        buffer.to_dataframe(start_date, columns),
+        expected[columns].reset_index(drop=True),
+        check_dtype=False
+    )
+
+
+def test_append_one_bar_at_a_time_wraps_around():
+    k_line_data = _k_line_data(25)
+    buffer = KLineRingBuffer(10)
+    for i in range(len(k_line_data)):
+        buffer.append(k_line_data.iloc[i:i + 1])
+        assert len(buffer) == min(i + 1, 10)
+        _assert_buffer_equal(buffer, k_line_data.iloc[max(i - 9, 0):i + 1])
+
+
+def test_append_more_than_capacity():
+    k_line_data = _k_line_data(37)
+    buffer = KLineRingBuffer(10)
+    # 空缓冲区一次写入超过容量的K线
+    buffer.append(k_line_data.iloc[:23])
+    _assert_buffer_equal(buffer, k_line_data.iloc[13:23])
+    # 非空缓冲区写入跨越多次回绕的K线
+    buffer.append(k_line_data.iloc[20:37])
+    _assert_buffer_equal(buffer, k_line_data.iloc[27:37])
+
+
+def test_append_overwrites_last_bar_and_ignores_older_bars():
+    k_line_data = _k_line_data(14)
+    buffer = KLineRingBuffer(10)
+    buffer.append(k_line_data.iloc[:13])
+
+    revised = k_line_data.iloc[12:13].copy()
+    revised['close'] = 9999.0
+    buffer.append(revised)
+    older = k_line_data.iloc[5:8].copy()
+    older['close'] = 0.0
+    buffer.append(older)
+
+    expected = k_line_data.iloc[3:13].copy()
+    expected.loc[12, 'close'] = 9999.0
+    _assert_buffer_equal(buffer, expected)
+
+    buffer.append(k_line_data.iloc[13:14])
+    _assert_buffer_equal(
+        buffer, pandas.concat([expected.iloc[1:], k_line_data.iloc[13:14]])
+    )
+
+
+def test_start_date_filter():
+    # 每个交易日5根K线，容量 12，回绕后最早的K线位于交易日中间
+    k_line_data = _k_line_data(23)
+    buffer = KLineRingBuffer(12)
+    buffer.append(k_line_data.iloc[:8])
+    buffer.append(k_line_data.iloc[8:23])
+    retained = k_line_data.iloc[11:23]
+    for start_date in ['2026-10-14', '2026-10-16', '2026-10-17', '2026-10-18']:
+        _assert_buffer_equal(
+            buffer,
+            retained[retained['trading_date'] >= pandas.Timestamp(start_date)],
+            start_date
+        )
+    assert buffer.to_dataframe('2026-10-19') is None
+    assert KLineRingBuffer(12).to_dataframe() is None
+
+
+def test_columns():
+    k_line_data = _k_line_data(15)
+    buffer = KLineRingBuffer(10)
+    buffer.append(k_line_data)
+    dataframe = buffer.to_dataframe('2026-10-15', ['close'])
+    assert list(dataframe.columns) == ['close']
+    numpy.testing.assert_array_equal(
+        dataframe['close'], k_line_data['close'].iloc[5:15]
+    )
+
+
+class _Manager(object):
+
+    def __init__(self, k_line_data):
+        self.k_line_data = k_line_data
+
+    def get_k_line_data_by_trading_date(
+            self, contract_codes, start_date, end_date, as_dict=False):
+        return {
+            contract_code: self.k_line_data[contract_code]
+            for contract_code in contract_codes
+            if contract_code in self.k_line_data
+        }
+
+
+def test_buffer_store():
+    k_line_data = {
+        'RB2601': _k_line_data(20, seed=1),
+        'HC2601': _k_line_data(20, seed=2),
+    }
+    manager = _Manager({
+        contract_code: dataframe.iloc[:15]
+        for contract_code, dataframe in k_line_data.items()
+    })
+    store = KLineBufferStore()
+    store.warm(
+        manager, ['RB2601', 'HC2601', 'I2601'], '2026-10-14', '2026-10-16', 12
+    )
+
+    # 实时K线按合约分组追加，未预热的合约忽略
+    realtime = pandas.concat([
+        dataframe.iloc[15:20].assign(contract_code=contract_code)
+        for contract_code, dataframe in k_line_data.items()
+    ] + [k_line_data['RB2601'].iloc[:1].assign(contract_code='AG2612')])
+    store.append(manager, realtime.sample(frac=1.0, random_state=0))
+
+    result = store.get_k_line_data(
+        manager, ['RB2601', 'HC2601', 'I2601', 'AG2612']
+    )
+    assert sorted(result) == ['HC2601', 'RB2601']
+    for contract_code, dataframe in k_line_data.items():
+        expected = dataframe.iloc[8:20].reset_index(drop=True)
+        expected.insert(0, 'contract_code', contract_code)
+        pandas.testing.assert_frame_equal(
+            result[contract_code], expected, check_dtype=False
+        )
+
+    closes = store.get_k_line_data(manager, ['RB2601'], '2026-10-17', ['close'])
+    numpy.testing.assert_array_equal(
+        closes['RB2601']['close'], k_line_data['RB2601']['close'].iloc[15:20]
+    )
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+import pytest
+
+# entries 导入时需要数据接口和数据库驱动
+entries = pytest.importorskip('entries')
+
+
+TABLE_NAME = 't_future_k_line_1m'
+COLUMNS = ('actual_time', 'close')
+
+
+def _key(contract_code, start_date, end_date):
+    return (TABLE_NAME, contract_code, start_date, end_date, COLUMNS, False)
+
+
+def _dataframe(size, close=3500.0):
+    return pandas.DataFrame({
+        'actual_time': pandas.date_range(
+            '2026-10-16 09:01', periods=size, freq='min'
+        ),
+        'close': numpy.full(size, close),
+    })
+
+
+def _size(dataframe):
+    return int(dataframe.memory_usage(deep=True).sum())
+
+
+def test_get_returns_copies():
+    cache = entries._KLineDataCache(1 << 20)
+    cache.put(_key('RB2601', '2026-10-01', '2026-10-15'), _dataframe(10), 0)
+
+    found, dataframe = cache.get(_key('RB2601', '2026-10-01', '2026-10-15'))
+    assert found
+    dataframe['close'] = 0.0
+    _, dataframe = cache.get(_key('RB2601', '2026-10-01', '2026-10-15'))
+    assert (dataframe['close'] == 3500.0).all()
+
+    # 没有数据的查询结果也缓存
+    cache.put(_key('RB2601', '2026-09-01', '2026-09-30'), None, 0)
+    assert cache.get(_key('RB2601', '2026-09-01', '2026-09-30')) == (True, None)
+    assert cache.get(_key('HC2601', '2026-10-01', '2026-10-15')) == (False, None)
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 1
+
+
+def test_put_rejected_after_concurrent_invalidation():
+    cache = entries._KLineDataCache(1 << 20)
+    key = _key('RB2601', '2026-10-16', '2026-10-19')
+
+    # 查询前取得版本号，查询期间写入了该合约的K线，查询结果已经过期
+    generation = cache.generation(TABLE_NAME, 'RB2601')
+    cache.invalidate(TABLE_NAME, 'RB2601', ['2026-10-16'])
+    cache.put(key, _dataframe(10, close=3400.0), generation)
+    assert cache.get(key) == (False, None)
+    assert cache.stats()['entries'] == 0
+
+    # 其他合约和其他表的版本号不受影响
+    assert cache.generation(TABLE_NAME, 'HC2601') == 0
+    assert cache.generation('t_future_k_line_5m', 'RB2601') == 0
+
+    # 使用新版本号查询的结果可以放入缓存
+    generation = cache.generation(TABLE_NAME, 'RB2601')
+    cache.put(key, _dataframe(10), generation)
+    found, dataframe = cache.get(key)
+    assert found
+    assert (dataframe['close'] == 3500.0).all()
+
+
+def test_invalidate_overlapping_ranges_by_bisect():
+    cache = entries._KLineDataCache(1 << 20)
+    ranges = [
+        ('2026-10-01', '2026-10-15'),
+        ('2026-10-16', '2026-10-19'),
+        ('2026-10-20', '2026-10-31'),
+    ]
+    for contract_code in ['RB2601', 'HC2601']:
+        for start_date, end_date in ranges:
+            cache.put(
+                _key(contract_code, start_date, end_date), _dataframe(5), 0
+            )
+
+    def cached(contract_code):
+        return [
+            cache.get(_key(contract_code, start_date, end_date))[0]
+            for start_date, end_date in ranges
+        ]
+
+    # 写入日期早于所有缓存区间，不失效
+    cache.invalidate(TABLE_NAME, 'RB2601', ['2026-09-30'])
+    assert cached('RB2601') == [True, True, True]
+
+    # 只有包含写入日期的当前交易日区间失效，区间边界的日期也算包含
+    cache.invalidate(TABLE_NAME, 'RB2601', ['2026-10-19'])
+    assert cached('RB2601') == [True, False, True]
+
+    # 多个写入日期分别落在不同区间
+    cache.invalidate(
+        TABLE_NAME, 'RB2601', ['2026-09-30', '2026-10-01', '2026-11-02']
+    )
+    assert cached('RB2601') == [False, False, True]
+    cache.invalidate(TABLE_NAME, 'RB2601', ['2026-10-16', '2026-10-31'])
+    assert cached('RB2601') == [False, False, False]
+
+    assert cached('HC2601') == [True, True, True]
+    assert cache.stats()['invalidations'] == 3
+    assert cache.stats()['bytes'] == 3 * _size(_dataframe(5))
+
+
+def test_evict_least_recently_used_over_byte_cap():
+    size = _size(_dataframe(100))
+    cache = entries._KLineDataCache(size * 2 + size // 2)
+    keys = [
+        _key('RB2601', trading_date, trading_date)
+        for trading_date in ['2026-10-12', '2026-10-13', '2026-10-14',
+                             '2026-10-15', '2026-10-16']
+    ]
+
+    cache.put(keys[0], _dataframe(100), 0)
+    cache.put(keys[1], _dataframe(100), 0)
+    cache.get(keys[0])
+    cache.put(keys[2], _dataframe(100), 0)
+    # keys[1] 最近最少使用，被淘汰
+    assert [cache.get(key)[0] for key in keys[0:3]] == [True, False, True]
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == size * 2
+
+    # 一次写入淘汰多条，超过上限的结果不缓存
+    cache.put(keys[3], _dataframe(200), 0)
+    assert [cache.get(key)[0] for key in keys[0:4]] == [False, False, False, True]
+    assert cache.stats()['evictions'] == 3
+    cache.put(keys[4], _dataframe(300), 0)
+    assert cache.get(keys[4]) == (False, None)
+    assert cache.stats()['bytes'] == _size(_dataframe(200))
+
+    # 相同的键再次写入时替换原数据
+    cache.put(keys[3], _dataframe(100), 0)
+    assert cache.stats()['bytes'] == size
+    assert cache.stats()['entries'] == 1
+
+
+def test_cached_k_line_data_split_at_current_trading_date(monkeypatch):
+    cache = entries._KLineDataCache(1 << 20)
+    loads = []
+
+    def load_k_line_data_by_contract(
+            entity, contract_codes, start_date, end_date, exact, columns):
+        loads.append((tuple(contract_codes), start_date, end_date))
+        return {
+            contract_code: _dataframe(3)
+            for contract_code in contract_codes
+            if contract_code != 'I2601'
+        }
+
+    monkeypatch.setattr(entries, '_k_line_data_cache', cache)
+    monkeypatch.setattr(
+        entries, '_load_k_line_data_by_contract', load_k_line_data_by_contract
+    )
+    monkeypatch.setattr(
+        entries, '_get_current_trading_date', lambda: '2026-10-16'
+    )
+
+    def get(contract_codes):
+        return entries._get_cached_k_line_data(
+            entries.FutureKline1m, contract_codes, '2026-10-01',
+            '2026-10-19', False, list(COLUMNS)
+        )
+
+    # 历史交易日和当前交易日分别查询和缓存，缓存未命中的合约合并为一次查询
+    k_line_data = get(['RB2601', 'HC2601', 'I2601'])
+    assert loads == [
+        (('RB2601', 'HC2601', 'I2601'), '2026-10-01', '2026-10-15'),
+        (('RB2601', 'HC2601', 'I2601'), '2026-10-16', '2026-10-19'),
+    ]
+    assert sorted(k_line_data) == ['HC2601', 'RB2601']
+    assert len(k_line_data['RB2601']) == 6
+
+    # 再次读取全部命中
+    del loads[:]
+    get(['RB2601', 'HC2601', 'I2601'])
+    assert loads == []
+
+    # 写入当前交易日的K线只使当前交易日的缓存失效
+    cache.invalidate(TABLE_NAME, 'RB2601', ['2026-10-16'])
+    get(['RB2601', 'HC2601'])
+    assert loads == [(('RB2601',), '2026-10-16', '2026-10-19')]
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+import pytest
+from indicators import MovingAverageEngine
+from indicators import get_latest_moving_averages
+from indicators import get_latest_panel_moving_averages
+from indicators import get_moving_average_series
+
+
+WINDOWS = [5, 20, 60, 120, 250]
+
+
+def _closes(size, seed=0, price=3500.0, tick=1.0):
+    # 按最小变动价位随机游走的收盘价，与期货K线的价格形态相同
+    random = numpy.random.default_rng(seed)
+    return price + tick * numpy.cumsum(random.integers(-5, 6, size))
+
+
+def _times(size, start='2026-01-05 09:01:00'):
+    return pandas.date_range(start, periods=size, freq='min').values
+
+
+def _rolling(closes, window):
+    # 当前实现：对全部已加载的K线 rolling(window).mean()，取最后两个值
+    moving_averages = pandas.Series(closes).rolling(window).mean()
+    latest = moving_averages.iloc[-1] if len(closes) >= 1 else numpy.nan
+    before_last = moving_averages.iloc[-2] if len(closes) >= 2 else numpy.nan
+    return latest, before_last
+
+
+def _assert_matches_rolling(moving_averages, closes, windows):
+    for window in windows:
+        numpy.testing.assert_allclose(
+            moving_averages[window], _rolling(closes, window), rtol=1e-12
+        )
+
+
+# MovingAverageEngine
+
+def test_engine_matches_rolling_when_appending():
+    closes = _closes(600)
+    times = _times(600)
+    engine = MovingAverageEngine(WINDOWS)
+    for i in range(len(closes)):
+        engine.update('RB2601', times[i:i + 1], closes[i:i + 1])
+        _assert_matches_rolling(engine.get('RB2601'), closes[:i + 1], WINDOWS)
+
+
+def test_engine_matches_rolling_when_reloading_whole_window():
+    # 每个周期重新传入全部K线时，只追加最后一根之后的K线
+    closes = _closes(400, seed=1)
+    times = _times(400)
+    engine = MovingAverageEngine(WINDOWS)
+    for end in [1, 4, 5, 6, 59, 250, 251, 252, 399, 400]:
+        engine.update('RB2601', times[:end], closes[:end])
+        _assert_matches_rolling(engine.get('RB2601'), closes[:end], WINDOWS)
+
+
+def test_engine_revises_open_bar():
+    closes = _closes(300, seed=2)
+    times = _times(300)
+    engine = MovingAverageEngine(WINDOWS)
+    engine.update('RB2601', times, closes)
+    for close in [3400.0, 3600.0, closes[-1] + 7.0]:
+        revised = closes.copy()
+        revised[-1] = close
+        engine.update('RB2601', times[-1:], revised[-1:])
+        _assert_matches_rolling(engine.get('RB2601'), revised, WINDOWS)
+
+
+def test_engine_ignores_older_bars():
+    closes = _closes(300, seed=3)
+    times = _times(300)
+    engine = MovingAverageEngine(WINDOWS)
+    engine.update('RB2601', times, closes)
+
+    # 早于最后一根的K线不改变结果
+    engine.update('RB2601', times[100:200], closes[100:200] + 50.0)
+    _assert_matches_rolling(engine.get('RB2601'), closes, WINDOWS)
+
+    # 与已有K线重叠的数据只修改最后一根并追加更晚的K线
+    more_closes = _closes(310, seed=4)
+    more_times = _times(310)
+    expected = numpy.concatenate((closes[:-1], more_closes[299:]))
+    engine.update('RB2601', more_times[290:], more_closes[290:])
+    _assert_matches_rolling(engine.get('RB2601'), expected, WINDOWS)
+
+
+def test_engine_resum_boundary():
+    # 容量为 max(windows) + 1，每追加容量根K线重新精确求和一次
+    windows = [5, 20]
+    capacity = max(windows) + 1
+    closes = _closes(capacity * 4 + 3, seed=5)
+    times = _times(len(closes))
+    engine = MovingAverageEngine(windows)
+    for i in range(len(closes)):
+        engine.update('RB2601', times[i:i + 1], closes[i:i + 1])
+        if (i + 1) % capacity in (capacity - 1, 0, 1):
+            _assert_matches_rolling(engine.get('RB2601'), closes[:i + 1], windows)
+            # 刚重新求和后修改最后一根K线
+            revised = closes[:i + 1].copy()
+            revised[-1] += 3.0
+            engine.update('RB2601', times[i:i + 1], revised[-1:])
+            _assert_matches_rolling(engine.get('RB2601'), revised, windows)
+            engine.update('RB2601', times[i:i + 1], closes[i:i + 1])
+
+
+def test_engine_keeps_precision_over_long_sessions():
+    # 价格较大、变动较小时，长时间追加后的误差仍然受重新求和限制
+    closes = _closes(20000, seed=6, price=80000.0, tick=0.2)
+    times = _times(len(closes))
+    engine = MovingAverageEngine(WINDOWS)
+    engine.update('AU2612', times, closes)
+    _assert_matches_rolling(engine.get('AU2612'), closes, WINDOWS)
+
+
+@pytest.mark.parametrize('size', [1, 4, 5, 6, 19, 20, 21, 249, 250, 251])
+def test_engine_too_few_bars(size):
+    closes = _closes(size, seed=7)
+    engine = MovingAverageEngine(WINDOWS)
+    engine.update('RB2601', _times(size), closes)
+    moving_averages = engine.get('RB2601')
+    _assert_matches_rolling(moving_averages, closes, WINDOWS)
+    for window in WINDOWS:
+        latest, before_last = moving_averages[window]
+        assert numpy.isnan(latest) == (size < window)
+        assert numpy.isnan(before_last) == (size < window + 1)
+
+
+def test_engine_keys_are_independent():
+    engine = MovingAverageEngine(WINDOWS)
+    closes = {
+        ('RB2601', '5m'): _closes(300, seed=8),
+        ('RB2601', '15m'): _closes(100, seed=9),
+        ('HC2601', '5m'): _closes(260, seed=10),
+    }
+    for key, values in closes.items():
+        engine.update(key, _times(len(values)), values)
+    for key, values in closes.items():
+        _assert_matches_rolling(engine.get(key), values, WINDOWS)
+
+
+# 均线计算函数
+
+@pytest.mark.parametrize('size', [0, 1, 5, 60, 250, 251, 252, 1000])
+def test_latest_moving_averages_match_rolling(size):
+    closes = _closes(size, seed=11)
+    moving_averages = get_latest_moving_averages(closes, WINDOWS)
+    for window in WINDOWS:
+        expected = pandas.Series(closes, dtype=numpy.float64).rolling(
+            window
+        ).mean().iloc[-2:].to_numpy()
+        expected = numpy.concatenate(
+            (numpy.full(2 - len(expected), numpy.nan), expected)
+        )
+        numpy.testing.assert_allclose(
+            moving_averages[window], expected, rtol=1e-12
+        )
+
+
+def test_panel_moving_averages_match_rolling():
+    # 各合约K线数量不同，包括不足最短窗口和只有一根K线的合约
+    sizes = [1000, 251, 250, 249, 120, 60, 20, 5, 4, 1]
+    closes_list = [
+        _closes(size, seed=12 + i) for i, size in enumerate(sizes)
+    ]
+    moving_averages = get_latest_panel_moving_averages(closes_list, WINDOWS)
+    for window in WINDOWS:
+        assert moving_averages[window].shape == (2, len(sizes))
+        for column, closes in enumerate(closes_list):
+            latest, before_last = _rolling(closes, window)
+            numpy.testing.assert_allclose(
+                moving_averages[window][:, column],
+                [before_last, latest],
+                rtol=1e-12
+            )
+
+
+def _series_by_contract(sizes, seed):
+    closes_list = [_closes(size, seed=seed + i) for i, size in enumerate(sizes)]
+    closes = numpy.concatenate(closes_list)
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    firsts = numpy.repeat(starts, sizes)
+    contract_ids = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    return closes, firsts, contract_ids
+
+
+@pytest.mark.parametrize('block_size', [64, 4096])
+def test_moving_average_series_match_rolling_by_contract(block_size):
+    closes, firsts, contract_ids = _series_by_contract(
+        [3000, 700, 250, 60, 1], seed=20
+    )
+    moving_averages = get_moving_average_series(
+        closes, firsts, WINDOWS, block_size
+    )
+    series = pandas.Series(closes)
+    for window in WINDOWS:
+        latest = series.groupby(contract_ids).rolling(window).mean().to_numpy()
+        before_last = pandas.Series(latest).groupby(contract_ids).shift(1).to_numpy()
+        numpy.testing.assert_allclose(
+            moving_averages[window][0], latest, rtol=1e-12
+        )
+        numpy.testing.assert_allclose(
+            moving_averages[window][1], before_last, rtol=1e-12
+        )
+
+
+def test_moving_average_series_match_rolling_per_bar():
+    # 每根K线的 firsts 不同时（例如只使用向前若干交易日的K线），与对该区间 rolling 的最后两个值相同
+    closes = _closes(1500, seed=30)
+    firsts = numpy.repeat(numpy.arange(0, 1500, 300), 300)
+    firsts[600:] = numpy.maximum(firsts[600:] - 600, 0)
+    moving_averages = get_moving_average_series(closes, firsts, WINDOWS, 128)
+    for position in range(0, 1500, 7):
+        window_closes = closes[firsts[position]:position + 1]
+        for window in WINDOWS:
+            numpy.testing.assert_allclose(
+                [moving_averages[window][0][position],
+                 moving_averages[window][1][position]],
+                _rolling(window_closes, window),
+                rtol=1e-12
+            )
+
+
+def test_moving_average_series_keeps_precision_over_a_year_of_minutes():
+    closes, firsts, contract_ids = _series_by_contract(
+        [90000, 90000], seed=40
+    )
+    closes = closes * 20.0
+    moving_averages = get_moving_average_series(closes, firsts, WINDOWS)
+    series = pandas.Series(closes)
+    for window in WINDOWS:
+        latest = series.groupby(contract_ids).rolling(window).mean().to_numpy()
+        numpy.testing.assert_allclose(
+            moving_averages[window][0], latest, rtol=1e-12
+        )
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+import pytest
+from constants import FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS
+from resamplers import K_LINE_FREQUENCIES
+from resamplers import resample_k_line_data
+from sessions import get_bar_end_time
+from sessions import get_contract_symbol
+
+
+COLUMNS = ['contract_code', 'actual_time', 'trading_date', 'open', 'close',
+           'high', 'low', 'volume', 'open_interest']
+
+# 交易日 2026-10-16 的交易时段，夜盘从前一自然日 21:00 开始
+_DAY = [
+    ('2026-10-16 09:01', '2026-10-16 10:15'),
+    ('2026-10-16 10:31', '2026-10-16 11:30'),
+    ('2026-10-16 13:31', '2026-10-16 15:00'),
+]
+_SESSION_TIMES = {
+    'DAY': _DAY,
+    'NIGHT_2300': [('2026-10-15 21:01', '2026-10-15 23:00')] + _DAY,
+    'NIGHT_0100': [('2026-10-15 21:01', '2026-10-16 01:00')] + _DAY,
+    'NIGHT_0230': [('2026-10-15 21:01', '2026-10-16 02:30')] + _DAY,
+}
+
+
+def _k1m(contract_code, seed=0, actual_times=None):
+    # 一个合约一个交易日的1分钟K线，价格按最小变动价位随机游走
+    if actual_times is None:
+        trading_session = FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS[
+            get_contract_symbol(contract_code)
+        ]
+        ranges = [
+            pandas.date_range(start, end, freq='min')
+            for start, end in _SESSION_TIMES[trading_session]
+        ]
+        actual_times = ranges[0].append(ranges[1:])
+    random = numpy.random.default_rng(seed)
+    size = len(actual_times)
+    closes = 3500.0 + numpy.cumsum(random.integers(-3, 4, size))
+    opens = numpy.concatenate(([closes[0]], closes[:-1]))
+    return pandas.DataFrame({
+        'contract_code': contract_code,
+        'actual_time': pandas.DatetimeIndex(actual_times),
+        'trading_date': pandas.Timestamp('2026-10-16'),
+        'open': opens,
+        'close': closes,
+        'high': numpy.maximum(opens, closes) + random.integers(0, 3, size),
+        'low': numpy.minimum(opens, closes) - random.integers(0, 3, size),
+        'volume': random.integers(1, 500, size).astype(float),
+        'open_interest': 100000.0 + numpy.cumsum(random.integers(-20, 21, size)),
+    })
+
+
+def _trading_sessions():
+    return {
+        symbol: FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS[symbol]
+        for symbol in ['AU', 'CU', 'RB', 'JD']
+    }
+
+
+def _expected(dataframe, frequency, trading_sessions):
+    # 逐根K线用 get_bar_end_time 分组后按 OHLCV 规则聚合
+    dataframe = dataframe.sort_values(['contract_code', 'actual_time'])
+    minutes = K_LINE_FREQUENCIES[frequency]
+    if minutes is None:
+        buckets = dataframe['trading_date']
+    else:
+        buckets = [
+            get_bar_end_time(
+                actual_time,
+                trading_sessions.get(get_contract_symbol(contract_code)),
+                minutes
+            )
+            for contract_code, actual_time in zip(
+                dataframe['contract_code'], dataframe['actual_time']
+            )
+        ]
+    dataframe = dataframe.assign(bucket=pandas.DatetimeIndex(buckets))
+    expected = dataframe.groupby(
+        ['contract_code', 'bucket'], sort=True
+    ).agg(
+        trading_date=('trading_date', 'first'),
+        open=('open', 'first'),
+        close=('close', 'last'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        volume=('volume', 'sum'),
+        open_interest=('open_interest', 'last'),
+    ).reset_index().rename(columns={'bucket': 'actual_time'})
+    return expected[COLUMNS]
+
+
+def _assert_frame_equal(actual, expected):
+    pandas.testing.assert_frame_equal(
+        actual[COLUMNS].sort_values(
+            ['contract_code', 'actual_time']
+        ).reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False
+    )
+
+
+@pytest.mark.parametrize('frequency', sorted(K_LINE_FREQUENCIES))
+def test_resample_matches_bar_end_time(frequency):
+    dataframe = pandas.concat([
+        _k1m(contract_code, seed=i)
+        for i, contract_code in enumerate(['AU2612', 'CU2611', 'RB2601', 'JD2611'])
+    ], ignore_index=True)
+    trading_sessions = _trading_sessions()
+    actual = resample_k_line_data(dataframe, [frequency], trading_sessions)
+    _assert_frame_equal(
+        actual[frequency], _expected(dataframe, frequency, trading_sessions)
+    )
+
+
+def test_night_session_crosses_midnight():
+    dataframe = _k1m('AU2612')
+    k_line_data = resample_k_line_data(
+        dataframe, ['15m', '60m', '1d'], _trading_sessions()
+    )
+
+    # 夜盘的60分钟K线跨越零点，交易日期都是下一交易日
+    k60m = k_line_data['60m']
+    assert list(k60m['actual_time'].dt.strftime('%m-%d %H:%M')) == [
+        '10-15 22:00', '10-15 23:00', '10-16 00:00', '10-16 01:00',
+        '10-16 02:00', '10-16 02:30',
+        '10-16 10:00', '10-16 11:15', '10-16 14:15', '10-16 15:00',
+    ]
+    assert (k60m['trading_date'] == pandas.Timestamp('2026-10-16')).all()
+
+    # 零点所在的15分钟K线包含 23:46 到 00:00 的1分钟K线
+    k15m = k_line_data['15m'].set_index('actual_time')
+    minutes = dataframe[
+        (dataframe['actual_time'] > pandas.Timestamp('2026-10-15 23:45'))
+        & (dataframe['actual_time'] <= pandas.Timestamp('2026-10-16 00:00'))
+    ]
+    bar = k15m.loc[pandas.Timestamp('2026-10-16 00:00')]
+    assert bar['open'] == minutes['open'].iloc[0]
+    assert bar['close'] == minutes['close'].iloc[-1]
+    assert bar['high'] == minutes['high'].max()
+    assert bar['low'] == minutes['low'].min()
+    assert bar['volume'] == minutes['volume'].sum()
+
+    # 日K线包含夜盘和日盘的全部1分钟K线
+    k1d = k_line_data['1d']
+    assert len(k1d) == 1
+    assert k1d['actual_time'].iloc[0] == pandas.Timestamp('2026-10-16')
+    assert k1d['open'].iloc[0] == dataframe['open'].iloc[0]
+    assert k1d['close'].iloc[0] == dataframe['close'].iloc[-1]
+    assert k1d['volume'].iloc[0] == dataframe['volume'].sum()
+
+
+@pytest.mark.parametrize('frequency', sorted(K_LINE_FREQUENCIES))
+def test_single_bar_group(frequency):
+    # 只有一根1分钟K线的分组，OHLCV 与该K线相同
+    dataframe = pandas.concat([
+        _k1m('RB2601', seed=1),
+        _k1m('HC2601', seed=2, actual_times=[pandas.Timestamp('2026-10-16 09:01')]),
+    ], ignore_index=True)
+    actual = resample_k_line_data(dataframe, [frequency], _trading_sessions())
+    k_line_data = actual[frequency]
+    bar = k_line_data[k_line_data['contract_code'] == 'HC2601']
+    assert len(bar) == 1
+    for column in ['open', 'close', 'high', 'low', 'volume', 'open_interest']:
+        assert bar[column].iloc[0] == dataframe[column].iloc[-1]
+    _assert_frame_equal(
+        k_line_data, _expected(dataframe, frequency, _trading_sessions())
+    )
+
+
+def test_unsorted_input():
+    dataframe = pandas.concat([
+        _k1m('AU2612', seed=3), _k1m('RB2601', seed=4)
+    ], ignore_index=True)
+    shuffled = dataframe.sample(frac=1.0, random_state=0)
+    frequencies = list(K_LINE_FREQUENCIES)
+    expected = resample_k_line_data(dataframe, frequencies, _trading_sessions())
+    actual = resample_k_line_data(shuffled, frequencies, _trading_sessions())
+    for frequency in frequencies:
+        _assert_frame_equal(
+            actual[frequency], expected[frequency][COLUMNS].sort_values(
+                ['contract_code', 'actual_time']
+            )
+        )
+
+
+@pytest.mark.parametrize('frequency, rule', [
+    ('3m', '3min'), ('5m', '5min'), ('15m', '15min'),
+    ('30m', '30min'), ('60m', '60min'),
+])
+def test_without_trading_sessions_matches_resample(frequency, rule):
+    # 没有交易时段时与 resample(label='right', closed='right') 相同
+    dataframe = _k1m('RB2601', seed=5)
+    expected = dataframe.set_index('actual_time').resample(
+        rule, label='right', closed='right'
+    ).agg({
+        'contract_code': 'first',
+        'trading_date': 'first',
+        'open': 'first',
+        'close': 'last',
+        'high': 'max',
+        'low': 'min',
+        'volume': 'sum',
+        'open_interest': 'last',
+    }).dropna().reset_index()
+    actual = resample_k_line_data(dataframe, [frequency])
+    _assert_frame_equal(actual[frequency], expected[COLUMNS])
+
+
+def test_empty_input():
+    assert resample_k_line_data(None, ['5m', '1d']) == {'5m': None, '1d': None}
+    assert resample_k_line_data(
+        pandas.DataFrame(columns=COLUMNS), ['60m']
+    ) == {'60m': None}
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pandas
+import pytest
+from constants import FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS
+from constants import FUTURE_TRADING_SESSIONS
+from sessions import get_bar_end_time
+from sessions import get_bar_end_times
+from sessions import get_contract_symbol
+from sessions import get_session_map
+
+
+# 日盘：09:00-10:15，10:30-11:30，13:30-15:00，共 225 分钟
+_DAY_CASES = [
+    (15, '2026-10-16 09:01', '2026-10-16 09:15'),
+    (15, '2026-10-16 10:15', '2026-10-16 10:15'),
+    (15, '2026-10-16 10:20', '2026-10-16 10:15'),
+    (15, '2026-10-16 10:31', '2026-10-16 10:45'),
+    (15, '2026-10-16 11:30', '2026-10-16 11:30'),
+    (15, '2026-10-16 13:31', '2026-10-16 13:45'),
+    (15, '2026-10-16 15:00', '2026-10-16 15:00'),
+    (60, '2026-10-16 09:01', '2026-10-16 10:00'),
+    (60, '2026-10-16 10:00', '2026-10-16 10:00'),
+    (60, '2026-10-16 10:01', '2026-10-16 11:15'),
+    (60, '2026-10-16 10:20', '2026-10-16 11:15'),
+    (60, '2026-10-16 10:31', '2026-10-16 11:15'),
+    (60, '2026-10-16 11:16', '2026-10-16 14:15'),
+    (60, '2026-10-16 13:31', '2026-10-16 14:15'),
+    (60, '2026-10-16 14:16', '2026-10-16 15:00'),
+    (60, '2026-10-16 15:00', '2026-10-16 15:00'),
+]
+
+_NIGHT_CASES = {
+    'NIGHT_2300': [
+        (15, '2026-10-15 21:01', '2026-10-15 21:15'),
+        (15, '2026-10-15 22:59', '2026-10-15 23:00'),
+        (60, '2026-10-15 21:01', '2026-10-15 22:00'),
+        (60, '2026-10-15 22:01', '2026-10-15 23:00'),
+        (60, '2026-10-15 23:00', '2026-10-15 23:00'),
+    ],
+    'NIGHT_0100': [
+        (15, '2026-10-15 23:59', '2026-10-16 00:00'),
+        (15, '2026-10-16 00:01', '2026-10-16 00:15'),
+        (15, '2026-10-16 00:46', '2026-10-16 01:00'),
+        (60, '2026-10-15 23:30', '2026-10-16 00:00'),
+        (60, '2026-10-16 00:00', '2026-10-16 00:00'),
+        (60, '2026-10-16 00:01', '2026-10-16 01:00'),
+        (60, '2026-10-16 01:00', '2026-10-16 01:00'),
+    ],
+    'NIGHT_0230': [
+        (15, '2026-10-16 00:00', '2026-10-16 00:00'),
+        (15, '2026-10-16 02:16', '2026-10-16 02:30'),
+        (15, '2026-10-16 02:30', '2026-10-16 02:30'),
+        (60, '2026-10-15 23:01', '2026-10-16 00:00'),
+        (60, '2026-10-16 00:01', '2026-10-16 01:00'),
+        (60, '2026-10-16 01:59', '2026-10-16 02:00'),
+        # 夜盘 330 分钟，最后一根60分钟K线只有30分钟
+        (60, '2026-10-16 02:01', '2026-10-16 02:30'),
+        (60, '2026-10-16 02:30', '2026-10-16 02:30'),
+    ],
+}
+
+
+def _cases():
+    # 按合约品种默认的交易时段类型：AU 02:30，CU 01:00，RB 23:00，JD 只有日盘
+    cases = []
+    for contract_code, trading_session in [
+            ('AU2612', 'NIGHT_0230'),
+            ('CU2611', 'NIGHT_0100'),
+            ('RB2601', 'NIGHT_2300'),
+            ('JD2611', 'DAY')]:
+        for minutes, actual_time, expected in (
+                _NIGHT_CASES.get(trading_session, []) + _DAY_CASES):
+            cases.append((contract_code, minutes, actual_time, expected))
+    return cases
+
+
+def test_contract_symbol():
+    assert get_contract_symbol('AU2612') == 'AU'
+    assert get_contract_symbol('rb2601') == 'RB'
+    assert get_contract_symbol('2601') is None
+
+
+@pytest.mark.parametrize('contract_code, minutes, actual_time, expected', _cases())
+def test_bar_end_time(contract_code, minutes, actual_time, expected):
+    trading_session = FUTURE_CONTRACT_SYMBOL_TRADING_SESSIONS[
+        get_contract_symbol(contract_code)
+    ]
+    assert get_bar_end_time(
+        pandas.Timestamp(actual_time), trading_session, minutes
+    ) == pandas.Timestamp(expected)
+
+
+def test_bar_end_time_outside_sessions():
+    # 不在交易时间内或没有交易时段时按自然时间向上取整
+    assert get_bar_end_time(
+        pandas.Timestamp('2026-10-15 21:01'), 'DAY', 15
+    ) == pandas.Timestamp('2026-10-15 21:15')
+    assert get_bar_end_time(
+        pandas.Timestamp('2026-10-16 03:01'), 'NIGHT_0230', 60
+    ) == pandas.Timestamp('2026-10-16 04:00')
+    assert get_bar_end_time(
+        pandas.Timestamp('2026-10-16 10:01'), None, 60
+    ) == pandas.Timestamp('2026-10-16 11:00')
+
+
+def _unit_times(unit, date='2026-10-15'):
+    # 交易单元内每根1分钟K线的时间，结束时间早于开始时间的时段跨越零点
+    actual_times = []
+    for start, end in unit:
+        start_time = pandas.Timestamp('{} {}'.format(date, start))
+        end_time = pandas.Timestamp('{} {}'.format(date, end))
+        if end_time <= start_time:
+            end_time += pandas.Timedelta(days=1)
+        actual_times.append(pandas.date_range(
+            start_time + pandas.Timedelta(minutes=1), end_time, freq='min'
+        ))
+    return actual_times[0].append(actual_times[1:])
+
+
+@pytest.mark.parametrize('trading_session', sorted(FUTURE_TRADING_SESSIONS))
+@pytest.mark.parametrize('minutes', [3, 5, 15, 30, 60])
+def test_session_map_bars(trading_session, minutes):
+    # 每个交易单元按交易分钟数划分，除最后一根外每根K线都有 minutes 根1分钟K线
+    assert len(get_session_map(trading_session, minutes)) == 24 * 60
+    for unit in FUTURE_TRADING_SESSIONS[trading_session]:
+        end_times = pandas.Series([
+            get_bar_end_time(actual_time, trading_session, minutes)
+            for actual_time in _unit_times(unit)
+        ])
+        assert end_times.is_monotonic_increasing
+        counts = end_times.groupby(end_times).size().to_numpy()
+        assert (counts[:-1] == minutes).all()
+        assert 0 < counts[-1] <= minutes
+
+
+@pytest.mark.parametrize('minutes', [3, 5, 15, 30, 60])
+def test_bar_end_times_match_bar_end_time(minutes):
+    actual_times = pandas.date_range(
+        '2026-10-15 18:01', '2026-10-16 18:00', freq='min'
+    )
+    trading_sessions = sorted(FUTURE_TRADING_SESSIONS) + [None]
+    sessions = numpy.array(
+        [trading_sessions[i % len(trading_sessions)]
+         for i in range(len(actual_times))],
+        dtype=object
+    )
+    end_times = get_bar_end_times(
+        actual_times.values.astype('datetime64[ns]').view('int64'),
+        sessions,
+        minutes
+    )
+    expected = [
+        get_bar_end_time(actual_time, trading_session, minutes).value
+        for actual_time, trading_session in zip(actual_times, sessions)
+    ]
+    numpy.testing.assert_array_equal(end_times, expected)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import pandas
+import pytest
+
+# writers 导入 entries，需要数据接口和数据库驱动
+writers = pytest.importorskip('writers')
+
+
+class _Manager(object):
+
+    # 前 failures 次写入失败，模拟短时间的数据库中断
+    failures = 0
+    stored = []
+
+    @classmethod
+    def store(cls, dataframe, incremental=False):
+        if cls.failures > 0:
+            cls.failures -= 1
+            raise RuntimeError('database is unavailable')
+        cls.stored.append(dataframe)
+        return len(dataframe)
+
+
+def _k_line_data(start, size, close=3500.0):
+    return pandas.DataFrame({
+        'contract_code': 'RB2601',
+        'actual_time': pandas.date_range(start, periods=size, freq='min'),
+        'close': close,
+    })
+
+
+@pytest.fixture
+def manager():
+    _Manager.failures = 0
+    _Manager.stored = []
+    return _Manager
+
+
+def test_failed_batch_is_retried(manager):
+    # 写入间隔较长，只由 flush 触发写入
+    manager.failures = 2
+    writer = writers.WriteBehindQueue(flush_interval=60.0)
+    writer.start()
+    writer.put_k_line_data(manager, _k_line_data('2026-10-16 09:01', 3))
+    writer.flush()
+    writer.put_k_line_data(manager, _k_line_data('2026-10-16 09:03', 2, 3600.0))
+    writer.flush()
+    writer.flush()
+    writer.stop()
+
+    # 失败的数据保留在下一批的最前面，与新数据合并后写入，同一分钟保留新数据
+    assert len(manager.stored) == 1
+    stored = manager.stored[0]
+    assert list(stored['actual_time'].dt.strftime('%H:%M')) == [
+        '09:01', '09:02', '09:03', '09:04'
+    ]
+    assert list(stored['close']) == [3500.0, 3500.0, 3600.0, 3600.0]
+    stats = writer.stats()
+    assert stats['flush_error_count'] == 2
+    assert stats['flush_rows'] == 4
+    assert stats['retry_rows'] == 0
+    assert stats['dropped_rows'] == 0
+
+
+def test_rows_over_retry_bound_are_dropped(manager):
+    manager.failures = 100
+    writer = writers.WriteBehindQueue(flush_interval=60.0, retry_rows=5)
+    writer.start()
+    writer.put_k_line_data(manager, _k_line_data('2026-10-16 09:01', 4))
+    writer.flush()
+    assert writer.stats()['retry_rows'] == 4
+
+    # 超过重试上限时丢弃最早的数据
+    writer.put_k_line_data(manager, _k_line_data('2026-10-16 09:05', 3))
+    writer.flush()
+    assert writer.stats()['retry_rows'] == 3
+    assert writer.stats()['dropped_rows'] == 4
+
+    # 停止时仍未写入成功的数据计入丢弃行数
+    writer.stop()
+    assert manager.stored == []
+    assert writer.stats()['dropped_rows'] == 7
+    assert writer.stats()['retry_rows'] == 0